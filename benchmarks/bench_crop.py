@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+"""
+
+Benchmark cropping the synthetic corpus of `make_corpus.py` with pdfCropMargins,
+and compare the results with a saved baseline.
+
+Each corpus file is cropped with the `crop` function of the package, in this
+process, once for each of the selected engines and resolutions:
+
+   pdftoppm      Render the pages with pdftoppm (the default).
+   gs-render     Render the pages with Ghostscript ('--gsRender').
+   gs-bbox       Use the Ghostscript bbox device ('--gsBbox').
+   mupdf         Render the pages in-process with PyMuPDF ('--bboxEngine mupdf').
+
+The best wall time of the repeated runs is reported for the whole crop and
+for the bounding-box calculation alone (taken from the '--profileReport'
+output of the fastest run).  The crop boxes of the output file are also
+hashed, so a change in the boxes found shows up along with any change in the
+times.  Note that the scanned pages are handled by the image fast path, so
+they are not rendered by any of the engines.
+
+The results are compared with the baseline file, if it exists, and the cases
+which are slower than the baseline by more than the tolerance, or which find
+different boxes, are listed; the exit code is then 1.  With '--update' the
+results are saved as the new baseline instead.  The baseline is written with
+sorted keys and rounded times, so changes in it show up clearly in a diff.
+Baselines are only comparable on the same machine with the same versions of
+the external programs.
+
+Run from the project root directory, for example:
+
+   python benchmarks/bench_crop.py --corpus quick --resolutions 72 150 --update
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import json
+import time
+import shutil
+import hashlib
+import platform
+import tempfile
+import argparse
+import warnings
+
+benchmarks_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchmarks_directory, "..", "src"))
+
+from PyPDF2 import PdfFileReader
+from pdfCropMargins import __version__, crop
+from make_corpus import CORPUS_SETS, make_corpus
+
+BASELINE_FORMAT_VERSION = 1
+DEFAULT_BASELINE_FILE = os.path.join(benchmarks_directory, "baseline.json")
+
+ENGINES = {"pdftoppm": [],
+           "gs-render": ["-gsr"],
+           "gs-bbox": ["-gs"],
+           "mupdf": ["-be", "mupdf"]}
+DEFAULT_ENGINES = ["pdftoppm", "gs-render", "gs-bbox"]
+DEFAULT_RESOLUTIONS = [72, 150, 300]
+MIN_TIME_DIFFERENCE = 0.05 # Smaller slowdowns, in seconds, are taken as noise.
+
+if hasattr(time, "perf_counter"): # Python 3.3 and later.
+    get_wall_time = time.perf_counter
+else:
+    get_wall_time = time.time
+
+def run_crop(pdf_file, output_file, report_file, extra_args):
+    """Crop `pdf_file` with the `crop` function and return the exit code and
+    the elapsed time."""
+    argv_list = [pdf_file, "-o", output_file, "-p", "0", "-prf", report_file] + extra_args
+    start_time = get_wall_time()
+    try:
+        crop(argv_list)
+        exit_code = 0
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else int(e.code is not None)
+    return exit_code, get_wall_time() - start_time
+
+def get_stage_time(report_file, stage_name):
+    """Return the wall time of the stage `stage_name` in the profile report
+    file, or zero if it did not run."""
+    with open(report_file) as f:
+        report = json.load(f)
+    return sum(stage["wall_time"] for stage in report["stages"]
+               if stage["name"] == stage_name)
+
+def get_boxes_digest(output_file):
+    """Return a hash of the crop boxes of the pages of the PDF file."""
+    digest = hashlib.sha1()
+    with open(output_file, "rb") as f:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            output_doc = PdfFileReader(f)
+            for page_num in range(output_doc.getNumPages()):
+                box = output_doc.getPage(page_num).cropBox
+                digest.update(" ".join("{:.2f}".format(float(value)) for value in
+                                       (box.getLowerLeft() + box.getUpperRight()))
+                              .encode("ascii") + b"\n")
+    return digest.hexdigest()[:16]
+
+def run_benchmarks(corpus, engines, resolutions, repeat, temp_dir):
+    """Run the benchmark cases and return a dict of the results, keyed by the
+    case name."""
+    output_file = os.path.join(temp_dir, "cropped.pdf")
+    report_file = os.path.join(temp_dir, "profile.json")
+    best_report_file = os.path.join(temp_dir, "best_profile.json")
+
+    print("{:<20} {:<10} {:>5} {:>9} {:>9} {:>9}  {}".format("file", "engine", "dpi",
+          "time (s)", "bbox (s)", "pages/s", "boxes"))
+    results = {}
+    for pdf_file, kind, num_pages in corpus:
+        file_name = os.path.splitext(os.path.basename(pdf_file))[0]
+        for engine in engines:
+            for resolution in resolutions:
+                extra_args = ENGINES[engine] + ["-x", str(resolution),
+                                                "-y", str(resolution)]
+                best_time = None
+                for repetition in range(repeat):
+                    exit_code, elapsed_time = run_crop(pdf_file, output_file,
+                                                       report_file, extra_args)
+                    if exit_code != 0:
+                        break
+                    if best_time is None or elapsed_time < best_time:
+                        best_time = elapsed_time
+                        shutil.copyfile(report_file, best_report_file)
+
+                case_name = "{}/{}/{}".format(file_name, engine, resolution)
+                result = {"file": file_name, "kind": kind, "pages": num_pages,
+                          "engine": engine, "resolution": resolution,
+                          "exit_code": exit_code}
+                if exit_code != 0:
+                    print("{:<20} {:<10} {:>5}  failed with exit code {}".format(
+                          file_name, engine, resolution, exit_code))
+                else:
+                    result["time"] = round(best_time, 3)
+                    result["bbox_time"] = round(get_stage_time(best_report_file,
+                                                               "bounding_boxes"), 3)
+                    result["pages_per_second"] = round(num_pages / best_time, 2)
+                    result["boxes_digest"] = get_boxes_digest(output_file)
+                    print("{:<20} {:<10} {:>5} {:>9.3f} {:>9.3f} {:>9.2f}  {}".format(
+                          file_name, engine, resolution, result["time"],
+                          result["bbox_time"], result["pages_per_second"],
+                          result["boxes_digest"]))
+                sys.stdout.flush()
+                results[case_name] = result
+    return results
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Print the cases which are slower than in the baseline by more than the
+    fraction `tolerance` (and by more than `MIN_TIME_DIFFERENCE`), or which
+    have different boxes or exit codes, and return the number of them.  Cases
+    not in the baseline are ignored."""
+    num_regressions = 0
+    baseline_results = baseline["results"]
+    for case_name in sorted(results):
+        if case_name not in baseline_results:
+            continue
+        result, baseline_result = results[case_name], baseline_results[case_name]
+        problems = []
+        if result["exit_code"] != baseline_result["exit_code"]:
+            problems.append("exit code {} instead of {}".format(
+                            result["exit_code"], baseline_result["exit_code"]))
+        elif result["exit_code"] == 0:
+            ratio = result["time"] / max(baseline_result["time"], 0.001)
+            if (ratio > 1 + tolerance and
+                    result["time"] - baseline_result["time"] > MIN_TIME_DIFFERENCE):
+                problems.append("{:.2f}x slower ({:.3f} s instead of {:.3f} s)".format(
+                                ratio, result["time"], baseline_result["time"]))
+            if result["boxes_digest"] != baseline_result["boxes_digest"]:
+                problems.append("different crop boxes")
+        if problems:
+            print("REGRESSION {}: {}".format(case_name, "; ".join(problems)))
+            num_regressions += 1
+    return num_regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cropping the synthetic"
+                                                 " corpus and compare with a baseline.")
+    parser.add_argument("--corpus", choices=sorted(CORPUS_SETS), default="quick",
+                        help="The set of corpus files to crop.")
+    parser.add_argument("--corpusDir", default="",
+                        help="Keep the generated corpus in this directory.")
+    parser.add_argument("--engines", nargs="+", choices=sorted(ENGINES),
+                        default=DEFAULT_ENGINES)
+    parser.add_argument("--resolutions", type=int, nargs="+",
+                        default=DEFAULT_RESOLUTIONS, help="Render dpi values.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_FILE,
+                        help="The baseline JSON file.")
+    parser.add_argument("--update", action="store_true",
+                        help="Save the results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="The fraction slower than the baseline allowed.")
+    bench_args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp(prefix="pdfCropMarginsBench_")
+    try:
+        corpus = make_corpus(bench_args.corpusDir or os.path.join(temp_dir, "corpus"),
+                             bench_args.corpus)
+        run_crop(corpus[0][0], os.path.join(temp_dir, "warm_up.pdf"), # Import modules
+                 os.path.join(temp_dir, "warm_up.json"), []) # and find programs.
+        results = run_benchmarks(corpus, bench_args.engines, bench_args.resolutions,
+                                 bench_args.repeat, temp_dir)
+    finally:
+        shutil.rmtree(temp_dir)
+
+    if bench_args.update:
+        baseline = {"format_version": BASELINE_FORMAT_VERSION,
+                    "program_version": __version__,
+                    "python_version": platform.python_version(),
+                    "platform": platform.platform(),
+                    "corpus": bench_args.corpus,
+                    "repeat": bench_args.repeat,
+                    "results": results}
+        with open(bench_args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("\nSaved the results as the baseline in", bench_args.baseline)
+        sys.exit(0)
+
+    if not os.path.exists(bench_args.baseline):
+        print("\nNo baseline file to compare with; use '--update' to save one.")
+        sys.exit(0)
+    with open(bench_args.baseline) as f:
+        baseline = json.load(f)
+    num_regressions = compare_with_baseline(results, baseline, bench_args.tolerance)
+    print("\n{} regression{} compared with the baseline in {}".format(num_regressions,
+          "" if num_regressions == 1 else "s", bench_args.baseline))
+    sys.exit(1 if num_regressions else 0)
+
+if __name__ == "__main__":
+    main()
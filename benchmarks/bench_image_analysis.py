@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+
+Micro-benchmark of the page-image analysis in pdfCropMargins, comparing the
+PIL thresholding and bounding-box code with the vectorized NumPy code.
+
+Synthetic letter-size page images are generated at 150, 300, and 600 dpi, in
+both RGB (like pdftoppm PPM output) and grayscale.  Each image has some dark
+text-like blocks and a few colored and light-gray marks near the margins, so
+that both the thresholding and the bounding boxes are exercised.  The script
+checks that the two code paths find identical bounding boxes and prints the
+best time for each.  The program only uses the NumPy code for single-band
+(grayscale) images, since for RGB images the lookup table used by the PIL
+`point` method is faster than reducing the bands first.
+
+Run from the project root directory:
+
+   python benchmarks/bench_image_analysis.py [--repeat N] [--dpi 150 300 600]
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from PIL import Image, ImageDraw
+from pdfCropMargins import calculate_bounding_boxes as cbb
+
+if not cbb.hasNumpy:
+    print("NumPy is not installed, so there is nothing to compare.", file=sys.stderr)
+    sys.exit(1)
+
+def make_page_image(dpi, mode):
+    """Return a synthetic letter-size page image at resolution `dpi`."""
+    width, height = int(8.5 * dpi), int(11 * dpi)
+    im = Image.new("RGB", (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(im)
+    scale = dpi / 72
+    for line in range(40): # Lines of "text".
+        top = int((100 + 15 * line) * scale)
+        draw.rectangle([int(90 * scale), top, int(520 * scale), top + int(8 * scale)],
+                       fill=(20, 20, 20))
+    draw.rectangle([int(60 * scale), int(80 * scale), int(70 * scale), int(90 * scale)],
+                   fill=(255, 255, 0)) # Yellow mark, foreground only in the blue band.
+    draw.rectangle([int(540 * scale), int(700 * scale), int(560 * scale), int(720 * scale)],
+                   fill=(200, 200, 200)) # Light gray, background at the default threshold.
+    if mode != "RGB":
+        im = im.convert(mode)
+    return im
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the image analysis code.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing repetitions.")
+    parser.add_argument("--dpi", type=int, nargs="+", default=[150, 300, 600])
+    parser.add_argument("--threshold", type=int, default=191)
+    bench_args = parser.parse_args()
+
+    print("{:>5} {:>5} {:>12} {:>12} {:>8}  {}".format("dpi", "mode", "PIL (ms)",
+                                                     "NumPy (ms)", "speedup", "bbox"))
+    exit_code = 0
+    for dpi in bench_args.dpi:
+        for mode in ("RGB", "L"):
+            im = make_page_image(dpi, mode)
+            im.load()
+            for dark in (True, False):
+                bbox_args = (im, bench_args.threshold, dark)
+                pil_bbox = cbb.get_pixel_bounding_box_pil(*bbox_args)
+                numpy_bbox = cbb.get_pixel_bounding_box_numpy(*bbox_args)
+                if pil_bbox != numpy_bbox:
+                    print("MISMATCH at {} dpi, mode {}, dark={}: PIL {} NumPy {}"
+                          .format(dpi, mode, dark, pil_bbox, numpy_bbox))
+                    exit_code = 1
+            pil_time = min(timeit.repeat(
+                lambda: cbb.get_pixel_bounding_box_pil(im, bench_args.threshold, False),
+                number=1, repeat=bench_args.repeat))
+            numpy_time = min(timeit.repeat(
+                lambda: cbb.get_pixel_bounding_box_numpy(im, bench_args.threshold, False),
+                number=1, repeat=bench_args.repeat))
+            print("{:>5} {:>5} {:>12.2f} {:>12.2f} {:>7.1f}x  {}".format(
+                  dpi, mode, pil_time*1000, numpy_time*1000, pil_time/numpy_time,
+                  numpy_bbox))
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
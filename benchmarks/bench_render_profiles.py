@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+
+Benchmark the render profiles of pdfCropMargins (the '--renderProfile' option).
+
+For each PDF file given on the command line, and for each of the external
+renderers (pdftoppm and Ghostscript), the program is run once with each
+render profile.  The margins are retained at zero percent and the crop data is
+written to a file with '--writeCropDataToFile', so the boxes found are exactly
+the bounding boxes.  The throughput in pages per second is printed, along with
+the largest difference (in bp) of any bounding-box edge from the boxes found
+with the "default" profile, and the number of pages with any difference.
+
+Run from the project root directory, for example:
+
+   python benchmarks/bench_render_profiles.py --resolution 300 doc1.pdf doc2.pdf
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import re
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+
+src_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+PROFILES = ["default", "gray", "fast", "mono"]
+
+def run_crop_data(pdf_file, crop_data_file, extra_args):
+    """Run pdfCropMargins to write the crop data for `pdf_file` and return the
+    elapsed time and the list of boxes."""
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.pathsep.join([src_directory, env.get("PYTHONPATH", "")])
+    command = ([sys.executable, "-m", "pdfCropMargins", pdf_file, "-p", "0",
+                "-wcdf", crop_data_file] + extra_args)
+    start_time = time.time()
+    with open(os.devnull, "w") as devnull:
+        subprocess.check_call(command, env=env, stdout=devnull)
+    elapsed_time = time.time() - start_time
+
+    boxes = []
+    with open(crop_data_file) as f:
+        for line in f:
+            values = re.findall(r"[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?", line.split("\t", 2)[2])
+            boxes.append([float(v) for v in values])
+    return elapsed_time, boxes
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the render profiles.")
+    parser.add_argument("pdf_files", nargs="+", metavar="PDF_FILE")
+    parser.add_argument("--resolution", type=int, default=150, help="Render dpi.")
+    parser.add_argument("--jobs", type=int, default=1, help="Renderer processes.")
+    bench_args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp(prefix="pdfCropMarginsBench_")
+    crop_data_file = os.path.join(temp_dir, "crop_data.txt")
+    try:
+        print("{:<24} {:<12} {:<8} {:>9} {:>10} {:>12}".format("file", "renderer",
+              "profile", "pages/s", "max diff", "pages diff"))
+        for pdf_file in bench_args.pdf_files:
+            for renderer, renderer_args in (("pdftoppm", []), ("Ghostscript", ["-gsr"])):
+                default_boxes = None
+                for profile in PROFILES:
+                    extra_args = renderer_args + ["-rp", profile,
+                                   "-x", str(bench_args.resolution),
+                                   "-y", str(bench_args.resolution),
+                                   "-j", str(bench_args.jobs)]
+                    elapsed_time, boxes = run_crop_data(pdf_file, crop_data_file,
+                                                        extra_args)
+                    if default_boxes is None:
+                        default_boxes = boxes
+                    diffs = [max(abs(a - b) for a, b in zip(box, default_box))
+                             for box, default_box in zip(boxes, default_boxes)]
+                    print("{:<24} {:<12} {:<8} {:>9.2f} {:>10.2f} {:>12}".format(
+                          os.path.basename(pdf_file)[:24], renderer, profile,
+                          len(boxes) / elapsed_time, max(diffs),
+                          sum(1 for d in diffs if d > 0)))
+    finally:
+        shutil.rmtree(temp_dir)
+
+if __name__ == "__main__":
+    main()
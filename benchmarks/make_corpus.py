@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+"""
+
+Generate the synthetic PDF corpus used by the pdfCropMargins benchmarks.
+
+The files are written directly, without any PDF library, and are
+deterministic: the contents of each page come from a random number generator
+seeded with the file name and page number, and no dates or document IDs are
+written.  So the same corpus is generated on every machine, and a file is
+byte-for-byte the same each time it is generated.  Each page has different
+margins, so the page fingerprints of the program do not find duplicate pages.
+
+The kinds of documents are:
+
+   text          Letter-size pages with lines of Helvetica text.
+   scan          Letter-size scanned pages, each a single grayscale image
+                 (the image fast path of the program handles these).
+   mixed_sizes   Text pages of letter, A4, legal, and landscape A5 sizes.
+   rotated       Text pages rotated by 0, 90, 180, and 270 degrees.
+   poster        A0 and A1 pages with large text and drawings.
+
+The corpus files are named for the kind and the number of pages, like
+"text_1000.pdf".  Run from the project root directory, for example:
+
+   python benchmarks/make_corpus.py --corpus full corpus_dir
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import os
+import zlib
+import random
+import hashlib
+import argparse
+
+# The corpus sets, as lists of (kind, number of pages) pairs.
+CORPUS_SETS = {
+    "quick": [("text", 10), ("text", 100), ("scan", 10), ("mixed_sizes", 10),
+              ("rotated", 10), ("poster", 2)],
+    "full": [("text", 10), ("text", 100), ("text", 1000), ("text", 10000),
+             ("scan", 10), ("scan", 100), ("mixed_sizes", 100), ("rotated", 100),
+             ("poster", 4)],
+}
+
+LETTER = (612, 792)
+PAGE_SIZES = [LETTER, (595, 842), (612, 1008), (595, 420)] # Letter, A4, legal, A5.
+POSTER_SIZES = [(2384, 3370), (1684, 2384)] # A0 and A1.
+ROTATIONS = [0, 90, 180, 270]
+SCAN_DPI = 100 # The resolution of the scanned page images.
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod"
+         " tempor incididunt ut labore et dolore magna aliqua").split()
+
+def get_random_generator(file_name, page_num):
+    """Return a random number generator seeded with the file name and page
+    number, which gives the same numbers in every Python version."""
+    seed = hashlib.sha1("{}:{}".format(file_name, page_num).encode("ascii")).hexdigest()
+    return random.Random(int(seed[:16], 16))
+
+def get_text_content(rng, page_size, font_size=10):
+    """Return the content stream of a page of text lines, with random margins."""
+    width, height = page_size
+    left = rng.uniform(36, width / 5)
+    top = height - rng.uniform(36, height / 6)
+    bottom = rng.uniform(36, height / 6)
+    right = width - rng.uniform(36, width / 5)
+    leading = font_size * 1.3
+    chars_per_line = max(1, int((right - left) / (font_size * 0.5)))
+
+    commands = ["BT", "/F1 {} Tf".format(font_size),
+                "{:.2f} TL".format(leading),
+                "{:.2f} {:.2f} Td".format(left, top - font_size)]
+    num_lines = int((top - bottom) / leading)
+    for line_num in range(num_lines):
+        words = []
+        while len(" ".join(words)) < chars_per_line * rng.uniform(0.5, 1.0):
+            words.append(rng.choice(WORDS))
+        commands.append("({}) '".format(" ".join(words)[:chars_per_line]))
+    commands.append("ET")
+    # A rule under the text and a page number in the bottom margin.
+    commands.append("0.5 w {:.2f} {:.2f} m {:.2f} {:.2f} l S".format(
+                    left, bottom - 6, right, bottom - 6))
+    commands.append("BT /F1 8 Tf {:.2f} {:.2f} Td (page) Tj ET".format(
+                    (left + right) / 2, bottom - 20))
+    return "\n".join(commands).encode("latin-1")
+
+def get_poster_content(rng, page_size):
+    """Return the content stream of a poster page, with a title, filled boxes,
+    and lines."""
+    width, height = page_size
+    margin = rng.uniform(72, width / 8)
+    commands = ["BT /F1 96 Tf {:.2f} {:.2f} Td (Poster title) Tj ET".format(
+                margin, height - margin - 96)]
+    for box_num in range(12):
+        x = rng.uniform(margin, width - margin - 200)
+        y = rng.uniform(margin, height - 2 * margin - 200)
+        gray = rng.uniform(0, 0.8)
+        commands.append("{:.2f} g {:.2f} {:.2f} {:.2f} {:.2f} re f".format(
+                        gray, x, y, rng.uniform(50, 200), rng.uniform(50, 200)))
+    commands.append("0 g 2 w")
+    for line_num in range(20):
+        commands.append("{:.2f} {:.2f} m {:.2f} {:.2f} l S".format(
+                        rng.uniform(margin, width - margin),
+                        rng.uniform(margin, height - margin),
+                        rng.uniform(margin, width - margin),
+                        rng.uniform(margin, height - margin)))
+    return "\n".join(commands).encode("latin-1")
+
+def get_scan_image(rng, page_size):
+    """Return the size and the pixel data of a grayscale scanned-page image:
+    blocks of dark "text" lines on a white page, with a gray shadow along one
+    edge and a few specks of dust."""
+    width = int(page_size[0] * SCAN_DPI / 72)
+    height = int(page_size[1] * SCAN_DPI / 72)
+    rows = [bytearray(b"\xff" * width) for row_num in range(height)]
+
+    def fill(left, top, right, bottom, value):
+        for row in rows[max(top, 0):min(bottom, height)]:
+            row[max(left, 0):min(right, width)] = bytes(bytearray(
+                               [value])) * (min(right, width) - max(left, 0))
+
+    text_left = int(rng.uniform(0.08, 0.2) * width)
+    text_right = int(rng.uniform(0.8, 0.92) * width)
+    line_top = int(rng.uniform(0.06, 0.15) * height)
+    text_bottom = int(rng.uniform(0.85, 0.94) * height)
+    while line_top < text_bottom:
+        line_right = int(rng.uniform(0.6, 1.0) * (text_right - text_left)) + text_left
+        fill(text_left, line_top, line_right, line_top + 9, rng.randint(10, 60))
+        line_top += 16
+    fill(width - int(0.03 * width), 0, width, height, 170) # The scanner shadow.
+    for speck_num in range(3):
+        x, y = rng.randrange(width), rng.randrange(height)
+        fill(x, y, x + 2, y + 2, 80)
+    return (width, height), b"".join(bytes(row) for row in rows)
+
+class PdfWriter(object):
+    """A minimal writer of PDF files with numbered objects.  Objects are added
+    with `add_object` in the order they are written, and `write` writes the
+    file with its cross-reference table."""
+    def __init__(self):
+        self.objects = []
+
+    def reserve_object(self):
+        """Reserve an object number, for an object which is set later."""
+        self.objects.append(None)
+        return len(self.objects)
+
+    def set_object(self, object_num, data):
+        self.objects[object_num - 1] = data
+
+    def add_object(self, data):
+        object_num = self.reserve_object()
+        self.set_object(object_num, data)
+        return object_num
+
+    def add_stream(self, dictionary, data, compress=True):
+        if compress:
+            data = zlib.compress(data, 6)
+            dictionary += " /Filter /FlateDecode"
+        return self.add_object("<< {} /Length {} >>\nstream\n".format(
+                               dictionary, len(data)).encode("latin-1")
+                               + data + b"\nendstream")
+
+    def write(self, file_name, root_object_num):
+        with open(file_name, "wb") as f:
+            f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+            offsets = []
+            for object_num, data in enumerate(self.objects, 1):
+                offsets.append(f.tell())
+                f.write("{} 0 obj\n".format(object_num).encode("ascii"))
+                f.write(data if isinstance(data, bytes) else data.encode("latin-1"))
+                f.write(b"\nendobj\n")
+            xref_offset = f.tell()
+            f.write("xref\n0 {}\n0000000000 65535 f \n".format(
+                    len(self.objects) + 1).encode("ascii"))
+            for offset in offsets:
+                f.write("{:010d} 00000 n \n".format(offset).encode("ascii"))
+            f.write("trailer\n<< /Size {} /Root {} 0 R >>\nstartxref\n{}\n%%EOF\n"
+                    .format(len(self.objects) + 1, root_object_num, xref_offset)
+                    .encode("ascii"))
+
+def write_document(file_name, kind, num_pages):
+    """Write the corpus document of the kind `kind` with `num_pages` pages to
+    the file `file_name`."""
+    base_name = os.path.basename(file_name)
+    writer = PdfWriter()
+    catalog_num = writer.reserve_object()
+    pages_num = writer.reserve_object()
+    font_num = writer.add_object("<< /Type /Font /Subtype /Type1"
+                                 " /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    page_nums = []
+    for page_num in range(num_pages):
+        rng = get_random_generator(base_name, page_num)
+        page_size = LETTER
+        rotation = 0
+        if kind == "mixed_sizes":
+            page_size = PAGE_SIZES[page_num % len(PAGE_SIZES)]
+        elif kind == "poster":
+            page_size = POSTER_SIZES[page_num % len(POSTER_SIZES)]
+        elif kind == "rotated":
+            rotation = ROTATIONS[page_num % len(ROTATIONS)]
+
+        resources = "<< /Font << /F1 {} 0 R >> >>".format(font_num)
+        if kind == "scan":
+            (image_width, image_height), pixels = get_scan_image(rng, page_size)
+            image_num = writer.add_stream(
+                 "/Type /XObject /Subtype /Image /Width {} /Height {} /ColorSpace"
+                 " /DeviceGray /BitsPerComponent 8".format(image_width, image_height),
+                 pixels)
+            resources = "<< /XObject << /Im1 {} 0 R >> >>".format(image_num)
+            content = "q {} 0 0 {} 0 0 cm /Im1 Do Q".format(*page_size).encode("ascii")
+        elif kind == "poster":
+            content = get_poster_content(rng, page_size)
+        else:
+            content = get_text_content(rng, page_size)
+        content_num = writer.add_stream("", content)
+
+        page_nums.append(writer.add_object(
+             "<< /Type /Page /Parent {} 0 R /MediaBox [0 0 {} {}] /Rotate {}"
+             " /Resources {} /Contents {} 0 R >>".format(pages_num, page_size[0],
+                          page_size[1], rotation, resources, content_num)))
+
+    writer.set_object(pages_num, "<< /Type /Pages /Count {} /Kids [{}] >>".format(
+                      num_pages, " ".join("{} 0 R".format(n) for n in page_nums)))
+    writer.set_object(catalog_num, "<< /Type /Catalog /Pages {} 0 R >>".format(pages_num))
+    writer.write(file_name, catalog_num)
+
+def get_corpus_file_name(kind, num_pages):
+    return "{}_{}.pdf".format(kind, num_pages)
+
+def make_corpus(directory, corpus_set="quick", verbose=False):
+    """Write the documents of the corpus set `corpus_set` to `directory`,
+    skipping any which are already there, and return the list of
+    `(file_path, kind, num_pages)` tuples."""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    corpus = []
+    for kind, num_pages in CORPUS_SETS[corpus_set]:
+        file_path = os.path.join(directory, get_corpus_file_name(kind, num_pages))
+        if not os.path.exists(file_path):
+            if verbose:
+                print("Writing", file_path)
+            temp_file_path = file_path + ".tmp" # So an interrupted write is not used.
+            write_document(temp_file_path, kind, num_pages)
+            os.rename(temp_file_path, file_path)
+        corpus.append((file_path, kind, num_pages))
+    return corpus
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the benchmark PDF corpus.")
+    parser.add_argument("directory", help="The directory to write the files to.")
+    parser.add_argument("--corpus", choices=sorted(CORPUS_SETS), default="quick",
+                        help="The set of files to generate.")
+    bench_args = parser.parse_args()
+    make_corpus(bench_args.directory, bench_args.corpus, verbose=True)
+
+if __name__ == "__main__":
+    main()
@@ -58,6 +58,7 @@ setup(
                             "PySimpleGUI27>=2.4.1;python_version<'3.0'",
                             #"typing;python_version<='3.4'", # PySimpleGUI on Python2 needed this...
                             "PyMuPDF>=1.14.5",],
+                    "numpy": ["numpy"], # Faster analysis of the rendered page images.
                     },
     url="https://github.com/abarker/pdfCropMargins",
     entry_points = {
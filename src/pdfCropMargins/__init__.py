@@ -7,6 +7,19 @@ from __future__ import print_function, division, absolute_import
 
 __version__ = "0.2.11" # major version, minor version, patch (see PEP440)
 
-# The only function designed to be called from a user's Python code.
+import sys
+
+# The function and classes designed to be called from a user's Python code.
 from pdfCropMargins.pdfCropMargins import crop
 
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        """Import the `crop_job` classes only when they are used, so that
+        starting the program does not wait for that module."""
+        if name in ("CropJob", "CropResult"):
+            from pdfCropMargins import crop_job
+            return getattr(crop_job, name)
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+else:
+    from pdfCropMargins.crop_job import CropJob, CropResult
+
@@ -0,0 +1,340 @@
+"""
+
+This module implements the batch mode, where many PDF files are cropped with
+the same options in a single run.  The input files can be given as a list of
+files, as wildcard patterns, or as directories, which are searched
+recursively for PDF files.  The files are cropped concurrently by a pool of
+worker processes, each of which crops one file at a time, so the imports and
+the setup are only done once per worker rather than once per file.  The
+files are isolated from each other: the output of each file is collected
+separately, and an error in one file is reported in the summary at the end
+while the other files are still cropped.
+
+=====================================================================
+
+pdfCropMargins -- a program to crop the margins of PDF files
+Copyright (C) 2014 Allen Barker (Allen.L.Barker@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Source code site: https://github.com/abarker/pdfCropMargins
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import glob
+import copy
+import time
+import signal
+import traceback
+
+try:
+    from StringIO import StringIO # Python 2, which prints byte strings.
+except ImportError:
+    from io import StringIO
+
+from . import external_program_calls as ex
+
+GLOB_CHARACTERS = ("*", "?", "[")
+
+# Options which cannot be used in batch mode, because they are interactive or
+# name a single file.
+OPTIONS_NOT_ALLOWED_IN_BATCH = [("gui", "--gui"),
+                                ("preview", "--preview"),
+                                ("queryModifyOriginal", "--queryModifyOriginal"),
+                                ("writeCropDataToFile", "--writeCropDataToFile"),
+                                ("readCropData", "--readCropData"),
+                                ("profileReport", "--profileReport")]
+
+def has_glob_characters(path):
+    """Return true if `path` contains any wildcard characters."""
+    return any(c in path for c in GLOB_CHARACTERS)
+
+def expand_glob(pattern):
+    """Return the sorted list of the pathnames matching the wildcard pattern
+    `pattern`.  The pattern "**" matches any number of directories, in the
+    Python versions which support it."""
+    try:
+        return sorted(glob.glob(pattern, recursive=True))
+    except TypeError: # Python 2 has no recursive globbing.
+        return sorted(glob.glob(pattern))
+
+def is_batch_mode(parsed_args):
+    """Return true if the command-line arguments `parsed_args` select the batch
+    mode.  That is the case when more than one input argument is given, or when
+    the input argument is a directory or a wildcard pattern which does not match
+    exactly one file."""
+    if parsed_args.version or parsed_args.checkPrevCropped:
+        return False
+    input_args = parsed_args.pdf_input_doc
+    if len(input_args) > 1:
+        return True
+    input_arg = os.path.expanduser(input_args[0])
+    if os.path.isdir(input_arg):
+        return True
+    if has_glob_characters(input_arg) and not os.path.exists(input_arg):
+        return len(expand_glob(input_arg)) != 1
+    return False
+
+def is_default_output_name(file_name, parsed_args):
+    """Return true if the name of the file `file_name` looks like one generated
+    by the program for a cropped file (or for a saved uncropped original), so
+    that earlier outputs are not cropped again when a directory is searched."""
+    name_before_extension = os.path.splitext(os.path.basename(file_name))[0]
+    sep = parsed_args.stringSeparator
+    for tag in (parsed_args.stringCropped, parsed_args.stringUncropped):
+        if parsed_args.usePrefix and name_before_extension.startswith(tag + sep):
+            return True
+        if not parsed_args.usePrefix and name_before_extension.endswith(sep + tag):
+            return True
+    return False
+
+def find_pdf_files_in_directory(directory, parsed_args):
+    """Return a sorted list of the PDF files (with the extension '.pdf', in any
+    case) in the directory `directory` and all its subdirectories, leaving out
+    the earlier outputs of the program."""
+    pdf_files = []
+    for dir_path, dir_names, file_names in os.walk(directory):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if (file_name.lower().endswith(".pdf")
+                    and not is_default_output_name(file_name, parsed_args)):
+                pdf_files.append(os.path.join(dir_path, file_name))
+    return pdf_files
+
+def get_batch_input_list(parsed_args):
+    """Expand the input arguments in `parsed_args` into the list of files to
+    crop.  Returns a tuple `(input_list, unmatched_args)`.  Each item of
+    `input_list` is a tuple `(input_doc_fname, top_directory)`, where
+    `top_directory` is the directory argument the file was found in, or `None`
+    if it was named directly or by a wildcard pattern.  Files are only listed
+    once.  The list `unmatched_args` holds any wildcard patterns and
+    directories which did not match any PDF files."""
+    input_list = []
+    unmatched_args = []
+    seen_files = set()
+    for input_arg in parsed_args.pdf_input_doc:
+        input_arg = os.path.expanduser(input_arg)
+        if os.path.isdir(input_arg):
+            file_names = find_pdf_files_in_directory(input_arg, parsed_args)
+            top_directory = input_arg
+        elif has_glob_characters(input_arg) and not os.path.exists(input_arg):
+            file_names = [f for f in expand_glob(input_arg) if not os.path.isdir(f)]
+            top_directory = None
+        else:
+            file_names = [input_arg] # Any error is reported when it is cropped.
+            top_directory = None
+        if not file_names:
+            unmatched_args.append(input_arg)
+        for file_name in file_names:
+            real_path = os.path.realpath(file_name)
+            if real_path not in seen_files:
+                seen_files.add(real_path)
+                input_list.append((file_name, top_directory))
+    return input_list, unmatched_args
+
+def get_batch_output_fname(input_doc_fname, top_directory, output_directory,
+                           generate_default_filename):
+    """Return the output filename for the input file `input_doc_fname` of the
+    batch.  The name itself is from the function `generate_default_filename`.
+    The file is written next to the input file, unless `output_directory` is
+    set.  In that case files found in the directory argument `top_directory`
+    keep their paths relative to it inside of the output directory."""
+    output_name = generate_default_filename(input_doc_fname)
+    if not output_directory:
+        return os.path.join(os.path.dirname(input_doc_fname), output_name)
+    if top_directory is not None:
+        relative_directory = os.path.relpath(os.path.dirname(input_doc_fname),
+                                             top_directory)
+        return os.path.normpath(os.path.join(output_directory, relative_directory,
+                                             output_name))
+    return os.path.join(output_directory, output_name)
+
+def get_num_batch_jobs(parsed_args, num_files):
+    """Return the number of worker processes to use for the batch, from the
+    `--batchJobs` option.  The default is the number of available CPUs.  It is
+    never more than the number of files."""
+    num_jobs = parsed_args.batchJobs or ex.get_available_cpu_count()
+    return max(1, min(num_jobs, num_files))
+
+def ignore_keyboard_interrupts():
+    """Initialize a worker process to ignore Ctrl-C, which the main process
+    handles by terminating the pool."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def crop_batch_file(task):
+    """Crop one file of the batch, in a worker process (or in the main process
+    when there is only one job).  The tuple `task` holds the cropping function
+    `crop_function`, the input and output filenames, and the parsed
+    command-line arguments, which are copied and set to crop just that file.
+    The output of the program is collected rather than printed, and any error
+    is caught.  Returns a tuple `(input_doc_fname, output_doc_fname, exit_code,
+    elapsed_time, output_text)`."""
+    crop_function, input_doc_fname, output_doc_fname, parsed_args = task
+    file_args = copy.deepcopy(parsed_args)
+    file_args.pdf_input_doc = [input_doc_fname]
+    file_args.outfile = [output_doc_fname]
+
+    output_text = StringIO()
+    old_stdout, old_stderr = sys.stdout, sys.stderr
+    sys.stdout = sys.stderr = output_text
+    exit_code = 0
+    start_time = time.time()
+    try:
+        with ex.create_temporary_directory():
+            crop_function(file_args)
+    except SystemExit as e: # From `cleanup_and_exit`.
+        exit_code = e.code if isinstance(e.code, int) else int(e.code is not None)
+    except (KeyboardInterrupt, EOFError):
+        raise
+    except: # Isolate the other files from any unexpected error.
+        print("\nCaught an unexpected exception in the pdfCropMargins program.")
+        traceback.print_exc(file=output_text)
+        exit_code = 1
+    finally:
+        sys.stdout, sys.stderr = old_stdout, old_stderr
+    return (input_doc_fname, output_doc_fname, exit_code, time.time() - start_time,
+            output_text.getvalue())
+
+def get_error_summary(output_text):
+    """Return a one-line summary of the error in the output `output_text` of a
+    file which failed.  That is the first line of the program's own error
+    message, if there is one, and otherwise the last non-blank line (which for
+    unexpected exceptions is the exception message)."""
+    lines = [line.strip() for line in output_text.splitlines() if line.strip()]
+    for line in lines:
+        if line.startswith("Error in pdfCropMargins:"):
+            return line
+    return lines[-1] if lines else "Unknown error."
+
+def print_batch_summary(results, num_jobs, elapsed_time):
+    """Print the summary report of the batch, with the per-file timings, from
+    the list `results` of the tuples returned by `crop_batch_file`."""
+    num_cropped = sum(1 for result in results if result[2] == 0)
+    print("\nBatch summary: cropped {} of {} files in {:.2f} s with {} worker"
+          " process{}.".format(num_cropped, len(results), elapsed_time, num_jobs,
+                               "" if num_jobs == 1 else "es"))
+    for input_doc_fname, output_doc_fname, exit_code, file_time, output_text in results:
+        if exit_code == 0:
+            print("   {:8.2f} s  ok      {}\n                       -> {}".format(
+                  file_time, input_doc_fname, output_doc_fname))
+        else:
+            print("   {:8.2f} s  FAILED  {}\n                       {}".format(
+                  file_time, input_doc_fname, get_error_summary(output_text)))
+
+def crop_batch(parsed_args, crop_function, generate_default_filename):
+    """Crop all the files selected by the command-line arguments `parsed_args` in
+    batch mode, with the same options.  Each file is cropped by calling
+    `crop_function` with a copy of `parsed_args` that selects just that file.
+    The function `generate_default_filename` gives the names of the output
+    files.  If the `--outfile` option is set it is taken as the name of the
+    output directory.  Returns the exit code, which is zero only if every file
+    was cropped."""
+    for option, option_name in OPTIONS_NOT_ALLOWED_IN_BATCH:
+        if getattr(parsed_args, option):
+            print("\nError in pdfCropMargins: The '{}' option cannot be used when"
+                  "\ncropping more than one file.".format(option_name), file=sys.stderr)
+            return 1
+    if parsed_args.batchJobs < 0:
+        print("\nError in pdfCropMargins: The '--batchJobs' argument cannot be"
+              " negative.", file=sys.stderr)
+        return 1
+
+    output_directory = None
+    if parsed_args.outfile:
+        output_directory = os.path.expanduser(parsed_args.outfile[0])
+        if os.path.exists(output_directory) and not os.path.isdir(output_directory):
+            print("\nError in pdfCropMargins: When cropping more than one file the"
+                  "\n'--outfile' option must name a directory, but this is a file:"
+                  "\n   {}".format(output_directory), file=sys.stderr)
+            return 1
+
+    input_list, unmatched_args = get_batch_input_list(parsed_args)
+    for input_arg in unmatched_args:
+        print("\nWarning in pdfCropMargins: No PDF files were found for the"
+              " argument\n   {}".format(input_arg), file=sys.stderr)
+    if not input_list:
+        print("\nError in pdfCropMargins: No PDF files were found to crop.",
+              file=sys.stderr)
+        return 1
+
+    # Set up the tasks.  Files whose output name is already taken by an earlier
+    # file of the batch are reported as failed rather than overwriting it.
+    results = []
+    tasks = []
+    output_fnames = {}
+    for input_doc_fname, top_directory in input_list:
+        output_doc_fname = get_batch_output_fname(input_doc_fname, top_directory,
+                                       output_directory, generate_default_filename)
+        output_key = os.path.normcase(os.path.abspath(output_doc_fname))
+        if output_key in output_fnames:
+            results.append((input_doc_fname, output_doc_fname, 1, 0.0,
+                            "Error in pdfCropMargins: The output file is the same as"
+                            " for\n   {}".format(output_fnames[output_key])))
+            continue
+        output_fnames[output_key] = input_doc_fname
+        output_subdirectory = os.path.dirname(output_doc_fname)
+        if output_subdirectory and not os.path.isdir(output_subdirectory):
+            try:
+                os.makedirs(output_subdirectory)
+            except OSError: # Reported when the output file is written.
+                pass
+        tasks.append((crop_function, input_doc_fname, output_doc_fname, parsed_args))
+
+    # Each worker crops one file at a time, so the renderer processes for the
+    # pages of each file are divided among the workers unless set explicitly.
+    num_jobs = get_num_batch_jobs(parsed_args, len(tasks))
+    if num_jobs > 1 and not parsed_args.jobs:
+        parsed_args = copy.copy(parsed_args)
+        parsed_args.jobs = max(1, ex.get_available_cpu_count() // num_jobs)
+        tasks = [task[:3] + (parsed_args,) for task in tasks]
+
+    if parsed_args.verbose:
+        print("\nCropping {} files with {} worker process{}.".format(
+              len(tasks), num_jobs, "" if num_jobs == 1 else "es"))
+
+    start_time = time.time()
+    pool = None
+    if num_jobs == 1:
+        file_results = (crop_batch_file(task) for task in tasks)
+    else:
+        import multiprocessing # Imported here, since it is slow to import.
+        pool = multiprocessing.Pool(num_jobs, initializer=ignore_keyboard_interrupts)
+        file_results = pool.imap_unordered(crop_batch_file, tasks)
+    try:
+        for result in file_results:
+            results.append(result)
+            input_doc_fname, output_doc_fname, exit_code, file_time, output_text = result
+            if parsed_args.verbose or exit_code != 0:
+                print("\n==== {} ====".format(input_doc_fname))
+                print(output_text.rstrip(), file=sys.stdout if exit_code == 0
+                                                 else sys.stderr)
+    except (KeyboardInterrupt, EOFError):
+        if pool:
+            pool.terminate()
+        raise
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    # List the files in the order they were given, not the order they finished.
+    input_order = dict((input_doc_fname, i) for i, (input_doc_fname, top_directory)
+                                            in enumerate(input_list))
+    results.sort(key=lambda result: input_order[result[0]])
+    print_batch_summary(results, num_jobs, time.time() - start_time)
+    return 0 if all(result[2] == 0 for result in results) else 1
+
@@ -0,0 +1,185 @@
+"""
+
+This module implements a persistent on-disk cache of the calculated bounding
+boxes.  The entries are keyed by a hash of the contents of the PDF file, or by
+the fingerprint of a single page, together with all the parameters that the
+bounding boxes depend on.  So cropping the same document again with different
+margin options (which are only applied after the bounding boxes are found)
+does not need to render the pages again, and pages which also appear in
+other documents are only rendered once.
+
+Each entry is a small JSON file in the cache directory.  Entries are written
+to a temporary file and then renamed, so concurrent processes sharing the
+directory only ever see complete entries.  The modification time of an entry
+is updated whenever it is used, and when the total size of the entries goes
+over the limit the least-recently used ones are deleted.
+
+=====================================================================
+
+pdfCropMargins -- a program to crop the margins of PDF files
+Copyright (C) 2014 Allen Barker (Allen.L.Barker@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Source code site: https://github.com/abarker/pdfCropMargins
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import os
+import time
+import json
+import hashlib
+import tempfile
+
+from . import __version__
+from . import external_program_calls as ex
+
+CACHE_ENTRY_SUFFIX = ".bbox.json"
+HASH_BLOCK_SIZE = 2**20 # Bytes read at a time when hashing files.
+STALE_TEMP_FILE_AGE = 3600 # Seconds before a leftover temp file is deleted.
+
+def get_default_cache_directory():
+    """Return the default directory for the cache, in the usual per-user cache
+    location for the operating system."""
+    return os.path.join(ex.get_user_cache_directory(), "bboxes")
+
+def get_file_hash(file_name):
+    """Return the SHA-256 hex digest of the contents of the file `file_name`."""
+    file_hash = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+def get_bbox_parameters(args, page_nums_to_crop=None):
+    """Return a dict of all the parameters in the command-line arguments `args`
+    which the bounding boxes depend on, other than the document itself, for the
+    cache keys.  If the set `page_nums_to_crop` of the pages the bounding boxes
+    are found for is passed it is also included."""
+    parameters = {"bboxEngine": args.bboxEngine,
+                  "gsBbox": args.gsBbox,
+                  "gsRender": args.gsRender,
+                  "gsFix": args.gsFix,
+                  "oldPdftoppmVersion": bool(ex.job.old_pdftoppm_version),
+                  "renderProfile": args.renderProfile,
+                  "resX": args.resX,
+                  "resY": args.resY,
+                  "coarseRes": args.coarseRes,
+                  "threshold": args.threshold,
+                  "numBlurs": args.numBlurs,
+                  "numSmooths": args.numSmooths,
+                  "noImageFastPath": args.noImageFastPath,
+                  "fullPageBox": args.fullPageBox,
+                  "absolutePreCrop4": args.absolutePreCrop4}
+    if page_nums_to_crop is not None:
+        parameters["pages"] = sorted(page_nums_to_crop)
+    return parameters
+
+def get_cache_key(content_hash, parameters):
+    """Return the cache key for a file or page with the hash or fingerprint
+    `content_hash` and the bounding-box parameters in the dict `parameters`,
+    which must be serializable as JSON.  The program version is always included,
+    since the bounding-box calculations can change between versions."""
+    key_data = json.dumps([__version__, content_hash, parameters], sort_keys=True)
+    return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+def get_entry_path(cache_directory, key):
+    """Return the path of the cache entry file for the key `key`."""
+    return os.path.join(cache_directory, key + CACHE_ENTRY_SUFFIX)
+
+def read_cache_entry(cache_directory, key):
+    """Return the bounding box, or bounding box list, saved in the cache with the
+    key `key`, or `None` if there is no such entry (or it cannot be read).  The
+    entry is marked as recently used."""
+    entry_path = get_entry_path(cache_directory, key)
+    try:
+        with open(entry_path, "r") as f:
+            value = json.load(f)["value"]
+        os.utime(entry_path, None) # Mark as recently used, for the LRU eviction.
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return None
+    return value
+
+def write_cache_entry(cache_directory, key, value, max_cache_bytes):
+    """Save the bounding box or bounding box list `value` in the cache with the
+    key `key`, and then evict entries as needed to keep the total size of the
+    cache at most `max_cache_bytes` bytes."""
+    write_cache_entries(cache_directory, {key: value}, max_cache_bytes)
+
+def write_cache_entries(cache_directory, entries, max_cache_bytes):
+    """Save each of the values in the dict `entries` in the cache with its key,
+    and then evict entries as needed to keep the total size of the cache at most
+    `max_cache_bytes` bytes.  Failures to write are ignored, since the cache is
+    only an optimization."""
+    if not entries:
+        return
+    try:
+        if not os.path.isdir(cache_directory):
+            os.makedirs(cache_directory)
+    except OSError: # Another process may have just created it.
+        if not os.path.isdir(cache_directory):
+            return
+
+    for key, value in entries.items():
+        # Write to a unique temporary file and rename it, which is atomic, so
+        # other processes never read a partially-written entry.
+        try:
+            fd, temp_path = tempfile.mkstemp(prefix=".tmp_", suffix=CACHE_ENTRY_SUFFIX,
+                                             dir=cache_directory)
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"value": value}, f)
+            ex.replace_file(temp_path, get_entry_path(cache_directory, key))
+        except (IOError, OSError):
+            ex.remove_file(temp_path)
+            return
+
+    evict_least_recently_used(cache_directory, max_cache_bytes)
+
+def evict_least_recently_used(cache_directory, max_cache_bytes):
+    """Delete the least-recently used entries in the cache until the total size
+    of the entries is at most `max_cache_bytes` bytes.  Entries deleted at the
+    same time by another process are skipped.  Temporary files left over from
+    interrupted writes are also deleted once they are old enough."""
+    entries = []
+    try:
+        file_names = os.listdir(cache_directory)
+    except OSError:
+        return
+    for file_name in file_names:
+        if not file_name.endswith(CACHE_ENTRY_SUFFIX):
+            continue
+        entry_path = os.path.join(cache_directory, file_name)
+        try:
+            stat = os.stat(entry_path)
+        except OSError:
+            continue
+        if file_name.startswith(".tmp_"):
+            if time.time() - stat.st_mtime > STALE_TEMP_FILE_AGE:
+                ex.remove_file(entry_path)
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+    total_bytes = sum(size for mtime, size, entry_path in entries)
+    for mtime, size, entry_path in sorted(entries):
+        if total_bytes <= max_cache_bytes:
+            break
+        ex.remove_file(entry_path)
+        total_bytes -= size
@@ -3,7 +3,8 @@
 This module contains the routines which calculate the bounding boxes,
 either directly by rendering the pages and analyzing the image or by calling
 Ghostscript to do it.  External programs from the external_program_calls
-module are called when required.
+module are called when required.  Pages can also be rendered in-process by
+PyMuPDF, in which case no external programs or image files are used.
 
 =====================================================================
 
@@ -33,7 +34,18 @@ import os
 import glob
 import shutil
 import time
+import math
+import struct
+import threading
+import hashlib
+import zlib
+from io import BytesIO
+from PyPDF2.generic import DictionaryObject, ArrayObject, StreamObject, IndirectObject
+from PyPDF2.utils import PdfReadError
 from . import external_program_calls as ex
+from . import bbox_cache
+from . import profile_report
+from .profile_report import profile_stage, profile_page_analysis, get_wall_time
 
 #
 # Image-processing imports.
@@ -42,45 +54,85 @@ from . import external_program_calls as ex
 try:
     # The Pillow fork uses the same import command, so this import works either
     # way (but Pillow can't co-exist with PIL).
-    from PIL import Image, ImageFilter
+    from PIL import Image, ImageFilter, ImageChops
     hasPIL = True
 except ImportError:
     hasPIL = False
 
+try:
+    # NumPy is optional.  When it is installed the image analysis is vectorized.
+    import numpy
+    hasNumpy = True
+except ImportError:
+    hasNumpy = False
+
 #
-# A few globals used in this module, shared when passed into get_bounding_box_list.
+# The values shared by the functions of this module are saved in the state of
+# the current cropping job when passed into get_bounding_box_list (see the
+# `JobState` class in external_program_calls.py).
 #
 
-args = None # Command-line arguments; set in get_bounding_box_list.
-page_nums_to_crop = None # Set of pages to crop.
-PdfFileWriter = None
+args = ex.args # Command-line arguments; set in get_bounding_box_list.
+job = ex.job # Holds `page_nums_to_crop`, `page_geometry_list` and `PdfFileWriter`.
 
 #
 # The main functions of the module.
 #
 
-def get_bounding_box_list(input_doc_fname, input_doc, full_page_box_list,
+def get_bounding_box_list(input_doc_fname, input_doc, input_page_geometry_list,
                           set_of_page_nums_to_crop, argparse_args, chosen_PdfFileWriter):
-    """Calculate a bounding box for each page in the document.  The  `input_doc_fname`
-    argument is the filename of the document's original PDF file, the second is
-    the PdfFileReader for the document.  The argument full_page_box_list is a list
-    of the full-page-size boxes (which is used to correct for any nonzero origins
-    in the PDF coordinates).  The set_of_page_nums_to_crop argument is the set of page
-    numbers to crop; it is passed so that unnecessary calculations can be
-    skipped.  The argparse_args argument should be passed the args parsed from
-    the command line by argparse.  The chosen_PdfFileWriter is the PdfFileWriter
-    class from whichever pyPdf package was chosen by the main program.  The
-    function returns the list of bounding boxes."""
-    global args, page_nums_to_crop, PdfFileWriter
-    args = argparse_args # Make args available to all funs in module, as a global.
-    page_nums_to_crop = set_of_page_nums_to_crop # Make the set of pages global, too.
-    PdfFileWriter = chosen_PdfFileWriter # Be sure correct PdfFileWriter is set.
-
-    if args.gsBbox:
+    """Calculate a bounding box for each page in the document.  The
+    `input_doc_fname` argument is the filename of the document's original PDF file,
+    the second is the PdfFileReader for the document.  The argument
+    input_page_geometry_list is a list of the `PageGeometry` objects for the pages,
+    which hold the original boxes, the rotations, and the full-page-size boxes
+    (which are also used to correct for any nonzero origins in the PDF coordinates).
+    The PdfFileReader pages themselves are not modified.  The
+    set_of_page_nums_to_crop argument is the set of page numbers to crop; it is
+    passed so that unnecessary calculations can be skipped.  The argparse_args
+    argument should be passed the args parsed from the command line by argparse.
+    The chosen_PdfFileWriter is the PdfFileWriter class from whichever pyPdf package
+    was chosen by the main program.  The function returns the list of bounding
+    boxes."""
+    job.args = argparse_args # Make args available to all funs in module.
+    job.page_nums_to_crop = set_of_page_nums_to_crop # Make the set of pages available, too.
+    job.page_geometry_list = input_page_geometry_list
+    full_page_box_list = [get_box_floats(page_geometry.full_box)
+                          for page_geometry in job.page_geometry_list]
+    job.PdfFileWriter = chosen_PdfFileWriter # Be sure correct PdfFileWriter is set.
+
+    # Only one page of each group of identically-drawn pages is analyzed, and
+    # pages which draw nothing are not analyzed at all.  Pages already found in
+    # the bounding-box cache (from any document) are not analyzed either.
+    with profile_stage("fingerprint_pages"):
+        page_fingerprints, empty_page_nums, duplicate_pages = get_page_fingerprints(
+                                                                              input_doc)
+    known_bbox_list = get_empty_page_bounding_boxes(empty_page_nums, full_page_box_list)
+    job.page_nums_to_crop = job.page_nums_to_crop - empty_page_nums - set(duplicate_pages)
+    page_cache_keys = {}
+    if args.bboxCache:
+        with profile_stage("page_cache_lookup"):
+            page_cache_keys = read_page_cache_entries(page_fingerprints, known_bbox_list)
+        job.page_nums_to_crop = set(page_num for page_num in job.page_nums_to_crop
+                                if known_bbox_list[page_num] is None)
+
+    # Pages which only display a single image (like most scanned pages) are
+    # analyzed directly from the embedded image.  Only the other pages are
+    # passed on to the selected engine.
+    image_page_bbox_list = [None] * input_doc.getNumPages()
+    if job.page_nums_to_crop and not args.gsBbox and not args.noImageFastPath and hasPIL:
+        with profile_stage("image_fast_path"):
+            image_page_bbox_list = get_bounding_box_list_single_image_pages(input_doc)
+        job.page_nums_to_crop = set(page_num for page_num in job.page_nums_to_crop
+                                if image_page_bbox_list[page_num] is None)
+
+    if not job.page_nums_to_crop:
+        bbox_list = [None] * input_doc.getNumPages()
+    elif args.gsBbox:
         if args.verbose:
             print("\nUsing Ghostscript to calculate the bounding boxes.")
-        bbox_list = ex.get_bounding_box_list_ghostscript(input_doc_fname,
-                                             args.resX, args.resY, args.fullPageBox)
+        with profile_stage("ghostscript_bbox"):
+            bbox_list = get_bounding_box_list_ghostscript(input_doc_fname, input_doc)
     else:
         if not hasPIL:
             print("\nError in pdfCropMargins: No version of the PIL package (or a"
@@ -88,7 +140,46 @@ def get_bounding_box_list(input_doc_fname, input_doc, full_page_box_list,
                   "\npackage or use the Ghostscript flag '--gsBbox' (or '-gs') if you"
                   "\nhave Ghostscript installed.", file=sys.stderr)
             ex.cleanup_and_exit(1)
-        bbox_list = get_bounding_box_list_render_image(input_doc_fname, input_doc)
+
+        # PyMuPDF is not thread safe, so only one job in the process (such as in
+        # a server) can run a PyMuPDF engine at a time.  Otherwise the lock is a
+        # new one, which is never waited for.
+        engine_lock = threading.Lock()
+        if args.bboxEngine != "default":
+            from . import pymupdf_routines # Only import if needed; requires fitz.
+            engine_lock = pymupdf_routines.pymupdf_lock
+        with engine_lock:
+            if args.bboxEngine in ("vector", "hybrid"):
+                with profile_stage("vector_engine"):
+                    bbox_list = get_bounding_box_list_vector(input_doc_fname, input_doc,
+                                    render_scanned_pages=(args.bboxEngine == "hybrid"))
+            elif args.coarseRes:
+                with profile_stage("coarse_to_fine"):
+                    bbox_list = get_bounding_box_list_coarse_to_fine(input_doc_fname,
+                                                                     input_doc)
+            elif args.bboxEngine == "mupdf":
+                with profile_stage("mupdf_engine"):
+                    bbox_list = get_bounding_box_list_mupdf(input_doc_fname, input_doc)
+            else:
+                with profile_stage("render_engine"):
+                    bbox_list = get_bounding_box_list_render_image(input_doc_fname,
+                                                                   input_doc)
+
+    bbox_list = [image_page_bbox if image_page_bbox is not None else bbox
+                 for bbox, image_page_bbox in zip(bbox_list, image_page_bbox_list)]
+    if page_cache_keys:
+        with profile_stage("page_cache_write"):
+            write_page_cache_entries(page_cache_keys, bbox_list)
+    bbox_list = [known_bbox if known_bbox is not None else bbox
+                 for bbox, known_bbox in zip(bbox_list, known_bbox_list)]
+    for page_num, first_page_num in duplicate_pages.items():
+        bbox_list[page_num] = list(bbox_list[first_page_num])
+
+    # Pages which were not selected for cropping were skipped in the calculations
+    # above; they get placeholder boxes which are simply the full page.
+    bbox_list = [bbox if bbox is not None else
+                     [0, 0, full_box[2]-full_box[0], full_box[3]-full_box[1]]
+                 for bbox, full_box in zip(bbox_list, full_page_box_list)]
 
     # Now we need to use the full page boxes to translate for non-zero origin.
     bbox_list = correct_bounding_box_list_for_nonzero_origin(bbox_list,
@@ -112,140 +203,1019 @@ def correct_bounding_box_list_for_nonzero_origin(bbox_list, full_box_list):
                                  bbox[2]+left_x, bbox[3]+lower_y])
     return corrected_box_list
 
+#
+# Page geometry for the renderers.  The renderers are run on the original PDF
+# file, which is not modified.  They render each page like a viewer shows it,
+# i.e., the CropBox clipped to the MediaBox and with the page rotation applied.
+# The full page box (which all the bounding boxes are relative to, and which
+# includes any pre-crop) is then clipped out of the rendered page, by the
+# renderer itself when possible, and the rotation is undone.  The original
+# boxes, the rotation, and the full page box of each page are taken from its
+# `PageGeometry` object, set up by the main module.
+#
+
+def get_box_floats(box):
+    """Return the `RectangleObject` box `box` as an lbrt list of floats, with the
+    lower-left corner first even if the box was defined the other way around."""
+    box = [float(b) for b in box]
+    return [min(box[0], box[2]), min(box[1], box[3]),
+            max(box[0], box[2]), max(box[1], box[3])]
+
+def box_contains(outer_box, inner_box):
+    """Return true if the lbrt box `inner_box` is inside the lbrt box `outer_box`."""
+    return (inner_box[0] >= outer_box[0] and inner_box[1] >= outer_box[1] and
+            inner_box[2] <= outer_box[2] and inner_box[3] <= outer_box[3])
+
+def get_page_render_box(page_geometry, allow_media_box=True):
+    """Return the tuple `(render_box, use_crop_box)` for the page with the
+    `PageGeometry` object `page_geometry`, where `render_box` is the lbrt box of the
+    page which is rendered.  This is the visible area of the page, the CropBox
+    clipped to the MediaBox.  If the full page box extends outside of it and
+    `allow_media_box` is true then the whole MediaBox is rendered instead, and
+    `use_crop_box` is false."""
+    media_box = get_box_floats(page_geometry.media_box)
+    crop_box = get_box_floats(page_geometry.crop_box)
+    crop_box = [max(media_box[0], crop_box[0]), max(media_box[1], crop_box[1]),
+                min(media_box[2], crop_box[2]), min(media_box[3], crop_box[3])]
+    full_box = get_box_floats(page_geometry.full_box)
+    if not allow_media_box or box_contains(crop_box, full_box):
+        return crop_box, True
+    return media_box, False
+
+def get_full_box_pixel_region(page_geometry, render_box, scale_x, scale_y):
+    """Return the region `(left, top, right, bottom)`, in pixels, which the full
+    page box of the page with geometry `page_geometry` covers in the unrotated image
+    of the lbrt box `render_box` rendered at `scale_x` and `scale_y` pixels per bp.
+    Partly covered pixels are included, like the renderers do for the page size."""
+    full_box = get_box_floats(page_geometry.full_box)
+    tolerance = 0.001 # Allow for floating point error in pixel units.
+    return (int(math.floor((full_box[0] - render_box[0]) * scale_x + tolerance)),
+            int(math.floor((render_box[3] - full_box[3]) * scale_y + tolerance)),
+            int(math.ceil((full_box[2] - render_box[0]) * scale_x - tolerance)),
+            int(math.ceil((render_box[3] - full_box[1]) * scale_y - tolerance)))
+
+def get_page_render_settings(page_geometry, program_to_use):
+    """Return a tuple `(use_crop_box, region)` with the settings for rendering the
+    page with geometry `page_geometry` with the program `program_to_use`.  The
+    boolean `use_crop_box` selects the box to render (see `get_page_render_box`).
+    The `region` is either `None` or the tuple `(x, y, width, height)` of the pixel
+    region which pdftoppm clips out of its rendered image to get the full page box.
+    Only pages without rotation whose full page box lies inside the rendered box are
+    clipped by pdftoppm.  Any other page with a full page box different from the
+    rendered box is clipped by `clip_rendered_page_image` after it is rendered."""
+    render_box, use_crop_box = get_page_render_box(page_geometry)
+    full_box = get_box_floats(page_geometry.full_box)
+    if (program_to_use != "pdftoppm" or ex.job.old_pdftoppm_version
+            or page_geometry.rotation
+            or full_box == render_box or not box_contains(render_box, full_box)):
+        return use_crop_box, None
+    left, top, right, bottom = get_full_box_pixel_region(page_geometry, render_box,
+                                                  args.resX / 72, args.resY / 72)
+    return use_crop_box, (left, top, right - left, bottom - top)
+
+def clip_rendered_page_image(im, page_geometry, render_box):
+    """Undo the page rotation in the image `im` rendered from the lbrt box
+    `render_box` of the page with geometry `page_geometry`, and clip it to the full
+    page box.  Any part of the full page box outside of the rendered image is filled
+    with white, like the blank paper a renderer would draw there.  Returns the new
+    image."""
+    if page_geometry.rotation in (90, 180, 270): # Rotate counterclockwise to undo.
+        im = im.transpose({90: Image.ROTATE_90, 180: Image.ROTATE_180,
+                           270: Image.ROTATE_270}[page_geometry.rotation])
+    if get_box_floats(page_geometry.full_box) == render_box:
+        return im
+    width, height = im.size
+    region = get_full_box_pixel_region(page_geometry, render_box,
+                                       width / (render_box[2] - render_box[0]),
+                                       height / (render_box[3] - render_box[1]))
+    if box_contains((0, 0, width, height), region):
+        return im.crop(region)
+    clipped_im = Image.new(im.mode, (region[2] - region[0], region[3] - region[1]),
+                           "white")
+    clipped_im.paste(im, (-region[0], -region[1]))
+    return clipped_im
+
+def convert_rendered_bounding_box(bounding_box, page_geometry, render_box):
+    """Convert the lbrt bounding box `bounding_box` found on the page with geometry
+    `page_geometry` as rendered from the lbrt box `render_box` (in bp, relative to
+    the lower-left corner of the rendered page with the page rotation applied, as
+    reported by the Ghostscript bbox device) to be relative to the lower-left corner
+    of the unrotated full page box, clipped to the full page box.  Empty boxes are
+    returned as all zeros."""
+    left, bottom, right, top = bounding_box
+    width = render_box[2] - render_box[0]
+    height = render_box[3] - render_box[1]
+    if page_geometry.rotation == 90:
+        left, bottom, right, top = width - top, left, width - bottom, right
+    elif page_geometry.rotation == 180:
+        left, bottom, right, top = width - right, height - top, width - left, height - bottom
+    elif page_geometry.rotation == 270:
+        left, bottom, right, top = bottom, height - right, top, height - left
+
+    full_box = get_box_floats(page_geometry.full_box)
+    shift_x, shift_y = render_box[0] - full_box[0], render_box[1] - full_box[1]
+    converted_box = [max(left + shift_x, 0), max(bottom + shift_y, 0),
+                     min(right + shift_x, full_box[2] - full_box[0]),
+                     min(top + shift_y, full_box[3] - full_box[1])]
+    if (bounding_box[0] >= bounding_box[2] or bounding_box[1] >= bounding_box[3]
+            or converted_box[0] > converted_box[2] or converted_box[1] > converted_box[3]):
+        return [0.0, 0.0, 0.0, 0.0]
+    return converted_box
+
+def get_password_args(program_to_use):
+    """Return the list of arguments which pass the password from the `--password`
+    option to the external program `program_to_use`, since the renderers are run
+    on the original (possibly encrypted) PDF file."""
+    if not args.password:
+        return []
+    if program_to_use == "pdftoppm":
+        return ["-opw", args.password, "-upw", args.password]
+    return ["-sPDFPassword=" + args.password]
+
+def get_page_runs(page_nums, key=None):
+    """Group the 0-based page numbers in the collection `page_nums` into runs of
+    contiguous pages.  Returns a sorted list of `(first_page, last_page)` tuples,
+    where the last page is included in the run.  If the function `key` is set
+    then a run is also broken wherever its value for the page numbers changes."""
+    page_runs = []
+    run_key = None
+    for page_num in sorted(page_nums):
+        page_key = key(page_num) if key else None
+        if page_runs and page_runs[-1][1] == page_num - 1 and page_key == run_key:
+            page_runs[-1] = (page_runs[-1][0], page_num)
+        else:
+            page_runs.append((page_num, page_num))
+        run_key = page_key
+    return page_runs
+
+def split_page_runs_into_shards(page_runs, num_shards):
+    """Split the page runs in the list `page_runs` (as returned by `get_page_runs`)
+    into shards of nearly equal numbers of pages, so that each shard can be
+    rendered by a separate process.  Returns a list of at least `num_shards`
+    runs (unless there are fewer pages than that).  A shard never spans two of
+    the original runs, so a few more shards than requested can be returned."""
+    num_pages = sum(last_page - first_page + 1 for first_page, last_page in page_runs)
+    if num_pages == 0:
+        return []
+    shard_size = -(-num_pages // max(1, num_shards)) # Ceiling division.
+    shards = []
+    for first_page, last_page in page_runs:
+        for shard_first_page in range(first_page, last_page+1, shard_size):
+            shards.append((shard_first_page,
+                           min(shard_first_page + shard_size - 1, last_page)))
+    return shards
 
-def get_bounding_box_list_render_image(pdf_file_name, input_doc):
+def get_num_jobs():
+    """Return the number of external renderer processes to run at the same time,
+    as set by the `--jobs` option.  The default is the number of CPUs actually
+    available to the program (taking any container CPU quota into account)."""
+    if args.jobs > 0:
+        return args.jobs
+    return ex.get_available_cpu_count()
+
+def run_in_parallel(function, arg_tuples, num_jobs):
+    """Call `function` once with each tuple of arguments in the list `arg_tuples`,
+    running at most `num_jobs` calls at the same time in separate threads.  This
+    is meant for functions which spend their time waiting on external processes.
+    Returns the list of return values, in the order of `arg_tuples`.  If any
+    call raises an exception (including `SystemExit`) then the first one raised
+    is re-raised after all the running calls finish."""
+    num_jobs = max(1, min(num_jobs, len(arg_tuples)))
+    if num_jobs == 1:
+        return [function(*arg_tuple) for arg_tuple in arg_tuples]
+
+    results = [None] * len(arg_tuples)
+    exceptions = []
+    next_index = [0] # A list so the worker threads can update it.
+    lock = threading.Lock()
+
+    job_state = ex.get_job_state() # The threads run in the same cropping job.
+
+    def worker():
+        with ex.job_state_context(job_state):
+            run_worker()
+
+    def run_worker():
+        while True:
+            with lock:
+                index = next_index[0]
+                if index >= len(arg_tuples) or exceptions:
+                    return
+                next_index[0] += 1
+            try:
+                results[index] = function(*arg_tuples[index])
+            except BaseException as e:
+                with lock:
+                    exceptions.append(e)
+
+    threads = [threading.Thread(target=worker) for i in range(num_jobs)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if exceptions:
+        raise exceptions[0]
+    return results
+
+def get_bounding_box_list_ghostscript(pdf_file_name, input_doc):
+    """Get the bounding box list from the Ghostscript bbox device.  Only the
+    pages selected for cropping are processed.  The selected pages are split
+    into shards which are processed by separate Ghostscript processes, with
+    up to `--jobs` of them running at once.  The skipped pages have the value
+    `None` in the returned list."""
+    def get_use_crop_box(page_num):
+        return get_page_render_box(job.page_geometry_list[page_num])[1]
+
+    def get_shard_bbox_list(first_page, last_page):
+        box_to_use = ["c"] if get_use_crop_box(first_page) else ["m"]
+        return ex.get_bounding_box_list_ghostscript(pdf_file_name,
+                                 args.resX, args.resY, box_to_use,
+                                 first_page=first_page+1, last_page=last_page+1,
+                                 extra_args=get_password_args("Ghostscript"))
+
+    num_jobs = get_num_jobs()
+    shards = split_page_runs_into_shards(
+                  get_page_runs(job.page_nums_to_crop, key=get_use_crop_box), num_jobs)
+    shard_bbox_lists = run_in_parallel(get_shard_bbox_list, shards, num_jobs)
+
+    bounding_box_list = [None] * input_doc.getNumPages()
+    for (first_page, last_page), run_bbox_list in zip(shards, shard_bbox_lists):
+        if len(run_bbox_list) != last_page - first_page + 1:
+            print("\nError in pdfCropMargins: Ghostscript returned the wrong number"
+                  "\nof bounding boxes for pages {} to {}.".format(first_page+1,
+                                                                last_page+1),
+                  file=sys.stderr)
+            ex.cleanup_and_exit(1)
+        for page_num, bounding_box in enumerate(run_bbox_list, first_page):
+            page_geometry = job.page_geometry_list[page_num]
+            bounding_box_list[page_num] = convert_rendered_bounding_box(bounding_box,
+                                  page_geometry, get_page_render_box(page_geometry)[0])
+    return bounding_box_list
+
+def get_bounding_box_list_render_image(pdf_file_name, input_doc, page_nums=None):
     """Calculate the bounding box list by directly rendering each page of the PDF as
-    an image file.  The MediaBox and CropBox values in input_doc should have
-    already been set to the chosen page size before the rendering."""
+    an image file.  The full page box of each page, from its `PageGeometry`, is
+    clipped out of the rendered pages.  Only the pages selected for cropping (or the
+    pages in `page_nums`, if set) are rendered; the skipped pages have the value
+    `None` in the returned list."""
+    if page_nums is None:
+        page_nums = job.page_nums_to_crop
 
     program_to_use = "pdftoppm" # default to pdftoppm
     if args.gsRender:
         program_to_use = "Ghostscript"
 
-    # Threshold value set in range 0-255, where 0 is black, with 191 default.
-    threshold = args.threshold[0]
-    dark_background_light_foreground = False
-    if threshold < 0:
-        threshold = -threshold
-        dark_background_light_foreground = True
-
-    temp_dir = ex.program_temp_directory # use the program default; don't delete dir!
+    temp_dir = ex.job.program_temp_directory # use the program default; don't delete dir!
 
     temp_image_file_root = os.path.join(temp_dir, ex.temp_file_prefix + "PageImage")
     if args.verbose:
         print("\nRendering the PDF to images using the " + program_to_use + " program,"
               "\nthis may take a while...")
 
-    # Do the rendering of all the files.
-    render_pdf_file_to_image_files(pdf_file_name, temp_image_file_root, program_to_use)
-
-    # Currently assuming that sorting the output will always put them in correct order.
-    outfiles = sorted(glob.glob(temp_image_file_root + "*"))
+    # The selected pages are first split into windows which fit into the temp
+    # space budget (a single window if there is no budget).  The windows are
+    # processed one at a time, and all the images of a window are deleted
+    # before the next one starts.  The pages of a window are split into shards
+    # of contiguous pages, and a renderer process is run on each shard (with up
+    # to `--jobs` of them running at once).  Each shard has a separate filename
+    # root for its image files, and all its pages have the same render settings.
+    if args.renderProfile == "mono":
+        bytes_per_pixel = 1 / 8
+    elif program_to_use == "Ghostscript" or args.renderProfile != "default":
+        bytes_per_pixel = 1 # Grayscale.
+    else:
+        bytes_per_pixel = 3 # Color.
+    windows = split_pages_into_temp_space_windows(input_doc, page_nums,
+                                                  bytes_per_pixel)
+    num_jobs = get_num_jobs()
+    if args.verbose and len(windows) > 1:
+        print("Rendering the pages in {} windows to stay within the temp space"
+              " budget.".format(len(windows)))
+    if args.verbose and num_jobs > 1:
+        print("Running up to {} renderer processes at once.".format(num_jobs))
 
     if args.verbose:
-        print("\nAnalyzing the page images with PIL to find bounding boxes,"
-              "\nusing the threshold " + str(args.threshold[0]) + "."
+        print("\nAnalyzing the page images with PIL as they are rendered to find the"
+              "\nbounding boxes, using the threshold " + str(args.threshold[0]) + "."
               "  Finding the bounding box for page:\n")
 
-    bounding_box_list = []
+    def get_render_settings(page_num):
+        return get_page_render_settings(job.page_geometry_list[page_num], program_to_use)
 
-    for page_num, tmp_image_file_name in enumerate(outfiles):
-        curr_page = input_doc.getPage(page_num)
+    bounding_box_list = [None] * input_doc.getNumPages()
+    for window_page_nums in windows:
+        shards = split_page_runs_into_shards(
+                    get_page_runs(window_page_nums, key=get_render_settings), num_jobs)
+        render_and_analyze_shards(pdf_file_name, input_doc, shards, num_jobs,
+                                  program_to_use, temp_image_file_root,
+                                  bounding_box_list)
 
-        # Open the image in PIL.  Retry a few times on fail in case race conditions.
-        max_num_tries = 3
-        time_between_tries = 1
-        curr_num_tries = 0
-        while True:
-            try:
-                # PIL for some reason fails in Python 3.4 if you open the image
-                # from a file you opened yourself.  Works in Python 2 and earlier
-                # Python 3.  So original code is commented out, and path passed.
-                #
-                # tmpImageFile = open(tmpImageFileName)
-                # im = Image.open(tmpImageFile)
-                im = Image.open(tmp_image_file_name)
-                break
-            except (IOError, UnicodeDecodeError) as e:
-                curr_num_tries += 1
+    if args.verbose:
+        print()
+    return bounding_box_list
+
+def split_pages_into_temp_space_windows(input_doc, page_nums, bytes_per_pixel):
+    """Split the 0-based page numbers in `page_nums` into a list of windows of
+    pages (each a sorted list of page numbers) such that the estimated size of
+    the rendered images of each window fits in the `--tempSpaceBudget`.  The
+    estimate is the size of an uncompressed image with `bytes_per_pixel` bytes
+    per pixel at the rendering resolution.  A window always has at least one
+    page, even if that page alone is over the budget.  A budget of zero means
+    no limit, and a single window is returned."""
+    page_nums = sorted(page_nums)
+    budget_bytes = args.tempSpaceBudget * 2**20 # The budget is in megabytes.
+    if budget_bytes <= 0:
+        return [page_nums] if page_nums else []
+
+    windows = []
+    window_bytes = 0
+    for page_num in page_nums:
+        media_box = job.page_geometry_list[page_num].full_box
+        width_pixels = math.ceil(float(media_box.getWidth()) / 72 * args.resX)
+        height_pixels = math.ceil(float(media_box.getHeight()) / 72 * args.resY)
+        page_bytes = width_pixels * height_pixels * bytes_per_pixel
+        if not windows or window_bytes + page_bytes > budget_bytes:
+            windows.append([])
+            window_bytes = 0
+        windows[-1].append(page_num)
+        window_bytes += page_bytes
+    return windows
+
+def render_and_analyze_shards(pdf_file_name, input_doc, shards, num_jobs,
+                              program_to_use, temp_image_file_root, bounding_box_list):
+    """Render the page shards in the list `shards` to image files and find the
+    bounding boxes of the pages, saving them in `bounding_box_list` (indexed by
+    page number).  The rendering runs in the background while this function
+    analyzes each page image as soon as the renderer has finished writing it,
+    and then deletes the image file.  When this function returns all the image
+    files for the shards have been deleted."""
+    def get_shard_image_file_root(first_page):
+        return "{}{:06d}".format(temp_image_file_root, first_page+1)
+
+    shard_render_settings = {shard: get_page_render_settings(
+                                        job.page_geometry_list[shard[0]], program_to_use)
+                             for shard in shards}
+    finished_shards = set() # The first pages of the shards that are fully rendered.
+    render_exceptions = []
+
+    def render_shard(first_page, last_page):
+        use_crop_box, region = shard_render_settings[(first_page, last_page)]
+        with profile_stage("render_subprocess"):
+            render_pdf_file_to_image_files(pdf_file_name,
+                                           get_shard_image_file_root(first_page),
+                                           program_to_use, first_page+1, last_page+1,
+                                           region=region, use_crop_box=use_crop_box)
+        finished_shards.add(first_page)
+
+    job_state = ex.get_job_state()
+
+    def render_all_shards():
+        try:
+            with ex.job_state_context(job_state):
+                run_in_parallel(render_shard, shards, num_jobs)
+        except BaseException as e:
+            render_exceptions.append(e)
+
+    render_thread = threading.Thread(target=render_all_shards)
+    render_thread.daemon = True
+    render_thread.start()
+
+    # The renderers write the pages of a shard in order, and only start writing
+    # a page image after the previous one is closed.  So every image file of a
+    # shard except the last one found is complete, and all of them are complete
+    # once the shard is finished.  Note that whether the shard is finished must
+    # be checked before looking for its files.
+    unfinished_shards = list(shards)
+    num_analyzed_images = {shard: 0 for shard in shards}
+    while unfinished_shards:
+        if render_exceptions:
+            render_thread.join()
+            raise render_exceptions[0]
+        found_new_images = False
+        for shard in list(unfinished_shards):
+            first_page, last_page = shard
+            shard_is_finished = first_page in finished_shards
+
+            # Currently assuming that sorting the output will always put them in
+            # correct order.
+            outfiles = sorted(glob.glob(get_shard_image_file_root(first_page) + "-*"))
+            num_done = num_analyzed_images[shard]
+            if shard_is_finished:
+                num_expected = last_page - first_page + 1
+                if num_done + len(outfiles) != num_expected:
+                    print("\nError in pdfCropMargins: The " + program_to_use +
+                          " program did\nnot write an image file for each of the"
+                          " pages {} to {}.".format(first_page+1, last_page+1),
+                          file=sys.stderr)
+                    ex.cleanup_and_exit(1)
+                complete_outfiles = outfiles
+                unfinished_shards.remove(shard)
+            else:
+                complete_outfiles = outfiles[:-1]
+
+            is_clipped = shard_render_settings[shard][1] is not None
+            for tmp_image_file_name in complete_outfiles:
+                page_num = first_page + num_done
                 if args.verbose:
-                    print("Warning: Exception opening image", tmp_image_file_name,
-                          "on try", curr_num_tries, "\nError is", e, file=sys.stderr)
-                # tmpImageFile.close() # see above comment
-                if curr_num_tries > max_num_tries: raise # re-raise exception
-                time.sleep(time_between_tries)
+                    print(page_num+1, end=" ") # page num numbering from 1
+                with profile_stage("image_analysis"), profile_page_analysis(page_num):
+                    bounding_box_list[page_num] = get_bounding_box_from_image_file(
+                                       tmp_image_file_name, job.page_geometry_list[page_num],
+                                       is_clipped)
+                num_done += 1
+                found_new_images = True
+            num_analyzed_images[shard] = num_done
+
+        if unfinished_shards and not found_new_images:
+            render_thread.join(0.02) # Wait a little for the renderers to write more.
+    render_thread.join()
+
+def get_bounding_box_from_image_file(tmp_image_file_name, page_geometry,
+                                     is_clipped=False):
+    """Open the rendered page image file `tmp_image_file_name` in PIL, calculate the
+    bounding box for the page with geometry `page_geometry`, and delete the image
+    file.  If `is_clipped` is false then the image is first clipped to the full page
+    box with `clip_rendered_page_image`.  Returns the bounding box."""
+    # Open the image in PIL.  Retry a few times on fail in case race conditions.
+    max_num_tries = 3
+    time_between_tries = 1
+    curr_num_tries = 0
+    while True:
+        try:
+            # PIL for some reason fails in Python 3.4 if you open the image
+            # from a file you opened yourself.  Works in Python 2 and earlier
+            # Python 3.  So original code is commented out, and path passed.
+            #
+            # tmpImageFile = open(tmpImageFileName)
+            # im = Image.open(tmpImageFile)
+            im = Image.open(tmp_image_file_name)
+            break
+        except (IOError, UnicodeDecodeError) as e:
+            curr_num_tries += 1
+            if args.verbose:
+                print("Warning: Exception opening image", tmp_image_file_name,
+                      "on try", curr_num_tries, "\nError is", e, file=sys.stderr)
+            # tmpImageFile.close() # see above comment
+            if curr_num_tries > max_num_tries: raise # re-raise exception
+            time.sleep(time_between_tries)
+
+    if not is_clipped:
+        im = clip_rendered_page_image(im, page_geometry,
+                                      get_page_render_box(page_geometry)[0])
+
+    # Threshold the image and calculate the bounding box of the foreground.
+    bounding_box = calculate_bounding_box_from_image(im, page_geometry)
+
+    # Clean up the image files after they are no longer needed.
+    # tmpImageFile.close() # see above comment
+    profile_report.add_temp_file(tmp_image_file_name)
+    os.remove(tmp_image_file_name)
+    return bounding_box
+
+def get_bounding_box_list_mupdf(pdf_file_name, input_doc, page_nums=None):
+    """Calculate the bounding box list by rendering each page of the PDF in-process
+    with PyMuPDF.  Each page is rendered straight to a grayscale pixmap in memory,
+    so no external program is run and no image files are written to the temp
+    directory.  The full page box of each page, from its `PageGeometry`, is the
+    region rendered.  Only the pages selected for cropping (or the pages in
+    `page_nums`, if set) are rendered; the skipped pages have the value `None` in
+    the returned list."""
+    if page_nums is None:
+        page_nums = job.page_nums_to_crop
+    from . import pymupdf_routines # Only import if needed; the import requires fitz.
 
-        # Apply any blur or smooth operations specified by the user.
-        for i in range(args.numBlurs):
-            im = im.filter(ImageFilter.BLUR)
-        for i in range(args.numSmooths):
-            im = im.filter(ImageFilter.SMOOTH_MORE)
+    if args.verbose:
+        print("\nRendering the PDF pages to grayscale images in memory using PyMuPDF"
+              "\nand analyzing them to find the bounding boxes, using the threshold "
+              + str(args.threshold[0]) + "."
+              "  Finding the bounding box for page:\n")
+
+    document, page_count = pymupdf_routines.open_document(pdf_file_name, args.password)
 
-        # Convert the image to black and white, according to a threshold.
-        # Make a negative image, because that works with the PIL getbbox routine.
+    bounding_box_list = [None] * page_count
+
+    for page_num in sorted(page_nums):
+        page_start_time = get_wall_time()
+        page_geometry = job.page_geometry_list[page_num]
+        x, y, im = render_page_image_mupdf(document, page_num, page_geometry)
 
         if args.verbose:
             print(page_num+1, end=" ") # page num numbering from 1
-        # Note that the point method calls the function on each pixel, replacing it.
-        #im = im.point(lambda p: p > threshold and 255) # create a positive image
-        #im = im.point(lambda p: p < threshold and 255)  # create a negative image
-        # Below code is easier to understand than the tricky use of "and" in evaluation.
-        if not dark_background_light_foreground:
-            im = im.point(lambda p: 255 if p < threshold else 0) # create negative image
-        else:
-            im = im.point(lambda p: 255 if p >= threshold else 0) # create positive image
-
-        if args.showImages:
-            im.show() # usually for debugging or param-setting
 
-        # Calculate the bounding box of the negative image, and append to list.
-        bounding_box = calculate_bounding_box_from_image(im, curr_page)
-        bounding_box_list.append(bounding_box)
+        bounding_box = calculate_bounding_box_from_image(im, page_geometry)
+        bounding_box_list[page_num] = bounding_box
+        profile_report.add_page_analysis_time(page_num, page_start_time)
 
-        # Clean up the image files after they are no longer needed.
-        # tmpImageFile.close() # see above comment
-        os.remove(tmp_image_file_name)
+    document.close()
 
     if args.verbose:
         print()
     return bounding_box_list
 
-def render_pdf_file_to_image_files(pdf_file_name, output_filename_root, program_to_use):
+def get_full_box_pixel_region_mupdf(page_geometry):
+    """Return the region `(left, top, right, bottom)`, in pixels, which the full
+    page box of the page with geometry `page_geometry` covers in the unrotated image
+    of the visible page area (the CropBox) rendered by PyMuPDF."""
+    render_box = get_page_render_box(page_geometry, allow_media_box=False)[0]
+    return get_full_box_pixel_region(page_geometry, render_box,
+                                     args.resX / 72, args.resY / 72)
+
+def render_page_image_mupdf(document, page_num, page_geometry, region=None):
+    """Render the page with 0-based page number `page_num` of the fitz document
+    `document` in memory with PyMuPDF, unrotated.  The `PageGeometry` object
+    `page_geometry` of the page gives the full page box.  If `region` is not set
+    then the full page box is rendered, and any part of it outside the visible page
+    area is white.  Otherwise only the region `(x, y, width, height)` of the full
+    page image, in pixels, is rendered (and it may come out slightly different due
+    to rounding).  Returns a tuple `(x, y, im)` where `im` is the grayscale PIL
+    image and `x` and `y` are its position in the full page image."""
+    from . import pymupdf_routines # Only import if needed; the import requires fitz.
+    left, top, right, bottom = get_full_box_pixel_region_mupdf(page_geometry)
+    full_page_region = (0, 0, right - left, bottom - top)
+    x, y, width, height = region if region else full_page_region
+
+    x, y, width, height, stride, samples = (
+            pymupdf_routines.render_page_region_to_gray_samples(document, page_num,
+                       args.resX, args.resY, (x + left, y + top, width, height)))
+    im = Image.frombytes("L", (width, height), samples, "raw", "L", stride)
+    x, y = x - left, y - top
+
+    if not region and (x, y, width, height) != full_page_region:
+        full_page_im = Image.new("L", full_page_region[2:], "white")
+        full_page_im.paste(im, (x, y))
+        return 0, 0, full_page_im
+    return x, y, im
+
+def is_scanned_page(image_rects, width, height):
+    """Return true if a page of size `width` by `height` with images displayed
+    in the rectangles `image_rects` (in page coordinates) looks like a scanned
+    page.  That is the case when any single image covers at least half the page,
+    since then the bounding box can only be found from the pixels."""
+    page_area = width * height
+    for x0, y0, x1, y1 in image_rects:
+        visible_width = min(x1, width) - max(x0, 0)
+        visible_height = min(y1, height) - max(y0, 0)
+        if visible_width > 0 and visible_height > 0 and (
+                visible_width * visible_height >= 0.5 * page_area):
+            return True
+    return False
+
+def get_bounding_box_list_vector(pdf_file_name, input_doc, render_scanned_pages=False):
+    """Calculate the bounding box list from the extents of the text, vector
+    graphics, and images on each page, as found by PyMuPDF, without rendering
+    anything.  Text and graphics drawn in colors which would be background
+    after thresholding are ignored.  Pages which cannot be handled this way are
+    rendered with the PyMuPDF raster engine instead.  These are pages where the
+    extraction fails, pages where nothing is found even though the page has
+    content (such as shadings), and all pages when the threshold is negative
+    (dark background).  If `render_scanned_pages` is true then the pages which
+    look like scans (see `is_scanned_page`) are also rendered, so their
+    bounding boxes come from thresholding the pixels.  Only the pages selected
+    for cropping are processed; the skipped pages have the value `None` in the
+    returned list."""
+    from . import pymupdf_routines # Only import if needed; the import requires fitz.
+
+    threshold, dark_background_light_foreground = get_threshold()
+
+    def is_foreground(color):
+        if color is None: # Images, or unknown colors.
+            return True
+        return any(component * 255 < threshold for component in color)
+
+    if args.verbose:
+        print("\nFinding the bounding boxes from the page contents using PyMuPDF.")
+
+    document, page_count = pymupdf_routines.open_document(pdf_file_name, args.password)
+    bounding_box_list = [None] * page_count
+    raster_page_nums = set() # Pages for the raster fallback.
+    extraction_is_supported = True
+
+    for page_num in sorted(job.page_nums_to_crop):
+        page_start_time = get_wall_time()
+        if dark_background_light_foreground:
+            raster_page_nums.add(page_num)
+            continue
+
+        # The full page box.  The PyMuPDF page coordinates are unrotated, with the
+        # origin at the top left of the CropBox, so the rects are shifted to put
+        # the origin at the top left of the full page box.
+        page_geometry = job.page_geometry_list[page_num]
+        full_box = get_box_floats(page_geometry.full_box)
+        crop_box = get_page_render_box(page_geometry, allow_media_box=False)[0]
+        width, height = full_box[2] - full_box[0], full_box[3] - full_box[1]
+        shift_x, shift_y = crop_box[0] - full_box[0], full_box[3] - crop_box[3]
+
+        def shift_rect(rect):
+            return (rect[0] + shift_x, rect[1] + shift_y,
+                    rect[2] + shift_x, rect[3] + shift_y) + tuple(rect[4:])
+
+        try:
+            if render_scanned_pages and is_scanned_page(
+                    [shift_rect(image_rect) for image_rect in
+                        pymupdf_routines.get_page_image_rects(document, page_num)],
+                    width, height):
+                raster_page_nums.add(page_num)
+                continue
+            content_rects = pymupdf_routines.get_page_content_rects(document, page_num)
+        except NotImplementedError: # The PyMuPDF version cannot extract drawings.
+            extraction_is_supported = False
+            raster_page_nums.add(page_num)
+            continue
+        except (RuntimeError, ValueError):
+            raster_page_nums.add(page_num)
+            continue
+
+        bounding_box = None # The ltrb union of the rects, clipped to the page.
+        for x0, y0, x1, y1, color in (shift_rect(rect) for rect in content_rects):
+            if not is_foreground(color):
+                continue
+            x0, y0 = max(x0, 0), max(y0, 0)
+            x1, y1 = min(x1, width), min(y1, height)
+            if x0 > x1 or y0 > y1:
+                continue
+            if bounding_box is None:
+                bounding_box = [x0, y0, x1, y1]
+            else:
+                bounding_box = [min(bounding_box[0], x0), min(bounding_box[1], y0),
+                                max(bounding_box[2], x1), max(bounding_box[3], y1)]
+
+        if bounding_box is None:
+            if pymupdf_routines.page_has_content_stream(document, page_num):
+                raster_page_nums.add(page_num) # Something there, but not understood.
+                continue
+            bounding_box = [width/2, height/2, width/2, height/2] # An empty page.
+
+        # Convert to the PDF lbrt convention, with the origin at the lower left.
+        bounding_box_list[page_num] = [bounding_box[0], height - bounding_box[3],
+                                       bounding_box[2], height - bounding_box[1]]
+        profile_report.add_page_analysis_time(page_num, page_start_time)
+    document.close()
+
+    if not extraction_is_supported:
+        print("\nWarning in pdfCropMargins: This version of PyMuPDF cannot extract"
+              "\nthe vector graphics of the pages, so the pages are rendered with the"
+              "\nraster engine instead.  The vector and hybrid engines need PyMuPDF"
+              "\n1.18.0 or later.", file=sys.stderr)
+    if raster_page_nums:
+        if args.verbose:
+            print("\nRendering {} of the {} pages with the raster engine."
+                  .format(len(raster_page_nums), len(job.page_nums_to_crop)))
+        raster_bbox_list = get_bounding_box_list_mupdf(pdf_file_name, input_doc,
+                                                       page_nums=raster_page_nums)
+        for page_num in raster_page_nums:
+            bounding_box_list[page_num] = raster_bbox_list[page_num]
+
+    return bounding_box_list
+
+def get_bounding_box_list_coarse_to_fine(pdf_file_name, input_doc):
+    """Calculate the bounding box list in two passes.  The pages are first rendered
+    and analyzed at the low resolution `--coarseRes` to find approximate bounding
+    boxes.  Then only thin strips around each of the four edges of those boxes
+    are rendered at the full resolution, and the exact edges are found from
+    them.  The result is normally the same as rendering the full pages at the
+    full resolution, at a fraction of the cost.  Any page where the edges cannot
+    be found from the strips (such as an empty page, or one whose content
+    reaches the outer side of a strip) is rendered in full at the full
+    resolution.  Works with the pdftoppm and PyMuPDF renderers.  With pdftoppm,
+    rotated pages and pages whose full page box pdftoppm cannot clip out are
+    also rendered in full."""
+    use_mupdf = args.bboxEngine == "mupdf"
+    if use_mupdf:
+        from . import pymupdf_routines # Only import if needed; the import requires fitz.
+        get_full_page_bounding_box_list = get_bounding_box_list_mupdf
+    else:
+        get_full_page_bounding_box_list = get_bounding_box_list_render_image
+
+    # Do the coarse pass on all the selected pages.
+    fine_res_x, fine_res_y = args.resX, args.resY
+    if args.verbose:
+        print("\nFinding approximate bounding boxes at the coarse resolution of {} dpi."
+              .format(args.coarseRes))
+    args.resX = args.resY = args.coarseRes
+    try:
+        coarse_bbox_list = get_full_page_bounding_box_list(pdf_file_name, input_doc)
+    finally:
+        args.resX, args.resY = fine_res_x, fine_res_y
+
+    if args.verbose:
+        print("\nRefining the bounding box edges at {}x{} dpi.".format(args.resX,
+                                                                       args.resY))
+
+    # The strips extend a few coarse pixels to each side of the approximate edges,
+    # plus the distance that the blurs and smooths can spread the content.
+    coarse_pixel_margin = 2 + 2 * (args.numBlurs + args.numSmooths)
+    margin_x = int(math.ceil(coarse_pixel_margin * args.resX / args.coarseRes)) + 2
+    margin_y = int(math.ceil(coarse_pixel_margin * args.resY / args.coarseRes)) + 2
+
+    if use_mupdf:
+        document, page_count = pymupdf_routines.open_document(pdf_file_name,
+                                                              args.password)
+
+    def get_full_page_pixel_size(page_num):
+        page_geometry = job.page_geometry_list[page_num]
+        if use_mupdf:
+            left, top, right, bottom = get_full_box_pixel_region_mupdf(page_geometry)
+            return right - left, bottom - top
+        use_crop_box, page_region = get_page_render_settings(page_geometry, "pdftoppm")
+        if page_region:
+            return page_region[2:]
+        media_box = page_geometry.full_box # The size pdftoppm uses.
+        return (int(math.ceil(float(media_box.getWidth()) * args.resX / 72)),
+                int(math.ceil(float(media_box.getHeight()) * args.resY / 72)))
+
+    def can_render_strips(page_num):
+        if use_mupdf:
+            return True
+        page_geometry = job.page_geometry_list[page_num]
+        use_crop_box, page_region = get_page_render_settings(page_geometry, "pdftoppm")
+        return page_region is not None or (not page_geometry.rotation and
+               get_box_floats(page_geometry.full_box)
+                   == get_page_render_box(page_geometry)[0])
+
+    temp_strip_file_root = os.path.join(ex.job.program_temp_directory,
+                                        ex.temp_file_prefix + "EdgeStrip")
+
+    def render_strip(page_num, edge, region):
+        """Render the region of the page and return the image and its position."""
+        page_geometry = job.page_geometry_list[page_num]
+        if use_mupdf:
+            return render_page_image_mupdf(document, page_num, page_geometry, region)
+        # Shift the region by any clip of the full page box from the rendered page.
+        use_crop_box, page_region = get_page_render_settings(page_geometry, "pdftoppm")
+        page_x, page_y = page_region[:2] if page_region else (0, 0)
+        strip_file_root = "{}{:06d}{}".format(temp_strip_file_root, page_num+1, edge)
+        render_pdf_file_to_image_files(pdf_file_name, strip_file_root, "pdftoppm",
+                       page_num+1, page_num+1, use_crop_box=use_crop_box,
+                       region=(region[0] + page_x, region[1] + page_y) + region[2:])
+        strip_file_name = glob.glob(strip_file_root + "-*")[0]
+        im = Image.open(strip_file_name)
+        im.load()
+        profile_report.add_temp_file(strip_file_name)
+        os.remove(strip_file_name)
+        return region[0], region[1], im
+
+    def find_strip_edge(page_num, edge, region, full_width, full_height):
+        """Return the position of the edge in the full-page pixel coordinates, or
+        `None` if it cannot be found from the strip."""
+        x, y, im = render_strip(page_num, edge, region)
+        strip_bbox = get_pixel_bounding_box_of_image(im)
+        if not strip_bbox:
+            return None
+        width, height = im.size
+        if edge == "left" and not (strip_bbox[0] == 0 and x > 0):
+            return x + strip_bbox[0]
+        if edge == "top" and not (strip_bbox[1] == 0 and y > 0):
+            return y + strip_bbox[1]
+        if edge == "right" and not (strip_bbox[2] == width and x + width < full_width):
+            return x + strip_bbox[2]
+        if edge == "bottom" and not (strip_bbox[3] == height
+                                     and y + height < full_height):
+            return y + strip_bbox[3]
+        return None # The content reaches the outer side of the strip.
+
+    # Find the strips to render for each page, in full-resolution pixels.
+    page_pixel_sizes = {}
+    strip_tasks = [] # List of (page_num, edge, region, full_width, full_height) tuples.
+    full_render_page_nums = set() # Pages which need a full render.
+    for page_num in sorted(job.page_nums_to_crop):
+        media_box = job.page_geometry_list[page_num].full_box
+        full_width, full_height = get_full_page_pixel_size(page_num)
+        page_pixel_sizes[page_num] = (full_width, full_height)
+        left, bottom, right, top = coarse_bbox_list[page_num]
+        if left >= right or bottom >= top or not can_render_strips(page_num):
+            full_render_page_nums.add(page_num) # An empty page, or no strips.
+            continue
+
+        # Convert the approximate box to full-resolution pixels, ltrb convention.
+        scale_x = full_width / float(media_box.getWidth())
+        scale_y = full_height / float(media_box.getHeight())
+        left, right = left * scale_x, right * scale_x
+        top, bottom = full_height - top * scale_y, full_height - bottom * scale_y
+
+        def get_pixel_range(low, high, margin, limit):
+            low = max(0, int(math.floor(low - margin)))
+            high = min(limit, int(math.ceil(high + margin)))
+            return low, high - low
+
+        x_left, width_left = get_pixel_range(left, left, margin_x, full_width)
+        x_right, width_right = get_pixel_range(right, right, margin_x, full_width)
+        x_all, width_all = get_pixel_range(left, right, margin_x, full_width)
+        y_top, height_top = get_pixel_range(top, top, margin_y, full_height)
+        y_bottom, height_bottom = get_pixel_range(bottom, bottom, margin_y, full_height)
+        y_all, height_all = get_pixel_range(top, bottom, margin_y, full_height)
+        for edge, region in [("left", (x_left, y_all, width_left, height_all)),
+                             ("right", (x_right, y_all, width_right, height_all)),
+                             ("top", (x_all, y_top, width_all, height_top)),
+                             ("bottom", (x_all, y_bottom, width_all, height_bottom))]:
+            strip_tasks.append((page_num, edge, region, full_width, full_height))
+
+    # Render and analyze the strips.  The pdftoppm processes are run in parallel.
+    if use_mupdf: # PyMuPDF is not thread safe.
+        strip_edges = [find_strip_edge(*task) for task in strip_tasks]
+        document.close()
+    else:
+        strip_edges = run_in_parallel(find_strip_edge, strip_tasks, get_num_jobs())
+
+    page_edges = {}
+    for (page_num, edge, region, full_width, full_height), value in zip(strip_tasks,
+                                                                        strip_edges):
+        if value is None:
+            full_render_page_nums.add(page_num)
+        page_edges.setdefault(page_num, {})[edge] = value
+
+    bounding_box_list = [None] * input_doc.getNumPages()
+    for page_num, edges in page_edges.items():
+        if page_num in full_render_page_nums:
+            continue
+        full_width, full_height = page_pixel_sizes[page_num]
+        pixel_bbox = (edges["left"], edges["top"], edges["right"], edges["bottom"])
+        bounding_box_list[page_num] = convert_pixel_bounding_box_to_pdf(pixel_bbox,
+                                   full_width, full_height, job.page_geometry_list[page_num])
+
+    # Do a full render of any pages where the strips did not find the edges.
+    if full_render_page_nums:
+        if args.verbose:
+            print("\nRendering {} pages in full at {}x{} dpi.".format(
+                  len(full_render_page_nums), args.resX, args.resY))
+        full_bbox_list = get_full_page_bounding_box_list(pdf_file_name, input_doc,
+                                                 page_nums=full_render_page_nums)
+        for page_num in full_render_page_nums:
+            bounding_box_list[page_num] = full_bbox_list[page_num]
+
+    return bounding_box_list
+
+def render_pdf_file_to_image_files(pdf_file_name, output_filename_root, program_to_use,
+                                   first_page=None, last_page=None, region=None,
+                                   use_crop_box=True):
     """Render all the pages of the PDF file at pdf_file_name to image files with
     path and filename prefix given by output_filename_root.  Any directories must
     have already been created, and the calling program is responsible for
     deleting any directories or image files.  The program program_to_use,
     currently either the string "pdftoppm" or the string "Ghostscript", will be
     called externally.  The image type that the PDF is converted into must to be
-    directly openable by PIL."""
+    directly openable by PIL, and it depends on the `--renderProfile` option.
+    If `first_page` and `last_page` are set then only that range of pages is
+    rendered (with pages numbered from 1).  If `region` is set to a tuple
+    `(x, y, width, height)` of pixel values then only that region of each
+    page is rendered (only pdftoppm supports this).  The pages are rendered
+    with their rotation, and the CropBox is rendered if `use_crop_box` is true
+    and the MediaBox otherwise."""
 
     res_x = str(args.resX)
     res_y = str(args.resY)
+    render_profile = args.renderProfile
+    if region and program_to_use != "pdftoppm":
+        print("Error in renderPdfFileToImageFile: Rendering a region requires pdftoppm.",
+              file=sys.stderr)
+        ex.cleanup_and_exit(1)
+    extra_args = get_password_args(program_to_use)
+    if region:
+        for option, value in zip(["-x", "-y", "-W", "-H"], region):
+            extra_args += [option, str(value)]
+
     if program_to_use == "Ghostscript":
-        if ex.system_os == "Windows": # Windows PIL is more likely to know BMP
+        if use_crop_box:
+            extra_args.append("-dUseCropBox")
+        if render_profile != "default":
+            ex.render_pdf_file_to_image_files__ghostscript_pnm(
+                                  pdf_file_name, output_filename_root, res_x, res_y,
+                                  first_page, last_page, mono=(render_profile == "mono"),
+                                  extra_args=extra_args)
+        elif ex.system_os == "Windows": # Windows PIL is more likely to know BMP
             ex.render_pdf_file_to_image_files__ghostscript_bmp(
-                                  pdf_file_name, output_filename_root, res_x, res_y)
+                                  pdf_file_name, output_filename_root, res_x, res_y,
+                                  first_page, last_page, extra_args=extra_args)
         else: # Linux and Cygwin should be fine with PNG
             ex.render_pdf_file_to_image_files__ghostscript_png(
-                                  pdf_file_name, output_filename_root, res_x, res_y)
+                                  pdf_file_name, output_filename_root, res_x, res_y,
+                                  first_page, last_page, extra_args=extra_args)
     elif program_to_use == "pdftoppm":
-        use_gray = False # this is currently hardcoded, but can be changed to use pgm
-        if use_gray:
+        if use_crop_box:
+            extra_args.append("-cropbox")
+        if render_profile in ("gray", "fast"):
             ex.render_pdf_file_to_image_files_pdftoppm_pgm(
-                pdf_file_name, output_filename_root, res_x, res_y)
+                pdf_file_name, output_filename_root, res_x, res_y,
+                first_page, last_page, antialias=(render_profile == "gray"),
+                extra_args=extra_args)
+        elif render_profile == "mono":
+            ex.render_pdf_file_to_image_files_pdftoppm_pbm(
+                pdf_file_name, output_filename_root, res_x, res_y,
+                first_page, last_page, extra_args=extra_args)
         else:
             ex.render_pdf_file_to_image_files_pdftoppm_ppm(
-                pdf_file_name, output_filename_root, res_x, res_y)
+                pdf_file_name, output_filename_root, res_x, res_y,
+                extra_args=extra_args, first_page=first_page, last_page=last_page)
     else:
         print("Error in renderPdfFileToImageFile: Unrecognized external program.",
               file=sys.stderr)
         ex.cleanup_and_exit(1)
 
-def calculate_bounding_box_from_image(im, curr_page):
-    """This function uses a PIL routine to get the bounding box of the rendered
-    image."""
+def get_threshold():
+    """Return the threshold value from the command-line arguments and a boolean
+    which is true if the image has a dark background and a light foreground (which
+    is indicated by a negative threshold value)."""
+    # Threshold value set in range 0-255, where 0 is black, with 191 default.
+    threshold = args.threshold[0]
+    dark_background_light_foreground = False
+    if threshold < 0:
+        threshold = -threshold
+        dark_background_light_foreground = True
+    return threshold, dark_background_light_foreground
+
+def filter_image(im):
+    """Apply any blur or smooth operations specified by the user to the PIL image
+    `im`.  Returns the new image."""
+    for i in range(args.numBlurs):
+        im = im.filter(ImageFilter.BLUR)
+    for i in range(args.numSmooths):
+        im = im.filter(ImageFilter.SMOOTH_MORE)
+    return im
+
+def threshold_image(im, threshold, dark_background_light_foreground):
+    """Convert the PIL image `im` to black and white according to the threshold.
+    The result is a negative image (foreground pixels nonzero), because that
+    works with the PIL getbbox routine.  Returns the new image."""
+    # Note that the point method calls the function on each pixel, replacing it.
+    # In multi-band images like RGB each band is thresholded separately, so a
+    # pixel is in the foreground if any of its bands is.
+    #im = im.point(lambda p: p > threshold and 255) # create a positive image
+    #im = im.point(lambda p: p < threshold and 255)  # create a negative image
+    # Below code is easier to understand than the tricky use of "and" in evaluation.
+    if not dark_background_light_foreground:
+        im = im.point(lambda p: 255 if p < threshold else 0) # create negative image
+    else:
+        im = im.point(lambda p: 255 if p >= threshold else 0) # create positive image
+    return im
+
+def get_pixel_bounding_box_pil(im, threshold, dark_background_light_foreground):
+    """Return the bounding box of the foreground pixels of the PIL image `im`,
+    using PIL routines.  The box is in pixels, in the ltrb convention of PIL
+    (with the right and bottom values one past the last foreground pixel).
+    Returns `None` if there are no foreground pixels."""
+    im = threshold_image(im, threshold, dark_background_light_foreground)
+    return im.getbbox()
+
+def get_pixel_bounding_box_numpy(im, threshold, dark_background_light_foreground):
+    """Return the bounding box of the foreground pixels of the PIL image `im`,
+    using vectorized NumPy operations.  The result is always the same as that
+    of `get_pixel_bounding_box_pil`.  Multi-band images are first reduced to a
+    single band with the minimum (or, for a dark background, the maximum) over
+    the bands, which gives the same foreground as thresholding each band
+    separately."""
+    if im.mode not in ("L", "RGB"):
+        im = im.convert("RGB" if im.mode in ("P", "RGBA", "CMYK") else "L")
+    if im.mode == "RGB": # The PIL band operations are much faster than NumPy's here.
+        reduce_bands = (ImageChops.darker if not dark_background_light_foreground
+                        else ImageChops.lighter)
+        red, green, blue = im.split()
+        im = reduce_bands(reduce_bands(red, green), blue)
+    pixels = numpy.asarray(im)
+
+    if not dark_background_light_foreground:
+        foreground = pixels < threshold
+    else:
+        foreground = pixels >= threshold
+
+    rows = numpy.flatnonzero(foreground.any(axis=1))
+    if not len(rows):
+        return None
+    columns = numpy.flatnonzero(foreground[rows[0]:rows[-1]+1].any(axis=0))
+    return (int(columns[0]), int(rows[0]), int(columns[-1]) + 1, int(rows[-1]) + 1)
+
+def get_pixel_bounding_box_of_image(im):
+    """Apply any blurs and smoothing to the rendered image `im`, threshold it,
+    and return the bounding box of the foreground pixels in the ltrb convention
+    of PIL, or `None` if there are no foreground pixels.  The thresholding and
+    bounding box calculation use NumPy for single-band images if it is
+    installed, and PIL routines otherwise.  (The PIL `point` method uses a
+    lookup table, and for RGB images it was measured to be faster than reducing
+    the bands first.)"""
+    threshold, dark_background_light_foreground = get_threshold()
+    if im.mode == "1": # From the mono render profile; the filters need 8 bits.
+        im = im.convert("L")
+    im = filter_image(im)
+
+    if args.showImages: # Usually for debugging or param-setting.
+        threshold_image(im, threshold, dark_background_light_foreground).show()
+
+    if hasNumpy and im.mode == "L":
+        return get_pixel_bounding_box_numpy(im, threshold,
+                                            dark_background_light_foreground)
+    return get_pixel_bounding_box_pil(im, threshold, dark_background_light_foreground)
+
+def calculate_bounding_box_from_image(im, page_geometry):
+    """Calculate the bounding box of the rendered image `im` of the page with
+    geometry `page_geometry`, converted to PDF units."""
+    bounding_box = get_pixel_bounding_box_of_image(im)
     x_max, y_max = im.size
-    bounding_box = im.getbbox() # note this uses ltrb convention
+    return convert_pixel_bounding_box_to_pdf(bounding_box, x_max, y_max, page_geometry)
+
+def convert_pixel_bounding_box_to_pdf(bounding_box, x_max, y_max, page_geometry):
+    """Convert the bounding box `bounding_box` in pixels, in the ltrb convention of
+    PIL, to PDF units and the lbrt convention.  The full rendered image of the page
+    with geometry `page_geometry` has size `x_max` by `y_max`.  A `None` box is
+    taken to be an empty page."""
     if not bounding_box:
         #print("\nWarning: could not calculate a bounding box for this page."
         #      "\nAn empty page is assumed.", file=sys.stderr)
@@ -257,7 +1227,7 @@ def calculate_bounding_box_from_image(im, curr_page):
     bounding_box[1] = y_max - bounding_box[1]
     bounding_box[3] = y_max - bounding_box[3]
 
-    full_page_box = curr_page.mediaBox # should have been set already to chosen box
+    full_page_box = page_geometry.full_box
 
     # Convert pixel units to PDF's bp units.
     convert_x = float(full_page_box.getUpperRight_x()
@@ -274,3 +1244,412 @@ def calculate_bounding_box_from_image(im, curr_page):
 
     return final_box
 
+#
+# Fast path for pages which only display a single image, such as scanned pages.
+#
+
+# Content stream operators which do not paint anything by themselves.
+NON_PAINTING_OPERATORS = {
+        "q", "Q", "cm", "gs", "w", "J", "j", "M", "d", "ri", "i", # Graphics state.
+        "g", "G", "rg", "RG", "k", "K", "cs", "CS", "sc", "SC", "scn", "SCN", # Color.
+        "BMC", "BDC", "EMC", "MP", "DP", "BX", "EX", # Marked content, compatibility.
+        "BT", "ET", "Tc", "Tw", "Tz", "TL", "Tf", "Tr", "Ts", "Td", "TD", "Tm", "T*"}
+TEXT_SHOWING_OPERATORS = {"Tj", "TJ", "'", '"'}
+
+def multiply_matrices(m1, m2):
+    """Return the product of the two PDF transformation matrices `m1` and `m2`,
+    each given as a list `[a, b, c, d, e, f]`.  Applying the product is the same
+    as applying `m1` and then `m2`."""
+    return [m1[0]*m2[0] + m1[1]*m2[2], m1[0]*m2[1] + m1[1]*m2[3],
+            m1[2]*m2[0] + m1[3]*m2[2], m1[2]*m2[1] + m1[3]*m2[3],
+            m1[4]*m2[0] + m1[5]*m2[2] + m2[4], m1[4]*m2[1] + m1[5]*m2[3] + m2[5]]
+
+def get_single_image_placement(page, input_doc):
+    """If the only thing the PyPDF2 page `page` paints is a single image XObject,
+    return the image XObject and the transformation matrix it is painted with.
+    Text in the invisible rendering mode (like the text layer of OCRed scans) is
+    allowed.  Otherwise return `None`."""
+    from PyPDF2.pdf import ContentStream # The PyPDF2 1.x location.
+
+    resources = page.get("/Resources")
+    xobjects = resources.getObject().get("/XObject") if resources else None
+    xobjects = xobjects.getObject() if xobjects else {}
+    if len(xobjects) < 1:
+        return None
+    contents = page.getContents()
+    if contents is None:
+        return None
+
+    matrix = [1, 0, 0, 1, 0, 0]
+    text_rendering_mode = 0
+    state_stack = []
+    placement = None
+    for operands, operator in ContentStream(contents, input_doc).operations:
+        if not isinstance(operator, str):
+            operator = operator.decode("latin-1")
+        if operator == "q":
+            state_stack.append((matrix, text_rendering_mode))
+        elif operator == "Q":
+            if not state_stack:
+                return None
+            matrix, text_rendering_mode = state_stack.pop()
+        elif operator == "cm":
+            matrix = multiply_matrices([float(v) for v in operands], matrix)
+        elif operator == "Tr":
+            text_rendering_mode = int(operands[0])
+        elif operator in TEXT_SHOWING_OPERATORS:
+            if text_rendering_mode != 3: # Mode 3 is invisible text.
+                return None
+        elif operator == "Do":
+            xobject = xobjects.get(operands[0])
+            if placement or xobject is None:
+                return None
+            xobject = xobject.getObject()
+            if xobject.get("/Subtype") != "/Image":
+                return None
+            placement = (xobject, matrix)
+        elif operator not in NON_PAINTING_OPERATORS:
+            return None
+    return placement
+
+def get_ccitt_tiff_header(xobject, data_length):
+    """Return the header of a TIFF file which wraps the raw CCITT fax data of the
+    image XObject `xobject`, so PIL can decode it.  Returns `None` if the
+    parameters are not supported."""
+    decode_parms = xobject.get("/DecodeParms", {})
+    if isinstance(decode_parms, list):
+        decode_parms = decode_parms[0] if len(decode_parms) == 1 else {}
+    decode_parms = decode_parms.getObject() if decode_parms else {}
+    if decode_parms.get("/BlackIs1", False):
+        return None
+    k = int(decode_parms.get("/K", 0))
+    compression = 4 if k < 0 else 3 # Group 4 or Group 3 encoding.
+    t4_options = 1 if k > 0 else 0 # Two-dimensional Group 3 encoding if K > 0.
+    width, height = int(xobject["/Width"]), int(xobject["/Height"])
+
+    tags = [(256, 4, width), # ImageWidth
+            (257, 4, height), # ImageLength
+            (258, 3, 1), # BitsPerSample
+            (259, 3, compression), # Compression
+            (262, 3, 0), # PhotometricInterpretation, WhiteIsZero
+            (273, 4, 0), # StripOffsets, set below
+            (278, 4, height), # RowsPerStrip
+            (279, 4, data_length), # StripByteCounts
+            (292, 4, t4_options)] # T4Options
+    header_length = 8 + 2 + 12 * len(tags) + 4
+    tags[5] = (273, 4, header_length)
+    header = struct.pack("<2sHL", b"II", 42, 8) + struct.pack("<H", len(tags))
+    for tag, tag_type, value in tags:
+        header += struct.pack("<HHLL", tag, tag_type, 1, value)
+    return header + struct.pack("<L", 0)
+
+def open_image_xobject(xobject, target_size):
+    """Decode the PyPDF2 image XObject `xobject` into a PIL image.  JPEG images
+    are decoded in draft mode, which scales them down by a factor of 2, 4, or 8
+    while decoding if they are still at least as large as `target_size`.
+    Returns `None` for image types which are not supported."""
+    if xobject.get("/ImageMask") or "/SMask" in xobject or "/Mask" in xobject:
+        return None
+    if "/Decode" in xobject:
+        return None
+    color_space = xobject.get("/ColorSpace")
+    color_space = color_space.getObject() if color_space is not None else None
+    if isinstance(color_space, list) and color_space and color_space[0] == "/ICCBased":
+        num_components = int(color_space[1].getObject().get("/N", 0))
+        color_space = {1: "/DeviceGray", 3: "/DeviceRGB"}.get(num_components)
+    if color_space not in ("/DeviceGray", "/DeviceRGB", "/CalGray", "/CalRGB", None):
+        return None
+
+    image_filter = xobject.get("/Filter")
+    if isinstance(image_filter, list):
+        if len(image_filter) != 1:
+            return None
+        image_filter = image_filter[0]
+    width, height = int(xobject["/Width"]), int(xobject["/Height"])
+
+    if image_filter == "/DCTDecode":
+        im = Image.open(BytesIO(xobject._data)) # The raw JPEG data.
+        im.draft(im.mode, target_size)
+        if im.mode not in ("L", "RGB"):
+            return None
+    elif image_filter == "/CCITTFaxDecode":
+        header = get_ccitt_tiff_header(xobject, len(xobject._data))
+        if header is None:
+            return None
+        im = Image.open(BytesIO(header + xobject._data))
+    elif image_filter in ("/FlateDecode", None):
+        bits_per_component = int(xobject.get("/BitsPerComponent", 8))
+        if color_space in ("/DeviceRGB", "/CalRGB") and bits_per_component == 8:
+            mode = "RGB"
+        elif color_space in ("/DeviceGray", "/CalGray") and bits_per_component == 8:
+            mode = "L"
+        elif color_space in ("/DeviceGray", "/CalGray") and bits_per_component == 1:
+            mode = "1"
+        else:
+            return None
+        im = Image.frombytes(mode, (width, height), xobject.getData())
+    else:
+        return None
+    im.load()
+    return im
+
+def get_bounding_box_list_single_image_pages(input_doc):
+    """Find the bounding boxes of the selected pages which only display a single
+    image (see `get_single_image_placement`), without rendering them.  The
+    embedded image is decoded at its native resolution (or a reduced one, for
+    JPEG images, but not below `--resX` and `--resY`), thresholded like a
+    rendered page image, and the bounding box of the foreground pixels is mapped
+    back to the page through the image placement matrix.  Only images placed
+    without rotation or skew are handled.  Returns a list of bounding boxes with
+    the value `None` for pages which were not handled."""
+    bounding_box_list = [None] * input_doc.getNumPages()
+    num_handled = 0
+    for page_num in sorted(job.page_nums_to_crop):
+        page_start_time = get_wall_time()
+        page = input_doc.getPage(page_num)
+        try:
+            placement = get_single_image_placement(page, input_doc)
+            if not placement:
+                continue
+            xobject, (a, b, c, d, e, f) = placement
+            if b != 0 or c != 0 or a == 0 or d == 0:
+                continue # Rotated, skewed, or degenerate placement.
+            target_size = (max(1, int(abs(a) * args.resX / 72)),
+                           max(1, int(abs(d) * args.resY / 72)))
+            im = open_image_xobject(xobject, target_size)
+        except (PdfReadError, IOError, OSError, ValueError, KeyError, TypeError,
+                AttributeError, AssertionError, NotImplementedError, SyntaxError,
+                struct.error, zlib.error):
+            continue # PyPDF2 or PIL cannot read the image; just render the page.
+        if im is None:
+            continue
+
+        media_box = job.page_geometry_list[page_num].full_box
+        left_x, lower_y = float(media_box.getLowerLeft_x()), float(media_box.getLowerLeft_y())
+        width, height = float(media_box.getWidth()), float(media_box.getHeight())
+
+        pixel_bbox = get_pixel_bounding_box_of_image(im)
+        if pixel_bbox:
+            # The image maps the unit square to the page, with the first row at the top.
+            im_width, im_height = im.size
+            x_values = sorted(a * pixel_bbox[i] / im_width + e - left_x for i in (0, 2))
+            y_values = sorted(d * (1 - pixel_bbox[i] / im_height) + f - lower_y
+                              for i in (1, 3))
+            bounding_box = [max(x_values[0], 0), max(y_values[0], 0),
+                            min(x_values[1], width), min(y_values[1], height)]
+        if not pixel_bbox or (bounding_box[0] > bounding_box[2]
+                              or bounding_box[1] > bounding_box[3]):
+            bounding_box = [width/2, height/2, width/2, height/2] # An empty page.
+        bounding_box_list[page_num] = bounding_box
+        profile_report.add_page_analysis_time(page_num, page_start_time)
+        num_handled += 1
+
+    if args.verbose and num_handled:
+        print("\nFound the bounding boxes of {} single-image pages directly from the"
+              "\nembedded images.".format(num_handled))
+    return bounding_box_list
+
+
+#
+# Page fingerprints.  Pages which are drawn the same way have the same bounding
+# box, so only one page of each group of identical pages needs to be analyzed.
+# The fingerprints also key the per-page entries of the bounding-box cache, so
+# pages which repeat across documents (like title pages, or blank pages with a
+# standard footer) are only analyzed once.
+#
+
+# Keys of the page dict and of the annotation dicts which do not change how a
+# page is drawn, and which are skipped in the fingerprints.  They include the
+# back-references to parent objects, which would otherwise pull in the whole
+# page tree.  Keys are only skipped in those dicts; in any other object, such
+# as a font or an image, the same keys can change what is drawn.
+PAGE_SKIPPED_KEYS = frozenset([
+        "/Parent", "/Thumb", "/B", "/Metadata", "/PieceInfo", "/LastModified",
+        "/ID", "/PZ", "/Dur", "/Trans", "/StructParents"])
+ANNOTATION_SKIPPED_KEYS = frozenset([
+        "/Parent", "/P", "/Dest", "/A", "/StructParent", "/NM", "/M"])
+ANNOTATION_VALUED_KEYS = frozenset(["/Annots", "/Popup", "/IRT"]) # Of a page or annotation.
+
+def get_resolved_objects(reader):
+    """Return the dict of the objects which the PyPDF2 reader `reader` has
+    already read and cached, keyed by `(generation, idnum)` pairs."""
+    resolved_objects = getattr(reader, "resolved_objects", None) # PyPDF2 1.28 and later.
+    if resolved_objects is None:
+        resolved_objects = reader.resolvedObjects
+    return resolved_objects
+
+def get_object_without_caching_streams(pdf_object):
+    """Return the object which the PyPDF2 object `pdf_object` refers to, like
+    `getObject`.  If it is a stream which the reader had not already cached,
+    it is removed from the cache again, so the data of the streams (such as
+    large images) read for the fingerprints is not kept in memory."""
+    if not isinstance(pdf_object, IndirectObject):
+        return pdf_object
+    resolved_objects = get_resolved_objects(pdf_object.pdf)
+    key = (pdf_object.generation, pdf_object.idnum)
+    was_cached = key in resolved_objects
+    resolved_object = pdf_object.getObject()
+    if not was_cached and isinstance(resolved_object, StreamObject):
+        resolved_objects.pop(key, None)
+    return resolved_object
+
+def get_pdf_object_digest(pdf_object, digest_memo, skipped_keys=frozenset()):
+    """Return the SHA-256 digest (as bytes) of the PyPDF2 object `pdf_object` and
+    everything it references.  Indirect objects are hashed by their values rather
+    than their object numbers, so identical objects in different documents have
+    the same digest.  Streams are hashed by their raw data, and are not kept in
+    the cache of the reader.  If `pdf_object` is a dict, the keys in the set
+    `skipped_keys` are skipped; this is `PAGE_SKIPPED_KEYS` for the page dict,
+    and the annotation dicts under its `ANNOTATION_VALUED_KEYS` are then hashed
+    with `ANNOTATION_SKIPPED_KEYS`.  The dict `digest_memo` saves the digests
+    of the indirect objects of the document which were already hashed.  Raises
+    `ValueError` for objects which refer back to themselves."""
+    if isinstance(pdf_object, IndirectObject):
+        key = (pdf_object.idnum, pdf_object.generation, skipped_keys)
+        if key not in digest_memo:
+            digest_memo[key] = None # Marks the object as being hashed.
+            digest_memo[key] = get_pdf_object_digest(
+                      get_object_without_caching_streams(pdf_object), digest_memo,
+                      skipped_keys)
+        if digest_memo[key] is None:
+            raise ValueError("The PDF object {} {} refers back to itself."
+                             .format(*key[:2]))
+        return digest_memo[key]
+
+    if isinstance(pdf_object, DictionaryObject): # Includes the streams.
+        is_stream = isinstance(pdf_object, StreamObject)
+        object_hash = hashlib.sha256(b"stream" if is_stream else b"dict")
+        for key in sorted(pdf_object):
+            if key in skipped_keys:
+                continue
+            value_skipped_keys = frozenset()
+            if skipped_keys and key in ANNOTATION_VALUED_KEYS:
+                value_skipped_keys = ANNOTATION_SKIPPED_KEYS
+            object_hash.update(key.encode("utf-8"))
+            object_hash.update(get_pdf_object_digest(pdf_object.raw_get(key),
+                                                     digest_memo, value_skipped_keys))
+        if is_stream:
+            object_hash.update(hashlib.sha256(pdf_object._data).digest())
+    elif isinstance(pdf_object, ArrayObject): # The items of an "/Annots" array are
+        object_hash = hashlib.sha256(b"array") # hashed with the same skipped keys.
+        for item in pdf_object:
+            object_hash.update(get_pdf_object_digest(item, digest_memo, skipped_keys))
+    else:
+        object_hash = hashlib.sha256(type(pdf_object).__name__.encode("utf-8"))
+        object_data = BytesIO()
+        pdf_object.writeToStream(object_data, None)
+        object_hash.update(object_data.getvalue())
+    return object_hash.digest()
+
+def get_page_fingerprint(page, page_geometry, digest_memo):
+    """Return the fingerprint of the PyPDF2 page `page` with the `PageGeometry`
+    `page_geometry`, as a hex string.  It is a hash of the page dict, including
+    the content streams, the resources, and the annotations, together with the
+    rotation, the original boxes, and the full page box.  Pages with the same
+    fingerprint are drawn identically and have the same bounding box.  The
+    `digest_memo` dict is passed to `get_pdf_object_digest`."""
+    page_hash = hashlib.sha256(get_pdf_object_digest(page, digest_memo,
+                                                     PAGE_SKIPPED_KEYS))
+    page_boxes = [get_box_floats(box) for box in (page_geometry.media_box,
+                                                  page_geometry.crop_box,
+                                                  page_geometry.full_box)]
+    page_hash.update(repr([page_geometry.rotation, page_boxes]).encode("utf-8"))
+    return page_hash.hexdigest()
+
+def page_has_empty_content(page):
+    """Return true if the PyPDF2 page `page` has no annotations and its content
+    streams hold nothing but whitespace, so that nothing at all is drawn."""
+    annotations = page.get("/Annots")
+    if annotations is not None and len(annotations.getObject()):
+        return False
+    contents = page.get("/Contents")
+    if contents is None:
+        return True
+    contents = get_object_without_caching_streams(contents)
+    streams = contents if isinstance(contents, ArrayObject) else [contents]
+    return all(not get_object_without_caching_streams(stream).getData().strip()
+               for stream in streams)
+
+def get_page_fingerprints(input_doc):
+    """Find the fingerprints of the pages selected for cropping.  Returns a tuple
+    `(page_fingerprints, empty_page_nums, duplicate_pages)`.  The dict
+    `page_fingerprints` maps page numbers to fingerprints; pages which could not
+    be fingerprinted are left out.  The set `empty_page_nums` holds the pages
+    which draw nothing, and the dict `duplicate_pages` maps each page whose
+    fingerprint matches an earlier page to the first page with it.  Empty pages
+    are only looked for when an empty page always has an empty bounding box,
+    which is not the case for the light foregrounds of negative thresholds."""
+    skip_empty_pages = args.gsBbox or not get_threshold()[1]
+    page_fingerprints = {}
+    empty_page_nums = set()
+    duplicate_pages = {}
+    first_page_with_fingerprint = {}
+    digest_memo = {}
+    for page_num in sorted(job.page_nums_to_crop):
+        page = input_doc.getPage(page_num)
+        try:
+            if skip_empty_pages and page_has_empty_content(page):
+                empty_page_nums.add(page_num)
+                continue
+            fingerprint = get_page_fingerprint(page, job.page_geometry_list[page_num],
+                                               digest_memo)
+        except (PdfReadError, ValueError, KeyError, TypeError, AttributeError,
+                AssertionError, NotImplementedError, struct.error, zlib.error):
+            continue # Just analyze a page which PyPDF2 cannot read.
+        page_fingerprints[page_num] = fingerprint
+        if fingerprint in first_page_with_fingerprint:
+            duplicate_pages[page_num] = first_page_with_fingerprint[fingerprint]
+        else:
+            first_page_with_fingerprint[fingerprint] = page_num
+
+    if args.verbose and (empty_page_nums or duplicate_pages):
+        print("\nSkipping the analysis of {} empty pages and {} pages identical to"
+              "\nearlier ones.".format(len(empty_page_nums), len(duplicate_pages)))
+    return page_fingerprints, empty_page_nums, duplicate_pages
+
+def get_empty_page_bounding_boxes(empty_page_nums, full_page_box_list):
+    """Return a list with the bounding box of an empty page (in the form the
+    selected engine returns it) for each page in `empty_page_nums`, and `None`
+    for the other pages."""
+    bbox_list = [None] * len(full_page_box_list)
+    for page_num in empty_page_nums:
+        if args.gsBbox:
+            bbox_list[page_num] = [0.0, 0.0, 0.0, 0.0]
+        else:
+            full_box = full_page_box_list[page_num]
+            width, height = full_box[2] - full_box[0], full_box[3] - full_box[1]
+            bbox_list[page_num] = [width/2, height/2, width/2, height/2]
+    return bbox_list
+
+def read_page_cache_entries(page_fingerprints, known_bbox_list):
+    """Look up the pages selected for analysis in the bounding-box cache by their
+    fingerprints in the dict `page_fingerprints`, setting the bounding boxes
+    found in the list `known_bbox_list`.  Returns a dict which maps the page
+    numbers of the pages which were not found to their cache keys."""
+    parameters = bbox_cache.get_bbox_parameters(args)
+    page_cache_keys = {}
+    num_found = 0
+    for page_num in job.page_nums_to_crop:
+        if page_num not in page_fingerprints:
+            continue
+        key = bbox_cache.get_cache_key(page_fingerprints[page_num], parameters)
+        bounding_box = bbox_cache.read_cache_entry(args.bboxCacheDir, key)
+        if isinstance(bounding_box, list) and len(bounding_box) == 4:
+            known_bbox_list[page_num] = bounding_box
+            num_found += 1
+        else:
+            page_cache_keys[page_num] = key
+    if args.verbose and num_found:
+        print("\nFound the bounding boxes of {} pages in the cache directory."
+              .format(num_found))
+    return page_cache_keys
+
+def write_page_cache_entries(page_cache_keys, bbox_list):
+    """Save the bounding boxes in `bbox_list` of the pages in the dict
+    `page_cache_keys` (as returned by `read_page_cache_entries`) in the
+    bounding-box cache."""
+    entries = dict((key, bbox_list[page_num])
+                   for page_num, key in page_cache_keys.items()
+                   if bbox_list[page_num] is not None)
+    bbox_cache.write_cache_entries(args.bboxCacheDir, entries,
+                                   args.bboxCacheSize * 2**20)
@@ -0,0 +1,90 @@
+"""
+
+This module implements the thin client for the `--server` mode (see
+`crop_server.py`).  When the `PDFCROPMARGINS_SERVER` environment variable is
+set to the path of the server's socket, the `pdf-crop-margins` command
+forwards its arguments and current directory to the server instead of
+cropping the file itself.  The module only imports what the client needs, so
+the command starts quickly.
+
+=====================================================================
+
+pdfCropMargins -- a program to crop the margins of PDF files
+Copyright (C) 2014 Allen Barker (Allen.L.Barker@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Source code site: https://github.com/abarker/pdfCropMargins
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import json
+import socket
+
+SERVER_SOCKET_ENV_VAR = "PDFCROPMARGINS_SERVER"
+SERVER_OPTIONS = ("-srv", "--server")
+
+def is_server_command(argv_list):
+    """Return true if the command-line arguments in `argv_list` start a server."""
+    return any(arg in SERVER_OPTIONS or arg.startswith("--server=")
+               for arg in argv_list)
+
+def get_server_socket_path():
+    """Return the socket path set in the environment for the client, or `None`."""
+    return os.environ.get(SERVER_SOCKET_ENV_VAR) or None
+
+def send_request(socket_path, request):
+    """Send the request dict `request` to the server listening on the socket
+    `socket_path`, and return the reply dict.  Raises `socket.error` (an
+    `OSError` in Python 3) if the server cannot be reached, and `ValueError`
+    for a bad reply."""
+    client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client_socket.connect(socket_path)
+        client_socket.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        reply_file = client_socket.makefile("rb")
+        try:
+            reply_line = reply_file.readline()
+        finally:
+            reply_file.close()
+    finally:
+        client_socket.close()
+    if not reply_line:
+        raise ValueError("The server closed the connection without a reply.")
+    return json.loads(reply_line.decode("utf-8"))
+
+def forward_to_server(socket_path, argv_list):
+    """Crop with the command-line arguments `argv_list` by sending them to the
+    server listening on the socket `socket_path`.  The output of the job is
+    printed, and the exit code is returned.  Returns `None` if there is no
+    server to connect to, so the caller can crop the file itself."""
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    request = {"argv": list(argv_list), "cwd": os.getcwd()}
+    try:
+        reply = send_request(socket_path, request)
+    except (socket.error, OSError):
+        return None # No server is listening.
+    except ValueError as e:
+        print("\nError in pdfCropMargins: Bad reply from the server at '{}':\n   {}"
+              .format(socket_path, e), file=sys.stderr)
+        return 1
+    exit_code = reply.get("exit_code", 1)
+    output_stream = sys.stdout if exit_code == 0 else sys.stderr
+    output_stream.write(reply.get("output", ""))
+    output_stream.flush()
+    return exit_code
@@ -0,0 +1,250 @@
+"""
+
+This module defines the `CropJob` class, which crops a PDF file from Python
+code.  Each job has its own parsed options, temporary directory, and external
+executables, in its own `JobState`, so several jobs can run at the same time
+in different threads of one process (such as in a server).  Running a job
+returns a `CropResult` rather than exiting the program.
+
+Example::
+
+    from pdfCropMargins import CropJob
+    result = CropJob(["-p", "20", "-o", "out.pdf", "in.pdf"]).run()
+    if result.exit_code != 0:
+        print(result.output)
+
+=====================================================================
+
+pdfCropMargins -- a program to crop the margins of PDF files
+Copyright (C) 2014 Allen Barker (Allen.L.Barker@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Source code site: https://github.com/abarker/pdfCropMargins
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import os
+import sys
+import time
+import threading
+import traceback
+
+try:
+    from StringIO import StringIO # Python 2, accepts both str and unicode.
+except ImportError:
+    from io import StringIO
+
+from . import external_program_calls as ex
+
+# The lock held while replacing `sys.stdout` and `sys.stderr`.  The argparse
+# prettifier replaces them temporarily, so it is also held while a job parses
+# its arguments.
+stream_lock = threading.Lock()
+num_capturing_jobs = 0 # The number of running jobs which capture their output.
+
+# The options holding file or directory paths, made absolute for jobs run
+# with a working directory other than the process's.
+PATH_OPTIONS = ("outfile", "bboxCacheDir", "writeCropDataToFile", "readCropData",
+                "profileReport")
+EXECUTABLE_PATH_OPTIONS = ("ghostscriptPath", "pdftoppmPath") # Paths or command names.
+EXECUTABLE_ATTRIBUTES = ("gs_executable", "gs_version", "pdftoppm_executable",
+                         "old_pdftoppm_version", "pdftoppm_version")
+
+class JobOutputRouter(object):
+    """A replacement for `sys.stdout` or `sys.stderr` which writes the output
+    of each thread to the `output_stream` of its current job state, if set,
+    and otherwise to the original stream `outstream`."""
+    def __init__(self, outstream):
+        self.outstream = outstream
+
+    def write(self, text):
+        output_stream = ex.get_job_state().output_stream
+        if output_stream is not None:
+            output_stream.write(text)
+        else:
+            self.outstream.write(text)
+
+    def flush(self):
+        if ex.get_job_state().output_stream is None:
+            self.outstream.flush()
+
+    def __getattr__(self, attr):
+        return getattr(self.outstream, attr)
+
+def start_output_capture():
+    """Route `sys.stdout` and `sys.stderr` through `JobOutputRouter` objects
+    while any job capturing its output is running."""
+    global num_capturing_jobs
+    with stream_lock:
+        if num_capturing_jobs == 0:
+            sys.stdout = JobOutputRouter(sys.stdout)
+            sys.stderr = JobOutputRouter(sys.stderr)
+        num_capturing_jobs += 1
+
+def stop_output_capture():
+    """Undo `start_output_capture`, restoring the original streams after the
+    last job capturing its output finishes."""
+    global num_capturing_jobs
+    with stream_lock:
+        num_capturing_jobs -= 1
+        if num_capturing_jobs == 0:
+            if isinstance(sys.stdout, JobOutputRouter):
+                sys.stdout = sys.stdout.outstream
+            if isinstance(sys.stderr, JobOutputRouter):
+                sys.stderr = sys.stderr.outstream
+
+class CropResult(object):
+    """The results of running a `CropJob`.  The `exit_code` is the one the
+    command-line program would exit with, zero on success.  The filenames, the
+    bounding box list and the crop list are `None` if the job ended before they
+    were set (the crop list is also `None` with `--restore`).  The `output` is
+    the text the job printed, if it was captured."""
+    def __init__(self, exit_code, input_doc_fname=None, output_doc_fname=None,
+                 bounding_box_list=None, crop_list=None, output=None, elapsed_time=0.0):
+        self.exit_code = exit_code
+        self.input_doc_fname = input_doc_fname
+        self.output_doc_fname = output_doc_fname
+        self.bounding_box_list = bounding_box_list
+        self.crop_list = crop_list
+        self.output = output
+        self.elapsed_time = elapsed_time
+
+    @property
+    def success(self):
+        return self.exit_code == 0
+
+    def __repr__(self):
+        return ("CropResult(exit_code={!r}, input_doc_fname={!r}, output_doc_fname={!r},"
+                " elapsed_time={:.3f})".format(self.exit_code, self.input_doc_fname,
+                                               self.output_doc_fname, self.elapsed_time))
+
+class CropJob(object):
+    """A job which crops one PDF file.  The `argv_list` is a list of the
+    command-line arguments, as for the `crop` function, including the input
+    filename.  If `capture_output` is true the text the job prints is saved in
+    the result instead of being printed.  A job can be run more than once, and
+    different jobs can run at the same time in different threads.  The
+    interactive options `--gui` and `--queryModifyOriginal` are not
+    supported, and neither is cropping more than one file (use one job for
+    each file).
+
+    Relative paths in the arguments are taken relative to the directory `cwd`,
+    if it is set, rather than the current directory of the process.  The
+    `executables` argument can be passed a dict from `get_job_executables`
+    to reuse the executables found for an earlier job rather than searching
+    for and testing them again."""
+    def __init__(self, argv_list, capture_output=True, cwd=None, executables=None):
+        self.argv_list = list(argv_list)
+        self.capture_output = capture_output
+        self.cwd = cwd
+        self.executables = executables
+
+    def run(self):
+        """Run the job and return a `CropResult`.  Errors in the cropping are
+        returned as a nonzero exit code, with the error messages in the output.
+        Only `KeyboardInterrupt` and `EOFError` are raised."""
+        job_state = ex.JobState()
+        if self.capture_output:
+            job_state.output_stream = StringIO()
+            start_output_capture()
+        exit_code = 0
+        start_time = time.time()
+        try:
+            with ex.job_state_context(job_state):
+                exit_code = self.run_in_job_state()
+        finally:
+            if self.capture_output:
+                stop_output_capture()
+
+        output = job_state.output_stream.getvalue() if self.capture_output else None
+        return CropResult(exit_code,
+                          input_doc_fname=job_state.input_doc_fname,
+                          output_doc_fname=job_state.output_doc_fname,
+                          bounding_box_list=job_state.bounding_box_list,
+                          crop_list=job_state.crop_list,
+                          output=output,
+                          elapsed_time=time.time() - start_time)
+
+    def run_in_job_state(self):
+        """Run the job in the job state set for the current thread, returning
+        the exit code."""
+        # Imported here so that importing the package stays fast.
+        from .prettified_argparse import parse_command_line_arguments
+        from . import main_pdfCropMargins
+        from . import batch_processing
+        try:
+            with stream_lock:
+                parsed_args = parse_command_line_arguments(
+                                   main_pdfCropMargins.cmd_parser, argv_list=self.argv_list)
+            if batch_processing.is_batch_mode(parsed_args):
+                print("\nError in pdfCropMargins: A CropJob crops only one file;"
+                      "\nuse a separate job for each file.", file=sys.stderr)
+                return 1
+            for option, option_name in (("gui", "--gui"),
+                                        ("queryModifyOriginal", "--queryModifyOriginal")):
+                if getattr(parsed_args, option):
+                    print("\nError in pdfCropMargins: The '{}' option cannot be used"
+                          "\nwith a CropJob.".format(option_name), file=sys.stderr)
+                    return 1
+            if self.cwd is not None:
+                make_paths_absolute(parsed_args, self.cwd)
+            if self.executables and not parsed_args.pdftoppmLocal:
+                for attribute in EXECUTABLE_ATTRIBUTES:
+                    setattr(ex.job, attribute, self.executables[attribute])
+            with ex.create_temporary_directory():
+                main_pdfCropMargins.crop_file(parsed_args)
+        except SystemExit as e: # From `cleanup_and_exit` (as `JobExit`) or argparse.
+            return e.code if isinstance(e.code, int) else int(e.code is not None)
+        except (KeyboardInterrupt, EOFError):
+            raise
+        except: # Return unexpected errors as failures of the job.
+            print("\nCaught an unexpected exception in the pdfCropMargins program.",
+                  file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
+            return 1
+        return 0
+
+def make_paths_absolute(parsed_args, cwd):
+    """Make the relative file and directory paths in the parsed command-line
+    arguments `parsed_args` absolute, relative to the directory `cwd`.  The
+    executable options are only changed if they hold a path rather than a
+    command name."""
+    def absolute_path(path):
+        return os.path.join(cwd, os.path.expanduser(path))
+
+    parsed_args.pdf_input_doc = [absolute_path(path) for path in parsed_args.pdf_input_doc]
+    for option in PATH_OPTIONS + EXECUTABLE_PATH_OPTIONS:
+        value = getattr(parsed_args, option)
+        if not value:
+            continue
+        if option in EXECUTABLE_PATH_OPTIONS and os.sep not in value:
+            continue
+        if option == "profileReport" and value == "-": # Written to stdout.
+            continue
+        if isinstance(value, list):
+            setattr(parsed_args, option, [absolute_path(path) for path in value])
+        else:
+            setattr(parsed_args, option, absolute_path(value))
+
+def get_job_executables():
+    """Search for and test the Ghostscript and pdftoppm executables, as a job
+    does, and return a dict of the results which can be passed to `CropJob`."""
+    job_state = ex.JobState()
+    with ex.job_state_context(job_state):
+        ex.init_and_test_pdftoppm_executable()
+        ex.init_and_test_gs_executable()
+    return {attribute: getattr(job_state, attribute)
+            for attribute in EXECUTABLE_ATTRIBUTES}
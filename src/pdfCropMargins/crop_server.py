@@ -0,0 +1,153 @@
+"""
+
+This module implements the `--server` mode, which keeps a warm process with
+all the modules imported and the external executables already found, and
+crops files for clients connecting to it over a Unix domain socket.  The thin
+client is in `crop_client.py`.
+
+The protocol is one line of JSON in each direction for each connection.  The
+request is an object with the "argv" list and the "cwd" string.  The reply
+is an object with the "exit_code" and the "output" text of the job.
+
+=====================================================================
+
+pdfCropMargins -- a program to crop the margins of PDF files
+Copyright (C) 2014 Allen Barker (Allen.L.Barker@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Source code site: https://github.com/abarker/pdfCropMargins
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import stat
+import json
+import socket
+import threading
+import argparse
+
+try:
+    import socketserver
+except ImportError: # Python 2.
+    import SocketServer as socketserver
+
+from .crop_client import send_request
+
+MAX_REQUEST_BYTES = 2**20 # Longer request lines are rejected.
+
+class CropRequestHandler(socketserver.StreamRequestHandler):
+    """Handle one connection to the server, which sends one crop request."""
+    def handle(self):
+        request_line = self.rfile.readline(MAX_REQUEST_BYTES)
+        try:
+            request = json.loads(request_line.decode("utf-8"))
+            argv_list = [str(arg) for arg in request["argv"]]
+            cwd = str(request["cwd"])
+        except (ValueError, KeyError, TypeError):
+            reply = {"exit_code": 1,
+                     "output": "\nError in pdfCropMargins: Bad request to the server.\n"}
+        else:
+            reply = self.server.run_job(argv_list, cwd)
+        self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+class CropServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """A server which runs each request in a `CropJob`, in its own thread.  At
+    most `num_jobs` jobs run at the same time; other requests wait for one to
+    finish.  The executables are found once, when the server starts."""
+    daemon_threads = True
+
+    def __init__(self, socket_path, num_jobs, verbose=False):
+        from .crop_job import get_job_executables
+        socketserver.UnixStreamServer.__init__(self, socket_path, CropRequestHandler)
+        os.chmod(socket_path, 0o600) # Only the user can send requests.
+        self.job_semaphore = threading.BoundedSemaphore(num_jobs)
+        self.executables = get_job_executables()
+        self.verbose = verbose
+
+    def run_job(self, argv_list, cwd):
+        """Run a `CropJob` with the arguments `argv_list` and the working
+        directory `cwd`, and return the reply dict."""
+        from .crop_job import CropJob
+        with self.job_semaphore:
+            result = CropJob(argv_list, cwd=cwd, executables=self.executables).run()
+        if self.verbose:
+            print("Cropped in {:.3f} s with exit code {}: {}".format(
+                  result.elapsed_time, result.exit_code, " ".join(argv_list)))
+            sys.stdout.flush()
+        return {"exit_code": result.exit_code, "output": result.output}
+
+def create_server_cmd_parser():
+    """Return the argparse parser for the server options.  They are described
+    with the other options in `manpage_data.py`."""
+    server_cmd_parser = argparse.ArgumentParser(prog="pdf-crop-margins --server")
+    server_cmd_parser.add_argument("-srv", "--server", required=True, metavar="SOCKET")
+    server_cmd_parser.add_argument("-srvj", "--serverJobs", type=int, default=0,
+                                   metavar="INT")
+    server_cmd_parser.add_argument("-v", "--verbose", action="store_true")
+    return server_cmd_parser
+
+def warm_up_imports():
+    """Import the modules used in cropping, so the jobs do not wait for them."""
+    from . import main_pdfCropMargins
+    from . import calculate_bounding_boxes
+    try:
+        from PIL import Image
+    except ImportError:
+        pass
+
+def run_server(argv_list):
+    """Run the server with the command-line arguments in `argv_list` until it
+    is interrupted, and return the exit code."""
+    from . import external_program_calls as ex
+    server_args = create_server_cmd_parser().parse_args(argv_list)
+    socket_path = os.path.abspath(os.path.expanduser(server_args.server))
+    if not hasattr(socket, "AF_UNIX"):
+        print("\nError in pdfCropMargins: The '--server' option requires Unix domain"
+              "\nsockets, which are not available on this system.", file=sys.stderr)
+        return 1
+    if server_args.serverJobs < 0:
+        print("\nError in pdfCropMargins: The '--serverJobs' argument cannot be"
+              " negative.", file=sys.stderr)
+        return 1
+    num_jobs = server_args.serverJobs or ex.get_available_cpu_count()
+
+    if os.path.exists(socket_path):
+        if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            print("\nError in pdfCropMargins: The server socket path exists and is"
+                  " not a socket:\n   {}".format(socket_path), file=sys.stderr)
+            return 1
+        try: # Only replace the socket if no other server is using it.
+            send_request(socket_path, {})
+        except (socket.error, OSError, ValueError):
+            os.remove(socket_path)
+        else:
+            print("\nError in pdfCropMargins: A server is already listening on the"
+                  " socket\n   {}".format(socket_path), file=sys.stderr)
+            return 1
+
+    warm_up_imports()
+    server = CropServer(socket_path, num_jobs, verbose=server_args.verbose)
+    print("pdfCropMargins server listening on {} with {} job{}.".format(
+          socket_path, num_jobs, "" if num_jobs == 1 else "s"))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+    return 0
@@ -35,6 +35,9 @@ import tempfile
 import glob
 import shutil
 import time
+import math
+import json
+import threading
 import contextlib
 
 # TODO: Clean up finding executable on Windows.  Maybe automatically search for gs if
@@ -82,7 +85,6 @@ gs_executables = (
     ("Darwin", "gs", "gs"),
     ("Windows", "gswin64c.exe", "gswin32c.exe")
 )
-gs_executable = None # Will be set to the executable selected for the platform.
 
 pdftoppm_executables = (
     ("Linux", "pdftoppm", "pdftoppm"),
@@ -90,8 +92,6 @@ pdftoppm_executables = (
     ("Darwin", "pdftoppm", "pdftoppm"),
     ("Windows", "pdftoppm.exe", "pdftoppm.exe")
 )
-pdftoppm_executable = None # Will be set to the executable selected for the platform.
-old_pdftoppm_version = False # Program will check the version and set this if true.
 
 # To find the correct path on Windows from the registry, consider this
 # http://stackoverflow.com/questions/18283574/programatically-locate-gswin32-exe
@@ -142,6 +142,22 @@ def get_parent_directory(path):
         path = os.path.dirname(path)
     return os.path.abspath(os.path.join(path, os.path.pardir))
 
+def replace_file(source_path, destination_path):
+    """Rename `source_path` to `destination_path`, replacing any existing file."""
+    if hasattr(os, "replace"): # Python 3.3 and later.
+        os.replace(source_path, destination_path)
+    else:
+        if sys.platform.startswith("win"):
+            remove_file(destination_path)
+        os.rename(source_path, destination_path)
+
+def remove_file(file_path):
+    """Remove the file `file_path`, ignoring errors if it does not exist."""
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
+
 def glob_if_windows_os(path, exact_num_args=False):
     """Expands any globbing if `system_os` is Windows (DOS doesn't do it).  The
     argument `exact_num_args` can be set to an integer to check for an exact
@@ -179,7 +195,7 @@ def get_temporary_filename(extension="", use_program_temp_dir=True):
     `program_temp_directory` will be deleted on cleanup.)"""
     dir_name = None # Uses the regular system temp dir if None.
     if use_program_temp_dir:
-        dir_name = program_temp_directory
+        dir_name = job.program_temp_directory
     tmp_output_file = tempfile.NamedTemporaryFile(delete=True,
                      prefix=temp_file_prefix, suffix=extension, dir=dir_name, mode="wb")
     tmp_output_filename = tmp_output_file.name
@@ -187,41 +203,124 @@ def get_temporary_filename(extension="", use_program_temp_dir=True):
     return tmp_output_filename
 
 
-# The global directory that all temporary files are written to.  Other modules
-# all use the definition from this module.  This makes it easy to clean up all
-# the possibly large files, even on KeyboardInterrupt, by just deleting this
-# directory.
-program_temp_directory = None # Set by `create_temporary_directory`.
+##
+## The state of a cropping job.
+##
+
+class JobState(object):
+    """The state of one cropping job.  This holds the parsed command-line
+    arguments, the temporary directory, the external executables selected for
+    the job, and the data shared by the functions which calculate the bounding
+    boxes.  Each thread has a current job state, which is set by
+    `job_state_context`.  Threads which have not set one use the default job
+    state, which is the one used by the command-line program."""
+    def __init__(self):
+        self.args = None # The parsed command-line arguments.
+
+        # The directory that all the temporary files of the job are written to.
+        # This makes it easy to clean up all the possibly large files, even on
+        # KeyboardInterrupt, by just deleting this directory.
+        self.program_temp_directory = None # Set by `create_temporary_directory`.
+
+        # Set up an environment variable so Ghostscript will use the
+        # program_temp_directory for its temporary files (to be sure they get
+        # deleted).
+        self.gs_environment = os.environ.copy()
+        self.gs_environment["TMPDIR"] = None # Set by `create_temporary_directory`.
+
+        self.gs_executable = None # Will be set to the executable selected for the platform.
+        self.pdftoppm_executable = None # Will be set to the executable selected for the platform.
+        self.old_pdftoppm_version = False # Program will check the version and set this if true.
+        self.gs_version = None # The first line of the `gs -v` output, when tested.
+        self.pdftoppm_version = None # The first line of the `pdftoppm -v` output, when tested.
+
+        # Set in `get_bounding_box_list` for the bounding-box calculations.
+        self.page_nums_to_crop = None # Set of pages to crop.
+        self.page_geometry_list = None # The `PageGeometry` of each page.
+        self.PdfFileWriter = None
+
+        # The results, set in `process_pdf_file`.
+        self.input_doc_fname = None
+        self.output_doc_fname = None
+        self.bounding_box_list = None
+        self.crop_list = None
+
+        # A stream which the output printed in the job is written to, if set
+        # (see the `crop_job` module).
+        self.output_stream = None
+
+        # The `JobProfile` of the job with the `--profileReport` option (see the
+        # `profile_report` module).
+        self.profile = None
+
+default_job_state = JobState()
+thread_local_data = threading.local()
+
+def get_job_state():
+    """Return the `JobState` of the job running in the current thread."""
+    return getattr(thread_local_data, "job_state", None) or default_job_state
 
-# Set up an environment variable so Ghostscript will use program_temp_directory
-# for its temporary files (to be sure they get deleted).
-gs_environment = os.environ.copy()
-gs_environment["TMPDIR"] = None # Set by `create_temporary_directory`.
+@contextlib.contextmanager
+def job_state_context(job_state):
+    """Make `job_state` the current job state of the thread inside the context.
+    This is used to run a job, and also in any worker threads which a job starts
+    so they see the job state of the thread which started them."""
+    old_job_state = getattr(thread_local_data, "job_state", None)
+    thread_local_data.job_state = job_state
+    try:
+        yield job_state
+    finally:
+        thread_local_data.job_state = old_job_state
+
+class CurrentJobProxy(object):
+    """A stand-in for the current `JobState` of the thread, or for its attribute
+    with the name `attribute_name` if that is set.  Getting or setting an
+    attribute of the proxy gets or sets it on the current object.  The modules
+    use these as module-level variables, like `args`, so the functions of each
+    module see the values of the job they are running for."""
+    def __init__(self, attribute_name=None):
+        object.__setattr__(self, "_attribute_name", attribute_name)
+
+    def get_current_object(self):
+        job_state = get_job_state()
+        if self._attribute_name is None:
+            return job_state
+        return getattr(job_state, self._attribute_name)
+
+    def __getattr__(self, name):
+        return getattr(self.get_current_object(), name)
+
+    def __setattr__(self, name, value):
+        if isinstance(value, CurrentJobProxy): # Save the object itself, not a proxy.
+            value = value.get_current_object()
+        setattr(self.get_current_object(), name, value)
+
+job = CurrentJobProxy() # The current job state.
+args = CurrentJobProxy("args") # The parsed command-line arguments of the current job.
 
 @contextlib.contextmanager
 def create_temporary_directory():
-    """Create and set the `program_temp_directory` temporary directory and return the
-    name.  Cleanup on exit from the context manager."""
-    global program_temp_directory
-    program_temp_directory = tempfile.mkdtemp(prefix=temp_dir_prefix)
-    gs_environment["TMPDIR"] = program_temp_directory
+    """Create and set the `program_temp_directory` temporary directory of the
+    current job and return the name.  Cleanup on exit from the context manager."""
+    job.program_temp_directory = tempfile.mkdtemp(prefix=temp_dir_prefix)
+    job.gs_environment["TMPDIR"] = job.program_temp_directory
 
     try:
-        yield program_temp_directory
+        yield job.program_temp_directory
     finally:
         remove_program_temp_directory()
-        program_temp_directory = None
-        gs_environment["TMPDIR"] = None
+        job.program_temp_directory = None
+        job.gs_environment["TMPDIR"] = None
 
 def remove_program_temp_directory():
-    """Remove the global temp directory and all its contents."""
-    if program_temp_directory and os.path.exists(program_temp_directory):
+    """Remove the temp directory of the current job and all its contents."""
+    if job.program_temp_directory and os.path.exists(job.program_temp_directory):
         max_retries = 3
         curr_retries = 0
         time_between_retries = 1
         while True:
             try:
-                shutil.rmtree(program_temp_directory)
+                shutil.rmtree(job.program_temp_directory)
                 break
             except IOError:
                 curr_retries += 1
@@ -232,14 +331,22 @@ def remove_program_temp_directory():
                 print("Cleaning up temp dir...", file=sys.stderr)
                 raise
 
+class JobExit(SystemExit):
+    """Raised by `cleanup_and_exit` instead of exiting the program when a job
+    set up by `job_state_context` ends, so the caller can return its results.
+    It is a subclass of `SystemExit`, so it is handled like a program exit."""
+
 def cleanup_and_exit(exit_code, stack_frame=None):
     """Exit the program, after cleaning up the temporary directory.  The `stack_frame`
     argument is for when `signal.signal` calls the function.  The returned `exit_code`
-    is the signal number."""
+    is the signal number.  For jobs with their own job state only the job ends,
+    by raising `JobExit`."""
     if stack_frame is not None:
         print("\nThe process of pdf-crop-margins was killed by signal {}..."
                 .format(exit_code), file=sys.stderr)
     remove_program_temp_directory()
+    if get_job_state() is not default_job_state:
+        raise JobExit(exit_code)
     sys.exit(exit_code)
 
 
@@ -252,6 +359,57 @@ project_src_directory = get_parent_directory(program_code_directory)
 ## General utility functions for running external processes.
 ##
 
+def get_cgroup_cpu_quota():
+    """Return the CPU quota of the cgroup that this process runs in, as a
+    (possibly fractional) number of CPUs, or `None` if there is no quota.  Both
+    the cgroup v2 `cpu.max` file and the cgroup v1 CFS quota and period files
+    are checked.  Container runtimes like Docker set these when a container is
+    limited with an option like `--cpus`.  Only Linux has cgroups."""
+    if system_os != "Linux":
+        return None
+    try: # The cgroup v2 file has the form "<quota> <period>", with "max" for no limit.
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota == "max":
+            return None
+        return float(quota) / float(period)
+    except (IOError, OSError, ValueError):
+        pass
+    try: # The cgroup v1 files, with a quota of -1 for no limit.
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+def get_available_cpu_count():
+    """Return the number of CPUs that this process can actually use.  Unlike
+    `multiprocessing.cpu_count`, this takes into account the CPU affinity mask
+    and any cgroup CPU quota set by a container runtime.  The result is always
+    at least one."""
+    try:
+        cpu_count = len(os.sched_getaffinity(0)) # Not available on all systems.
+    except AttributeError:
+        import multiprocessing
+        try:
+            cpu_count = multiprocessing.cpu_count()
+        except NotImplementedError:
+            cpu_count = 1
+    cpu_quota = get_cgroup_cpu_quota()
+    if cpu_quota:
+        cpu_count = min(cpu_count, int(math.ceil(cpu_quota)))
+    return max(1, cpu_count)
+
+def count_subprocess(command_list):
+    """Count the subprocess about to be run in the profile of the current job,
+    if it is profiled."""
+    if job.profile is not None:
+        job.profile.count_subprocess(command_list)
+
 def get_external_subprocess_output(command_list, print_output=False, indent_string="",
                       split_lines=True, ignore_called_process_errors=False, env=None):
     """Run the command and arguments in the command_list.  Will search the system
@@ -264,6 +422,7 @@ def get_external_subprocess_output(command_list, print_output=False, indent_stri
     # be sure to capture the stderr along with the stdout.
 
     print_output = False # Useful for debugging to set True.
+    count_subprocess(command_list)
 
     try:
         use_popen = True # Needs to be True to set ignore_called_process_errors True
@@ -280,8 +439,7 @@ def get_external_subprocess_output(command_list, print_output=False, indent_stri
             output = subprocess.check_output(command_list, stderr=subprocess.STDOUT,
                                              shell=False, env=env)
     except:
-        from .main_pdfCropMargins import args
-        if args.verbose:
+        if job.args is not None and args.verbose:
             print("\nException when trying to run this subprocess"
                   " command:\n   {}".format(command_list), file=sys.stderr)
         raise
@@ -309,6 +467,7 @@ def call_external_subprocess(command_list,
     stdout = open(stdout_filename, "w") if stdout_filename else None
     stderr = open(stderr_filename, "w") if stderr_filename else None
 
+    count_subprocess(command_list)
     subprocess.check_call(command_list, stdin=stdin, stdout=stdout, stderr=stderr,
                           env=env)
 
@@ -321,6 +480,7 @@ def call_external_subprocess(command_list,
 
 def run_external_subprocess_in_background(command_list, env=None):
     """Runs the command and arguments in the list as a background process."""
+    count_subprocess(command_list)
     if system_os == "Windows":
         DETACHED_PROCESS = 0x00000008
         p = subprocess.Popen(command_list, shell=False, stdin=None, stdout=None,
@@ -338,21 +498,45 @@ def set_gs_executable_to_string(gs_executable_path):
     """Used to simply set the value to whatever the user asks for.  The path
     is not tested first, and takes priority over all other settings."""
     # Maybe test run these, too, at some point.
-    global gs_executable
-    gs_executable = gs_executable_path
+    job.gs_executable = gs_executable_path
 
 def init_and_test_gs_executable(exit_on_fail=False):
     """Find a Ghostscript executable and test it.  If a good one is found, set
-    this module's global gs_executable variable to that path and return that
+    the `gs_executable` of the current job to that path and return that
     path.  Otherwise return None.  Any path string set from the command line
-    gets priority, and is not tested."""
+    gets priority, and is not tested.  The results are saved in the
+    executable cache, and reused while the executables are unchanged."""
+
+    if job.gs_executable:
+        return job.gs_executable # Has already been set to a path.
+
+    candidate_names = get_candidate_executable_names(gs_executables)
+    cached_results = read_executable_cache_entry("gs", candidate_names)
+    if cached_results:
+        job.gs_executable = cached_results["executable"]
+        job.gs_version = cached_results["version"]
+    else:
+        job.gs_executable, job.gs_version = find_gs_executable()
+        if job.gs_executable or system_os not in ("Windows", "Cygwin"):
+            write_executable_cache_entry("gs", candidate_names,
+                                         {"executable": job.gs_executable,
+                                          "version": job.gs_version})
 
-    global gs_executable
-    if gs_executable:
-        return gs_executable # Has already been set to a path.
+    if exit_on_fail and not job.gs_executable:
+        print("Error in pdfCropMargins (detected in external_program_calls.py):"
+              "\nNo Ghostscript executable was found.  Be sure your PATH is"
+              "\nset properly.  You can use the `--ghostscriptPath` option to"
+              "\nexplicitly set the path from the command line.", file=sys.stderr)
+        cleanup_and_exit(1)
+
+    return job.gs_executable
 
+def find_gs_executable():
+    """Search for a Ghostscript executable and test it.  Returns a tuple of the
+    executable path and its version string, or `(None, None)` if none works."""
     # First try basic names against the PATH.
-    gs_executable = find_and_test_executable(gs_executables, ["-dSAFER", "-v"], "Ghostscript")
+    gs_executable, output = find_and_test_executable(gs_executables, ["-dSAFER", "-v"],
+                                                     "Ghostscript", return_output=True)
 
     # If that fails, on Windows or Cygwin look in the Program Files gs directory for it.
     if not gs_executable and (system_os == "Windows" or system_os == "Cygwin"):
@@ -370,39 +554,72 @@ def init_and_test_gs_executable(exit_on_fail=False):
         gs_execs = (("Windows", gs64, gs32), ("Cygwin",
                                               convert_windows_path_to_cygwin(gs64),
                                               convert_windows_path_to_cygwin(gs32)))
-        gs_executable = find_and_test_executable(gs_execs,
-                                                 ["-dSAFER", "-v"], "Ghostscript")
-
-    if exit_on_fail and not gs_executable:
-        print("Error in pdfCropMargins (detected in external_program_calls.py):"
-              "\nNo Ghostscript executable was found.  Be sure your PATH is"
-              "\nset properly.  You can use the `--ghostscriptPath` option to"
-              "\nexplicitly set the path from the command line.", file=sys.stderr)
-        cleanup_and_exit(1)
+        gs_executable, output = find_and_test_executable(gs_execs, ["-dSAFER", "-v"],
+                                                         "Ghostscript", return_output=True)
 
-    return gs_executable
+    return gs_executable, get_version_line(output)
 
 def set_pdftoppm_executable_to_string(pdftoppm_executable_path):
     """Used to simply set the value to whatever the user asks for.  The path
     is not tested first, and takes priority over all other settings."""
     # Maybe test run these, too, at some point.
-    global pdftoppm_executable
-    pdftoppm_executable = pdftoppm_executable_path
+    job.pdftoppm_executable = pdftoppm_executable_path
 
 def init_and_test_pdftoppm_executable(prefer_local=False, exit_on_fail=False):
     """Find a pdftoppm executable and test it.  If a good one is found, set
-    this module's global pdftoppm_executable variable to that path and return
+    the `pdftoppm_executable` of the current job to that path and return
     that string.  Otherwise return None.  Any path string set from the
-    command line gets priority, and is not tested."""
-    ignore_called_process_errors = False
+    command line gets priority, and is not tested.  Unless the local
+    executable is preferred, the results are saved in the executable cache,
+    and reused while the executables are unchanged."""
+    if job.pdftoppm_executable:
+        return job.pdftoppm_executable # Has already been set to a path.
+
+    candidate_names = get_candidate_executable_names(pdftoppm_executables)
+    cached_results = None
+    if not prefer_local:
+        cached_results = read_executable_cache_entry("pdftoppm", candidate_names)
+    if cached_results:
+        job.pdftoppm_executable = cached_results["executable"]
+        job.old_pdftoppm_version = cached_results["old_version"]
+        job.pdftoppm_version = cached_results["version"]
+    else:
+        (job.pdftoppm_executable, job.old_pdftoppm_version, job.pdftoppm_version,
+                is_local_executable) = find_pdftoppm_executable(prefer_local, exit_on_fail)
+
+        # The local executable is not cached, so the warning about using it is
+        # printed on every run.  Not finding one is not cached on Windows
+        # either, since the local executable is tried then.
+        if not prefer_local and not is_local_executable and (
+                job.pdftoppm_executable or system_os not in ("Windows", "Cygwin")):
+            write_executable_cache_entry("pdftoppm", candidate_names,
+                                         {"executable": job.pdftoppm_executable,
+                                          "old_version": job.old_pdftoppm_version,
+                                          "version": job.pdftoppm_version})
+
+    if exit_on_fail and not job.pdftoppm_executable:
+        print("Error in pdfCropMargins (detected in external_program_calls.py):"
+              "\nNo pdftoppm executable was found.  Be sure your PATH is set"
+              "\ncorrectly.  You can explicitly set the path from the command"
+              "\nline with the `--pdftoppmPath` option.", file=sys.stderr)
+        cleanup_and_exit(1)
 
-    global pdftoppm_executable
-    if pdftoppm_executable:
-        return pdftoppm_executable # Has already been set to a path.
+    return job.pdftoppm_executable
 
-    pdftoppm_executable = find_and_test_executable(
+def find_pdftoppm_executable(prefer_local=False, exit_on_fail=False):
+    """Search for a pdftoppm executable and test it, falling back to the
+    locally-packaged one on Windows.  Returns a tuple of the executable path,
+    whether it is an old version, its version string, and whether it is the
+    local executable.  The path is `None` if none works."""
+    ignore_called_process_errors = False
+    is_local_executable = False
+    old_pdftoppm_version = False
+
+    pdftoppm_executable, output = find_and_test_executable(
                               pdftoppm_executables, ["-v"], "pdftoppm",
-                              ignore_called_process_errors=ignore_called_process_errors)
+                              ignore_called_process_errors=ignore_called_process_errors,
+                              return_output=True)
+    pdftoppm_version = get_version_line(output)
 
     # If we're on Windows and either no pdftoppm was found or prefer_local was
     # specified then use the local pdftoppm.exe distributed with the project.
@@ -437,34 +654,31 @@ def init_and_test_pdftoppm_executable(prefer_local=False, exit_on_fail=False):
                 cleanup_and_exit(1)
 
         ignore_called_process_errors = True # Local Windows pdftoppm returns code 99 but works.
-        local_pdftoppm_executable = find_and_test_executable(
+        local_pdftoppm_executable, output = find_and_test_executable(
                               pdftoppm_local_execs, ["-v"], "pdftoppm",
-                              ignore_called_process_errors=ignore_called_process_errors)
+                              ignore_called_process_errors=ignore_called_process_errors,
+                              return_output=True)
         if not local_pdftoppm_executable:
             print("\nWarning from pdfCropMargins: The local pdftoppm.exe program failed"
                   "\nto execute correctly or was not found (see additional error"
                   " message if not found).", file=sys.stderr)
         else:
             pdftoppm_executable = local_pdftoppm_executable
-
-    if exit_on_fail and not pdftoppm_executable:
-        print("Error in pdfCropMargins (detected in external_program_calls.py):"
-              "\nNo pdftoppm executable was found.  Be sure your PATH is set"
-              "\ncorrectly.  You can explicitly set the path from the command"
-              "\nline with the `--pdftoppmPath` option.", file=sys.stderr)
-        cleanup_and_exit(1)
+            pdftoppm_version = get_version_line(output)
+            is_local_executable = True
 
     if pdftoppm_executable: # Found a version of pdftoppm, see if it's ancient or recent.
         cmd = [pdftoppm_executable, "--help"]
         run_output = get_external_subprocess_output(cmd, split_lines=False,
                                ignore_called_process_errors=ignore_called_process_errors)
         if not "-singlefile " in run_output or not "-rx " in run_output:
-            global old_pdftoppm_version
             old_pdftoppm_version = True
-    return pdftoppm_executable
+
+    return (pdftoppm_executable, old_pdftoppm_version, pdftoppm_version,
+            is_local_executable)
 
 def find_and_test_executable(executables, argument_list, string_to_look_for,
-                          ignore_called_process_errors=False):
+                          ignore_called_process_errors=False, return_output=False):
     """Try to run the executable for the current system with the given arguments
     and look in the output for the given test string.  The executables argument
     should be a tuple of tuples.  The internal tuples should be 3-tuples
@@ -476,7 +690,10 @@ def find_and_test_executable(executables, argument_list, string_to_look_for,
     respect to the relevant PATH environment variable.  On 64 bit machines the
     32 bit version is always tried if the 64 bit version fails.  Returns the
     working executable name for the system, or the None if both fail.  Ignores
-    empty executable strings."""
+    empty executable strings.  If `return_output` is true then a tuple of the
+    executable and its output is returned, with the output `None` if both
+    fail."""
+    not_found = (None, None) if return_output else None
     for system_paths in executables:
         if system_paths[0] != system_os:
             continue
@@ -492,14 +709,146 @@ def find_and_test_executable(executables, argument_list, string_to_look_for,
                               split_lines=False,
                               ignore_called_process_errors=ignore_called_process_errors)
                 if string_to_look_for in run_output:
+                    if return_output:
+                        return executable_path, run_output
                     return executable_path
             except (subprocess.CalledProcessError, OSError, IOError) as e:
                 # OSError if it isn't found, CalledProcessError if it runs but returns
                 # fail.
                 pass
+        return not_found
+    return not_found
+
+def get_version_line(run_output):
+    """Return the first nonblank line of the output `run_output` of running an
+    executable with its version option, or `None` if there is no output."""
+    if not run_output:
         return None
+    for line in run_output.splitlines():
+        if line.strip():
+            return line.strip()
     return None
 
+##
+## The cache of the executables found and their test results, saved between
+## runs so that unchanged executables do not need to be run to test them.
+##
+
+EXECUTABLE_CACHE_FILE_NAME = "executables.json"
+EXECUTABLE_CACHE_FORMAT_VERSION = 1
+
+def get_user_cache_directory():
+    """Return the per-user cache directory of the program, in the usual location
+    for the operating system."""
+    if sys.platform.startswith("win"):
+        base_directory = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base_directory = os.path.expanduser(os.path.join("~", "Library", "Caches"))
+    else:
+        base_directory = (os.environ.get("XDG_CACHE_HOME")
+                          or os.path.expanduser(os.path.join("~", ".cache")))
+    return os.path.join(base_directory, "pdfCropMargins")
+
+def get_candidate_executable_names(executables):
+    """Return the list of the executable names for the current system in the
+    tuple of tuples `executables`, in the form used by `find_and_test_executable`."""
+    candidate_names = []
+    for system_paths in executables:
+        if system_paths[0] == system_os:
+            candidate_names = [system_paths[1], system_paths[2]]
+            if system_bits == 32:
+                del candidate_names[0]
+            break
+    return [name for name in candidate_names if name]
+
+def which_executable(executable_name):
+    """Return the path of the file which would be run for the command
+    `executable_name`, by searching the PATH without running anything.  Returns
+    `None` if no executable file is found."""
+    if hasattr(shutil, "which"): # Python 3.3 and later.
+        return shutil.which(executable_name)
+    from distutils.spawn import find_executable
+    return find_executable(executable_name)
+
+def get_executable_signature(executable_name):
+    """Return a list of the real path, modification time, inode number, and size
+    of the file which would be run for the command `executable_name`, or `None`
+    if there is no such file.  When the signature changes the executable needs
+    to be tested again."""
+    executable_path = which_executable(executable_name)
+    if not executable_path:
+        return None
+    try:
+        stat = os.stat(executable_path)
+    except OSError:
+        return None
+    return [os.path.realpath(executable_path), stat.st_mtime, stat.st_ino, stat.st_size]
+
+def get_executable_cache_validation(candidate_names, executable):
+    """Return the data which a cache entry must have been saved with to be
+    valid: the format version, the system, the PATH, and the signatures of
+    the candidate executables `candidate_names` and of the found executable
+    `executable`.  This is a dict which is unchanged by a round trip through
+    JSON."""
+    names = list(candidate_names)
+    if executable and executable not in names:
+        names.append(executable)
+    return {"format_version": EXECUTABLE_CACHE_FORMAT_VERSION,
+            "system": [system_os, system_bits],
+            "path": os.environ.get("PATH", ""),
+            "signatures": {name: get_executable_signature(name) for name in names}}
+
+def get_executable_cache_path():
+    """Return the path of the executable cache file."""
+    return os.path.join(get_user_cache_directory(), EXECUTABLE_CACHE_FILE_NAME)
+
+def read_executable_cache():
+    """Return the dict of all the entries in the executable cache, or an empty
+    dict if it cannot be read."""
+    try:
+        with open(get_executable_cache_path(), "r") as f:
+            cache = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+def read_executable_cache_entry(program_name, candidate_names):
+    """Return the dict of the results saved in the executable cache for the
+    program `program_name` (such as "gs"), if they are still valid for the
+    candidate executables `candidate_names`.  Otherwise return `None`."""
+    try:
+        entry = read_executable_cache()[program_name]
+        validation = get_executable_cache_validation(candidate_names,
+                                                     entry["results"]["executable"])
+        if entry["validation"] != validation:
+            return None
+        return entry["results"]
+    except (KeyError, TypeError):
+        return None
+
+def write_executable_cache_entry(program_name, candidate_names, results):
+    """Save the dict of test results `results` for the program `program_name` in
+    the executable cache, along with the validation data for the candidate
+    executables `candidate_names`.  Failures to write are ignored, since the
+    cache is only an optimization."""
+    cache = read_executable_cache()
+    cache[program_name] = {"validation": get_executable_cache_validation(
+                                             candidate_names, results["executable"]),
+                           "results": results}
+    cache_directory = get_user_cache_directory()
+    try:
+        if not os.path.isdir(cache_directory):
+            os.makedirs(cache_directory)
+        fd, temp_path = tempfile.mkstemp(prefix=".tmp_", dir=cache_directory)
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(cache, f)
+        replace_file(temp_path, get_executable_cache_path())
+    except (IOError, OSError):
+        remove_file(temp_path)
+
 
 ##
 ## Functions that call Ghostscript to fix PDFs or get bounding boxes.
@@ -509,15 +858,15 @@ def fix_pdf_with_ghostscript_to_tmp_file(input_doc_fname):
     """Attempt to fix a bad PDF file with a Ghostscript command, writing the output
     PDF to a temporary file and returning the filename.  Caller is responsible for
     deleting the file (but it is created in the temp directory)."""
-    if not gs_executable:
+    if not job.gs_executable:
         init_and_test_gs_executable(exit_on_fail=True)
 
     temp_file_name = get_temporary_filename(extension=".pdf")
-    gs_run_command = [gs_executable, "-dSAFER", "-o", temp_file_name,
+    gs_run_command = [job.gs_executable, "-dSAFER", "-o", temp_file_name,
                     "-dPDFSETTINGS=/prepress", "-sDEVICE=pdfwrite", input_doc_fname]
     try:
         gs_output = get_external_subprocess_output(gs_run_command, print_output=True,
-                                             indent_string="   ", env=gs_environment)
+                                             indent_string="   ", env=job.gs_environment)
     except subprocess.CalledProcessError:
         print("\nError in pdfCropMargins:  Ghostscript returned a non-zero exit"
               "\nstatus when attempting to fix the file:\n   ", input_doc_fname,
@@ -530,10 +879,23 @@ def fix_pdf_with_ghostscript_to_tmp_file(input_doc_fname):
               file=sys.stderr)
     return temp_file_name
 
-def get_bounding_box_list_ghostscript(input_doc_fname, res_x, res_y, full_page_box):
+def get_page_range_args_ghostscript(first_page=None, last_page=None):
+    """Return the list of Ghostscript arguments to select the page range from
+    `first_page` to `last_page`, numbered from 1.  Either can be `None`."""
+    page_range_args = []
+    if first_page is not None:
+        page_range_args.append("-dFirstPage={}".format(first_page))
+    if last_page is not None:
+        page_range_args.append("-dLastPage={}".format(last_page))
+    return page_range_args
+
+def get_bounding_box_list_ghostscript(input_doc_fname, res_x, res_y, full_page_box,
+                                      first_page=None, last_page=None, extra_args=None):
     """Call Ghostscript to get the bounding box list.  Cannot set a threshold
-    with this method."""
-    if not gs_executable:
+    with this method.  If `first_page` or `last_page` are set then only that
+    range of pages is processed (with pages numbered from 1).  Extra arguments
+    can be passed as a list in `extra_args`."""
+    if not job.gs_executable:
         init_and_test_gs_executable(exit_on_fail=True)
 
     res = "{}x{}".format(res_x, res_y)
@@ -543,14 +905,16 @@ def get_bounding_box_list_ghostscript(input_doc_fname, res_x, res_y, full_page_b
     if "a" in full_page_box: box_arg = "-dUseArtBox"
     if "b" in full_page_box: box_arg = "-dUseBleedBox" # may not be defined in gs
 
-    gs_run_command = [gs_executable, "-dSAFER", "-dNOPAUSE", "-dBATCH", "-sDEVICE=bbox",
-                    box_arg, "-r"+res, input_doc_fname]
+    gs_run_command = ([job.gs_executable, "-dSAFER", "-dNOPAUSE", "-dBATCH", "-sDEVICE=bbox",
+                       box_arg, "-r"+res]
+                      + get_page_range_args_ghostscript(first_page, last_page)
+                      + (extra_args or []) + [input_doc_fname])
 
     # Set printOutput to True for debugging or extra-verbose with Ghostscript's output.
     # Note Ghostscript writes the data to stderr, so the command below must capture it.
     try:
         gs_output = get_external_subprocess_output(gs_run_command,
-                          print_output=False, indent_string="   ", env=gs_environment)
+                          print_output=False, indent_string="   ", env=job.gs_environment)
     except UnicodeDecodeError:
         print("\nError in pdfCropMargins:  In attempting to get the bounding boxes"
               "\nGhostscript encountered characters which cannot be decoded by the"
@@ -579,67 +943,128 @@ def get_bounding_box_list_ghostscript(input_doc_fname, res_x, res_y, full_page_b
     return bounding_box_list
 
 def render_pdf_file_to_image_files_pdftoppm_ppm(pdf_file_name, root_output_file_path,
-                                           res_x=150, res_y=150, extra_args=None):
+                                           res_x=150, res_y=150, extra_args=None,
+                                           first_page=None, last_page=None):
     """Use the pdftoppm program to render a PDF file to .png images.  The
     root_output_file_path is prepended to all the output files, which have numbers
     and extensions added.  Extra arguments can be passed as a list in extra_args.
-    Return the command output."""
+    If `first_page` or `last_page` are set then only that range of pages is
+    rendered (with pages numbered from 1).  Return the command output."""
     if extra_args is None:
         extra_args = []
+    else:
+        extra_args = list(extra_args)
+    if first_page is not None:
+        extra_args += ["-f", str(first_page)]
+    if last_page is not None:
+        extra_args += ["-l", str(last_page)]
 
-    if not pdftoppm_executable:
+    if not job.pdftoppm_executable:
         init_and_test_pdftoppm_executable(prefer_local=False, exit_on_fail=True)
 
-    if old_pdftoppm_version:
+    if job.old_pdftoppm_version:
         # We only have -r, not -rx and -ry.
-        command = [pdftoppm_executable] + extra_args + ["-r", res_x, pdf_file_name,
+        command = [job.pdftoppm_executable] + extra_args + ["-r", res_x, pdf_file_name,
                                               root_output_file_path]
     else:
-        command = [pdftoppm_executable] + extra_args + ["-rx", res_x, "-ry", res_y,
+        command = [job.pdftoppm_executable] + extra_args + ["-rx", res_x, "-ry", res_y,
                                               pdf_file_name, root_output_file_path]
     comm_output = get_external_subprocess_output(command)
     return comm_output
 
 def render_pdf_file_to_image_files_pdftoppm_pgm(pdf_file_name, root_output_file_path,
-                                           res_x=150, res_y=150):
-    """Same as renderPdfFileToImageFile_pdftoppm_ppm but with -gray option for pgm."""
+                                           res_x=150, res_y=150,
+                                           first_page=None, last_page=None,
+                                           antialias=True, extra_args=None):
+    """Same as renderPdfFileToImageFile_pdftoppm_ppm but with -gray option for pgm.
+    If `antialias` is false then anti-aliasing of text and vector graphics is
+    turned off."""
+    extra_args = ["-gray"] + (extra_args or [])
+    if not antialias:
+        extra_args += ["-aa", "no", "-aaVector", "no"]
+    comm_output = render_pdf_file_to_image_files_pdftoppm_ppm(pdf_file_name,
+                                        root_output_file_path, res_x, res_y, extra_args,
+                                        first_page, last_page)
+    return comm_output
 
+def render_pdf_file_to_image_files_pdftoppm_pbm(pdf_file_name, root_output_file_path,
+                                           res_x=150, res_y=150,
+                                           first_page=None, last_page=None,
+                                           extra_args=None):
+    """Same as renderPdfFileToImageFile_pdftoppm_ppm but with -mono option for
+    1-bit pbm images."""
+    extra_args = ["-mono"] + (extra_args or [])
     comm_output = render_pdf_file_to_image_files_pdftoppm_ppm(pdf_file_name,
-                                        root_output_file_path, res_x, res_y, ["-gray"])
+                                        root_output_file_path, res_x, res_y, extra_args,
+                                        first_page, last_page)
     return comm_output
 
 def render_pdf_file_to_image_files__ghostscript_png(pdf_file_name,
                                                     root_output_file_path,
-                                                    res_x=150, res_y=150):
+                                                    res_x=150, res_y=150,
+                                                    first_page=None, last_page=None,
+                                                    extra_args=None):
     """Use Ghostscript to render a PDF file to .png images.  The `root_output_file_path`
     is prepended to all the output files, which have numbers and extensions added.
-    Return the command output."""
+    If `first_page` or `last_page` are set then only that range of pages is
+    rendered (with pages numbered from 1).  Extra arguments can be passed as a
+    list in `extra_args`.  Return the command output."""
     # For gs commands see
     # http://ghostscript.com/doc/current/Devices.htm#File_formats
     # http://ghostscript.com/doc/current/Devices.htm#PNG
-    if not gs_executable: init_and_test_gs_executable(exit_on_fail=True)
-    command = [gs_executable, "-dBATCH", "-dNOPAUSE", "-sDEVICE=pnggray",
-               "-r"+res_x+"x"+res_y, "-sOutputFile="+root_output_file_path+"-%06d.png",
-               pdf_file_name]
-    comm_output = get_external_subprocess_output(command, env=gs_environment)
+    if not job.gs_executable: init_and_test_gs_executable(exit_on_fail=True)
+    command = ([job.gs_executable, "-dBATCH", "-dNOPAUSE", "-sDEVICE=pnggray",
+                "-r"+res_x+"x"+res_y, "-sOutputFile="+root_output_file_path+"-%06d.png"]
+               + get_page_range_args_ghostscript(first_page, last_page)
+               + (extra_args or []) + [pdf_file_name])
+    comm_output = get_external_subprocess_output(command, env=job.gs_environment)
     return comm_output
 
 def render_pdf_file_to_image_files__ghostscript_bmp(pdf_file_name,
                                                     root_output_file_path,
-                                                    res_x=150, res_y=150):
+                                                    res_x=150, res_y=150,
+                                                    first_page=None, last_page=None,
+                                                    extra_args=None):
     """Use Ghostscript to render a PDF file to .bmp images.  The `root_output_file_path`
     is prepended to all the output files, which have numbers and extensions added.
-    Return the command output."""
+    If `first_page` or `last_page` are set then only that range of pages is
+    rendered (with pages numbered from 1).  Extra arguments can be passed as a
+    list in `extra_args`.  Return the command output."""
     # For gs commands see
     # http://ghostscript.com/doc/current/Devices.htm#File_formats
     # http://ghostscript.com/doc/current/Devices.htm#BMP
     # These are the BMP devices:
     #    bmpmono bmpgray bmpsep1 bmpsep8 bmp16 bmp256 bmp16m bmp32b
-    if not gs_executable: init_and_test_gs_executable(exit_on_fail=True)
-    command = [gs_executable, "-dBATCH", "-dNOPAUSE", "-sDEVICE=bmpgray",
-               "-r"+res_x+"x"+res_y, "-sOutputFile="+root_output_file_path+"-%06d.bmp",
-               pdf_file_name]
-    comm_output = get_external_subprocess_output(command, env=gs_environment)
+    if not job.gs_executable: init_and_test_gs_executable(exit_on_fail=True)
+    command = ([job.gs_executable, "-dBATCH", "-dNOPAUSE", "-sDEVICE=bmpgray",
+                "-r"+res_x+"x"+res_y, "-sOutputFile="+root_output_file_path+"-%06d.bmp"]
+               + get_page_range_args_ghostscript(first_page, last_page)
+               + (extra_args or []) + [pdf_file_name])
+    comm_output = get_external_subprocess_output(command, env=job.gs_environment)
+    return comm_output
+
+def render_pdf_file_to_image_files__ghostscript_pnm(pdf_file_name,
+                                                    root_output_file_path,
+                                                    res_x=150, res_y=150,
+                                                    first_page=None, last_page=None,
+                                                    mono=False, extra_args=None):
+    """Use Ghostscript to render a PDF file to raw (binary) .pgm images, or to
+    1-bit .pbm images if `mono` is true.  These formats have no compression, so
+    they are fast to write and to read back.  The `root_output_file_path` is
+    prepended to all the output files, which have numbers and extensions added.
+    If `first_page` or `last_page` are set then only that range of pages is
+    rendered (with pages numbered from 1).  Extra arguments can be passed as a
+    list in `extra_args`.  Return the command output."""
+    # http://ghostscript.com/doc/current/Devices.htm#PNM
+    if not job.gs_executable: init_and_test_gs_executable(exit_on_fail=True)
+    device, extension = ("pbmraw", "pbm") if mono else ("pgmraw", "pgm")
+    command = ([job.gs_executable, "-dBATCH", "-dNOPAUSE", "-sDEVICE="+device,
+                "-dTextAlphaBits=1", "-dGraphicsAlphaBits=1", # No anti-aliasing.
+                "-r"+res_x+"x"+res_y,
+                "-sOutputFile="+root_output_file_path+"-%06d."+extension]
+               + get_page_range_args_ghostscript(first_page, last_page)
+               + (extra_args or []) + [pdf_file_name])
+    comm_output = get_external_subprocess_output(command, env=job.gs_environment)
     return comm_output
 
 
@@ -0,0 +1,252 @@
+"""
+
+This module writes the cropped document as a PDF incremental update.  The
+bytes of the original PDF file are copied unchanged, and an update section
+is appended which redefines only the modified page dictionaries and the
+document information dictionary, followed by a new cross-reference section
+which points back to the original one.  Everything in the original part of
+the file, such as object streams, signature byte ranges, and linearization
+hints, stays intact.
+
+=====================================================================
+
+pdfCropMargins -- a program to crop the margins of PDF files
+Copyright (C) 2014 Allen Barker (Allen.L.Barker@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Source code site: https://github.com/abarker/pdfCropMargins
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import os
+import re
+import shutil
+import struct
+
+from PyPDF2.generic import (NameObject, NumberObject, ArrayObject,
+                            DictionaryObject, IndirectObject)
+
+# The number of bytes at the end of the file searched for the `startxref` keyword.
+STARTXREF_SEARCH_SIZE = 1024
+
+def find_last_xref(pdf_file):
+    """Return a tuple `(offset, is_stream)` for the last cross-reference section
+    of the open binary PDF file `pdf_file`, as given by the final `startxref`
+    keyword.  The boolean `is_stream` is true if the section is a
+    cross-reference stream rather than a classic `xref` table.  Raises
+    `ValueError` if it cannot be found."""
+    pdf_file.seek(0, os.SEEK_END)
+    file_size = pdf_file.tell()
+    pdf_file.seek(max(0, file_size - STARTXREF_SEARCH_SIZE))
+    file_end = pdf_file.read()
+    match = None
+    for match in re.finditer(br"startxref\s+(\d+)", file_end):
+        pass
+    if not match:
+        raise ValueError("No startxref keyword was found at the end of the file.")
+    offset = int(match.group(1))
+    if offset >= file_size:
+        raise ValueError("The startxref offset is past the end of the file.")
+    pdf_file.seek(offset)
+    is_stream = not pdf_file.read(4).startswith(b"xref")
+    return offset, is_stream
+
+def get_trailer_size(input_doc):
+    """Return the `/Size` value of the trailer of the `PdfFileReader` object
+    `input_doc`, one greater than the largest object number.  PyPDF2 does not
+    copy it to the trailer from cross-reference streams, so in that case it is
+    found from the cross-reference data read by PyPDF2."""
+    if "/Size" in input_doc.trailer:
+        return int(input_doc.trailer["/Size"])
+    object_numbers = list(input_doc.xref_objStm)
+    for generation_xref in input_doc.xref.values():
+        object_numbers.extend(generation_xref)
+    return max(object_numbers) + 1
+
+def get_page_parent_refs(input_doc):
+    """Return a dict which maps the `(idnum, generation)` pair of each page
+    reference in the page tree of the `PdfFileReader` object `input_doc` to the
+    `IndirectObject` reference of its parent node.  The tree is read from the
+    document catalog, since `PdfFileWriter.addPage` replaces the `/Parent` of
+    the page dicts themselves with a reference into the writer."""
+    parent_refs = {}
+    pages_ref = input_doc.trailer["/Root"].raw_get("/Pages")
+    node_refs = [pages_ref] if isinstance(pages_ref, IndirectObject) else []
+    visited = set()
+    while node_refs:
+        node_ref = node_refs.pop()
+        node_key = (node_ref.idnum, node_ref.generation)
+        if node_key in visited: # Guard against loops in a broken page tree.
+            continue
+        visited.add(node_key)
+        kids = node_ref.getObject().get("/Kids")
+        for kid_ref in (kids.getObject() if kids is not None else []):
+            if not isinstance(kid_ref, IndirectObject):
+                continue
+            parent_refs[(kid_ref.idnum, kid_ref.generation)] = node_ref
+            if kid_ref.getObject().get("/Type") == "/Pages":
+                node_refs.append(kid_ref)
+    return parent_refs
+
+def write_object(pdf_file, ref, pdf_object):
+    """Write the indirect object `pdf_object` with the `IndirectObject` reference
+    `ref` at the end of the open binary PDF file `pdf_file`, and return its
+    offset."""
+    offset = pdf_file.tell()
+    pdf_file.write("{} {} obj\n".format(ref.idnum, ref.generation).encode("ascii"))
+    pdf_object.writeToStream(pdf_file, None)
+    pdf_file.write(b"\nendobj\n")
+    return offset
+
+def get_xref_subsections(object_numbers):
+    """Group the sorted list of object numbers `object_numbers` into a list of
+    `(first_object_number, count)` tuples for the contiguous runs."""
+    subsections = []
+    for object_number in object_numbers:
+        if subsections and sum(subsections[-1]) == object_number:
+            subsections[-1] = (subsections[-1][0], subsections[-1][1] + 1)
+        else:
+            subsections.append((object_number, 1))
+    return subsections
+
+def write_xref_table(pdf_file, xref_entries, trailer):
+    """Write a classic cross-reference table with the entries in the dict
+    `xref_entries`, which maps object numbers to `(offset, generation)` tuples,
+    followed by the trailer dict `trailer`."""
+    xref_offset = pdf_file.tell()
+    object_numbers = sorted(xref_entries)
+    # The section starts with the head of the free list, object zero, as usual.
+    # Some readers assume that a table which does not start with object zero
+    # has incorrect object numbers.
+    pdf_file.write(b"xref\n0 1\n0000000000 65535 f \n")
+    for first_object_number, count in get_xref_subsections(object_numbers):
+        pdf_file.write("{} {}\n".format(first_object_number, count).encode("ascii"))
+        for object_number in range(first_object_number, first_object_number + count):
+            offset, generation = xref_entries[object_number]
+            pdf_file.write("{:010d} {:05d} n \n".format(offset, generation)
+                           .encode("ascii"))
+    pdf_file.write(b"trailer\n")
+    trailer.writeToStream(pdf_file, None)
+    pdf_file.write("\nstartxref\n{}\n%%EOF\n".format(xref_offset).encode("ascii"))
+
+def write_xref_stream(pdf_file, xref_entries, trailer):
+    """Write an uncompressed cross-reference stream with the entries in the dict
+    `xref_entries` (as for `write_xref_table`).  The stream object uses the
+    object number given by the `/Size` value in the trailer dict `trailer`, and
+    its dict holds the trailer entries."""
+    xref_offset = pdf_file.tell()
+    xref_object_number = int(trailer["/Size"])
+    xref_entries = dict(xref_entries)
+    xref_entries[xref_object_number] = (xref_offset, 0)
+    object_numbers = sorted(xref_entries)
+
+    offset_width = max(1, (xref_offset.bit_length() + 7) // 8)
+    stream_data = bytearray()
+    for object_number in object_numbers:
+        offset, generation = xref_entries[object_number]
+        stream_data.append(1) # Type 1, an uncompressed object.
+        stream_data.extend(struct.pack(">Q", offset)[-offset_width:])
+        stream_data.extend(struct.pack(">H", generation))
+
+    index = ArrayObject()
+    for first_object_number, count in get_xref_subsections(object_numbers):
+        index.extend([NumberObject(first_object_number), NumberObject(count)])
+    stream_dict = DictionaryObject(trailer)
+    stream_dict.update({
+          NameObject("/Type"): NameObject("/XRef"),
+          NameObject("/Size"): NumberObject(xref_object_number + 1),
+          NameObject("/Index"): index,
+          NameObject("/W"): ArrayObject([NumberObject(1), NumberObject(offset_width),
+                                         NumberObject(2)]),
+          NameObject("/Length"): NumberObject(len(stream_data)),
+          })
+
+    pdf_file.write("{} 0 obj\n".format(xref_object_number).encode("ascii"))
+    stream_dict.writeToStream(pdf_file, None)
+    pdf_file.write(b"\nstream\n")
+    pdf_file.write(bytes(stream_data))
+    pdf_file.write(b"\nendstream\nendobj\n")
+    pdf_file.write("startxref\n{}\n%%EOF\n".format(xref_offset).encode("ascii"))
+
+def write_incremental_update(original_doc_fname, output_doc_fname, input_doc,
+                             page_nums, info_dict):
+    """Copy the PDF file `original_doc_fname` to `output_doc_fname` and append an
+    incremental update to it.  The update redefines the pages of the
+    `PdfFileReader` object `input_doc` (which must have been read from the
+    original file) with the 0-based page numbers in `page_nums`, as they are
+    currently set in `input_doc` but with their parents in the original page
+    tree.  It also sets the entries of the dict
+    `info_dict` in the document information dictionary, keeping any other
+    entries from the original one.  The cross-reference section is written in
+    the same form as the last one in the original file.  Encrypted documents
+    are not supported, since the new objects would be written unencrypted.
+    Raises `ValueError` if the update cannot be written."""
+    if input_doc.isEncrypted:
+        raise ValueError("Incremental updates of encrypted documents are not supported.")
+    old_trailer = input_doc.trailer
+    size = get_trailer_size(input_doc)
+
+    shutil.copyfile(original_doc_fname, output_doc_fname)
+    with open(output_doc_fname, "r+b") as pdf_file:
+        prev_xref_offset, xref_is_stream = find_last_xref(pdf_file)
+        pdf_file.seek(-1, os.SEEK_END)
+        if pdf_file.read(1) not in (b"\n", b"\r"):
+            pdf_file.write(b"\n")
+
+        xref_entries = {} # Maps object numbers to (offset, generation) tuples.
+        parent_refs = get_page_parent_refs(input_doc)
+        for page_num in sorted(page_nums):
+            page = input_doc.getPage(page_num)
+            ref = page.indirectRef
+            if ref is None:
+                raise ValueError("Page {} is not an indirect object.".format(page_num+1))
+            parent_ref = parent_refs.get((ref.idnum, ref.generation))
+            if parent_ref is None:
+                raise ValueError("Page {} is not in the page tree.".format(page_num+1))
+            page_dict = DictionaryObject(page)
+            page_dict[NameObject("/Parent")] = parent_ref
+            xref_entries[ref.idnum] = (write_object(pdf_file, ref, page_dict),
+                                       ref.generation)
+
+        # The new info dict replaces the old one if that was an indirect object.
+        old_info_ref = old_trailer.raw_get("/Info") if "/Info" in old_trailer else None
+        new_info_dict = DictionaryObject()
+        if old_info_ref is not None:
+            new_info_dict.update(old_info_ref.getObject())
+        new_info_dict.update(info_dict)
+        if isinstance(old_info_ref, IndirectObject):
+            info_ref = IndirectObject(old_info_ref.idnum, old_info_ref.generation,
+                                      input_doc)
+        else:
+            info_ref = IndirectObject(size, 0, input_doc)
+            size += 1
+        xref_entries[info_ref.idnum] = (write_object(pdf_file, info_ref, new_info_dict),
+                                        info_ref.generation)
+
+        trailer = DictionaryObject()
+        trailer.update({
+              NameObject("/Size"): NumberObject(max(size, max(xref_entries) + 1)),
+              NameObject("/Root"): old_trailer.raw_get("/Root"),
+              NameObject("/Info"): info_ref,
+              NameObject("/Prev"): NumberObject(prev_xref_offset),
+              })
+        if "/ID" in old_trailer:
+            trailer[NameObject("/ID")] = old_trailer.raw_get("/ID")
+
+        if xref_is_stream:
+            write_xref_stream(pdf_file, xref_entries, trailer)
+        else:
+            write_xref_table(pdf_file, xref_entries, trailer)
@@ -51,25 +51,54 @@ import sys
 import os
 import shutil
 import time
+import json
 
 from . import __version__ # Get the version number from the __init__.py file.
 from .manpage_data import cmd_parser, DEFAULT_THRESHOLD_VALUE
 from .prettified_argparse import parse_command_line_arguments
 
 from . import external_program_calls as ex
+from . import bbox_cache
+from . import batch_processing
+from . import crop_client
+from . import profile_report
+from .profile_report import profile_stage
 project_src_directory = ex.project_src_directory
 
-try:
-    from PyPDF2 import PdfFileWriter, PdfFileReader
-    from PyPDF2.generic import (NameObject, createStringObject, RectangleObject,
-                                FloatObject, IndirectObject)
-    from PyPDF2.utils import PdfReadError
-except ImportError:
-    print("\nError in pdfCropMargins: No system pyPdf Python package"
-          " was found.\n", file=sys.stderr)
-    raise
+# PyPDF2 and the modules which use it (and PIL) are slow to import, so they are
+# only imported by `import_pdf_modules` when a file is actually cropped.  That
+# way `--help`, `--version`, and errors in the arguments exit quickly.
+PdfFileWriter = PdfFileReader = None
+NameObject = createStringObject = RectangleObject = FloatObject = IndirectObject = None
+PdfReadError = get_bounding_box_list = write_incremental_update = None
+
+def import_pypdf2_modules():
+    """Import PyPDF2, setting the module-level names used for it.  This is all
+    that the '--checkPrevCropped' option needs."""
+    global PdfFileWriter, PdfFileReader, NameObject, createStringObject
+    global RectangleObject, FloatObject, IndirectObject, PdfReadError
+    if PdfFileReader is not None:
+        return # Already imported.
+    try:
+        from PyPDF2 import PdfFileWriter, PdfFileReader
+        from PyPDF2.generic import (NameObject, createStringObject, RectangleObject,
+                                    FloatObject, IndirectObject)
+        from PyPDF2.utils import PdfReadError
+    except ImportError:
+        print("\nError in pdfCropMargins: No system pyPdf Python package"
+              " was found.\n", file=sys.stderr)
+        raise
+
+def import_pdf_modules():
+    """Import PyPDF2 and the modules of the program which use it (which also
+    import PIL and numpy), setting the module-level names used for them."""
+    global get_bounding_box_list, write_incremental_update
+    import_pypdf2_modules()
+    if get_bounding_box_list is not None:
+        return # Already imported.
 
-from .calculate_bounding_boxes import get_bounding_box_list
+    from .calculate_bounding_boxes import get_bounding_box_list
+    from .incremental_update import write_incremental_update
 
 ##
 ## Some data used by the program.
@@ -77,8 +106,10 @@ from .calculate_bounding_boxes import get_bounding_box_list
 
 # The string which is appended to Producer metadata in cropped PDFs.
 PRODUCER_MODIFIER = " (Cropped by pdfCropMargins.)"
+CROP_DATA_FORMAT_NAME = "pdfCropMargins crop data" # Identifies JSON crop-data files.
+CROP_DATA_FORMAT_VERSION = 1
 
-args = None # Global set during cmd-line processing (since almost all funs use it).
+args = ex.args # The args of the current job, set during cmd-line processing.
 
 ##
 ## Begin general function definitions.
@@ -185,47 +216,55 @@ def mod_box_for_rotation(box, angle, undo=False):
     else:
         return rotate_ninety_degrees_clockwise(box, undo_map[angle])
 
-def get_full_page_box_assigning_media_and_crop(page, skip_pre_crop=False):
+class PageGeometry(object):
+    """The geometry of one page of the input document.  The document is parsed
+    only once, and the page objects of its `PdfFileReader` are not modified
+    while the crops are calculated.  Instead, the original boxes and rotation
+    of each page are read into one of these objects, which also records the
+    full page box and any boxes to be changed.  The changes are applied to the
+    page objects by `apply_page_geometry_list`, just before the output document
+    is written.  The boxes are `RectangleObject` boxes."""
+
+    def __init__(self, page):
+        # Find the page rotation angle (degrees).
+        # Note rotation is clockwise, and four values are allowed: 0 90 180 270
+        try:
+            rotation = page["/Rotate"].getObject() # this works, needs try
+            #rotation = page.get("/Rotate", 0) # from the PyPDF2 source, default 0
+        except KeyError:
+            rotation = 0
+        while rotation >= 360: rotation -= 360
+        while rotation < 0: rotation += 360
+        self.rotation = rotation
+
+        # The original boxes.  PyPDF2 returns the default value of any box which
+        # is not set on the page, as given in the PDF standard.
+        self.media_box = page.mediaBox
+        self.crop_box = page.cropBox
+        self.trim_box = page.trimBox
+        self.art_box = page.artBox
+        self.bleed_box = page.bleedBox
+
+        self.full_box = None # Set by `get_full_page_box`.
+        self.boxes_to_set = {} # Maps pyPdf box attribute names to new boxes.
+
+def get_full_page_box(page_geometry, skip_pre_crop=False):
     """This returns whatever PDF box was selected (by the user option
     '--fullPageBox') to represent the full page size.  All cropping is done
     relative to this box.  The default selection option is the MediaBox
     intersected with the CropBox so multiple crops work as expected.
 
-    The argument page should be a pyPdf page object.
-
-    This function also sets the MediaBox and CropBox of the page to the
-    full-page size and saves the old values in the same page namespace, so it
-    should only be called once for each page.  It returns a `RectangleObject`
-    box."""
+    The argument `page_geometry` should be the `PageGeometry` object for the
+    page.  The box is saved in it as the `full_box` attribute, and returned as
+    a `RectangleObject` box."""
     # Note skip_pre_crop option isn't used, may or may not be useful.
-
-    # Find the page rotation angle (degrees).
-    # Note rotation is clockwise, and four values are allowed: 0 90 180 270
-    try:
-        rotation = page["/Rotate"].getObject() # this works, needs try
-        #rotation = page.get("/Rotate", 0) # from the PyPDF2 source, default 0
-    except KeyError:
-        rotation = 0
-    while rotation >= 360: rotation -= 360
-    while rotation < 0: rotation += 360
-
-    # Save the rotation value in the page's namespace so we can restore it later.
-    page.rotationAngle = rotation
-
-    # Un-rotate the page, leaving it with an rotation of 0.
-    page.rotateClockwise(-rotation)
-
-    # Save copies of some values in the page's namespace, to possibly restore later.
-    page.originalMediaBox = page.mediaBox
-    page.originalCropBox = page.cropBox
-
     first_loop = True
     for box_string in args.fullPageBox:
-        if box_string == "m": f_box = page.mediaBox
-        if box_string == "c": f_box = page.cropBox
-        if box_string == "t": f_box = page.trimBox
-        if box_string == "a": f_box = page.artBox
-        if box_string == "b": f_box = page.bleedBox
+        if box_string == "m": f_box = page_geometry.media_box
+        if box_string == "c": f_box = page_geometry.crop_box
+        if box_string == "t": f_box = page_geometry.trim_box
+        if box_string == "a": f_box = page_geometry.art_box
+        if box_string == "b": f_box = page_geometry.bleed_box
 
         # Take intersection over all chosen boxes.
         if first_loop:
@@ -238,25 +277,20 @@ def get_full_page_box_assigning_media_and_crop(page, skip_pre_crop=False):
     if not skip_pre_crop:
         # Do any absolute pre-cropping specified for the page (after modifying any
         # absolutePreCrop4 arguments to take into account rotations to the page).
-        precrop_box = mod_box_for_rotation(args.absolutePreCrop4, rotation)
+        precrop_box = mod_box_for_rotation(args.absolutePreCrop4, page_geometry.rotation)
         full_box = RectangleObject([float(full_box.lowerLeft[0]) + precrop_box[0],
                                     float(full_box.lowerLeft[1]) + precrop_box[1],
                                     float(full_box.upperRight[0]) - precrop_box[2],
                                     float(full_box.upperRight[1]) - precrop_box[3]])
 
-    page.mediaBox = full_box
-    page.cropBox = full_box
-
+    page_geometry.full_box = full_box
     return full_box
 
-def get_full_page_box_list_assigning_media_and_crop(input_doc, quiet=False,
-                                                    skip_pre_crop=False):
-    """Get a list of all the full-page box values for each page.  The argument
-    input_doc should be a `PdfFileReader` object.  The boxes on the list are in the
-    simple 4-float list format used by this program, not `RectangleObject` format."""
+def get_page_geometry_list(input_doc, quiet=False, skip_pre_crop=False):
+    """Get a list of the `PageGeometry` objects for each page, with the full-page
+    boxes set.  The argument input_doc should be a `PdfFileReader` object."""
 
-    full_page_box_list = []
-    rotation_list = []
+    page_geometry_list = []
 
     if args.verbose and not quiet:
         print("\nOriginal full page sizes, in PDF format (lbrt):")
@@ -264,31 +298,41 @@ def get_full_page_box_list_assigning_media_and_crop(input_doc, quiet=False,
     for page_num in range(input_doc.getNumPages()):
 
         # Get the current page and find the full-page box.
-        curr_page = input_doc.getPage(page_num)
-        full_page_box = get_full_page_box_assigning_media_and_crop(curr_page,
-                                                                   skip_pre_crop)
+        page_geometry = PageGeometry(input_doc.getPage(page_num))
+        full_page_box = get_full_page_box(page_geometry, skip_pre_crop)
 
         if args.verbose and not quiet:
             # want to display page num numbering from 1, so add one
             print("\t"+str(page_num+1), "  rot =",
-                  curr_page.rotationAngle, "\t", full_page_box)
+                  page_geometry.rotation, "\t", full_page_box)
 
-        # Convert the `RectangleObject` to floats in an ordinary list and append.
-        ordinary_box = [float(b) for b in full_page_box]
-        full_page_box_list.append(ordinary_box)
+        page_geometry_list.append(page_geometry)
 
-        # Append the rotation value to the rotation_list.
-        rotation_list.append(curr_page.rotationAngle)
+    return page_geometry_list
 
-    return full_page_box_list, rotation_list
+def apply_page_geometry_list(input_doc, page_geometry_list):
+    """Set the boxes recorded in the `boxes_to_set` attributes of the
+    `PageGeometry` objects in `page_geometry_list` on the corresponding pages of
+    the `PdfFileReader` object `input_doc`."""
+    for page_num, page_geometry in enumerate(page_geometry_list):
+        curr_page = input_doc.getPage(page_num)
+        for box_name, box in page_geometry.boxes_to_set.items():
+            setattr(curr_page, box_name, box)
 
 def calculate_crop_list(full_page_box_list, bounding_box_list, angle_list,
-                                                               page_nums_to_crop):
+                        page_nums_to_crop, evenodd=None, uniform=None):
     """Given a list of full-page boxes (media boxes) and a list of tight
     bounding boxes for each page, calculate and return another list giving the
     list of bounding boxes to crop down to.  The parameter `angle_list` is
     a list of rotation angles which correspond to the pages.  The pages
-    selected to crop are in the set `page_nums_to_crop`."""
+    selected to crop are in the set `page_nums_to_crop`.  The `evenodd` and
+    `uniform` arguments default to the values of those options; they are set
+    for the recursive calls on the even and odd pages.  The args are not
+    modified."""
+    if evenodd is None:
+        evenodd = args.evenodd
+    if uniform is None:
+        uniform = args.uniform
 
     # Definition: the deltas are the four differences, one for each margin,
     # between the original full page box and the final, cropped full-page box.
@@ -310,12 +354,13 @@ def calculate_crop_list(full_page_box_list, bounding_box_list, angle_list,
     # is only applied to the pages in the set `page_nums_to_crop`.
 
     order_n = 0
+    same_page_size = args.samePageSize
     if args.samePageSizeOrderStat:
-        args.samePageSize = True
+        same_page_size = True
         order_n = min(args.samePageSizeOrderStat[0], num_pages_to_crop - 1)
         order_n = max(order_n, 0)
 
-    if args.samePageSize:
+    if same_page_size:
         if args.verbose:
             print("\nSetting each page size to the smallest box bounding all the pages.")
             if order_n != 0:
@@ -341,24 +386,26 @@ def calculate_crop_list(full_page_box_list, bounding_box_list, angle_list,
         full_page_box_list = new_full_page_box_list
 
     # Handle the '--evenodd' option if it was selected.
-    if args.evenodd:
+    if evenodd:
         even_page_nums_to_crop = {p_num for p_num in page_nums_to_crop if p_num % 2 == 0}
         odd_page_nums_to_crop = {p_num for p_num in page_nums_to_crop if p_num % 2 != 0}
 
-        if args.uniform:
+        if uniform:
             uniform_set_with_even_odd = True
         else:
             uniform_set_with_even_odd = False
 
-        # Recurse on even and odd pages, after resetting some options.
+        # Recurse on even and odd pages, with evenodd off to avoid infinite
+        # recursion and uniform on, since --evenodd implies uniform, just on
+        # each separate group.
         if args.verbose:
             print("\nRecursively calculating crops for even and odd pages.")
-        args.evenodd = False # Avoid infinite recursion.
-        args.uniform = True  # --evenodd implies uniform, just on each separate group
         even_crop_list = calculate_crop_list(full_page_box_list, bounding_box_list,
-                                             angle_list, even_page_nums_to_crop)
+                                             angle_list, even_page_nums_to_crop,
+                                             evenodd=False, uniform=True)
         odd_crop_list = calculate_crop_list(full_page_box_list, bounding_box_list,
-                                            angle_list, odd_page_nums_to_crop)
+                                            angle_list, odd_page_nums_to_crop,
+                                            evenodd=False, uniform=True)
 
         # Recombine the even and odd pages.
         combine_even_odd = []
@@ -405,13 +452,14 @@ def calculate_crop_list(full_page_box_list, bounding_box_list, angle_list,
         delta_list.append(adj_deltas)
 
     # Handle the '--uniform' options if one was selected.
+    uniform_order_stat4 = args.uniformOrderStat4
     if args.uniformOrderPercent:
         percent_val = args.uniformOrderPercent[0]
         if percent_val < 0.0: percent_val = 0.0
         if percent_val > 100.0: percent_val = 100.0
-        args.uniformOrderStat4 = [int(round(num_pages_to_crop * percent_val / 100.0))] * 4
+        uniform_order_stat4 = [int(round(num_pages_to_crop * percent_val / 100.0))] * 4
 
-    if args.uniform or args.uniformOrderStat4:
+    if uniform or uniform_order_stat4:
         if args.verbose:
             print("\nAll the selected pages will be uniformly cropped.")
         # Expand to tuples containing page nums, to better print verbose information.
@@ -424,8 +472,8 @@ def calculate_crop_list(full_page_box_list, bounding_box_list, angle_list,
         # Handle order stats; m_vals are the four index values into the sorted
         # delta lists, one per margin.
         m_vals = [0, 0, 0, 0]
-        if args.uniformOrderStat4:
-            m_vals = args.uniformOrderStat4
+        if uniform_order_stat4:
+            m_vals = uniform_order_stat4
         fixed_m_vals = []
         for m_val in m_vals:
             if m_val < 0 or m_val >= num_pages_to_crop:
@@ -437,7 +485,7 @@ def calculate_crop_list(full_page_box_list, bounding_box_list, angle_list,
                     m_val = 0
             fixed_m_vals.append(m_val)
         m_vals = fixed_m_vals
-        if args.verbose and (args.uniformOrderPercent or args.uniformOrderStat4):
+        if args.verbose and uniform_order_stat4:
             print("\nPer-margin, the", m_vals,
                   "smallest delta values over the selected pages\nwill be ignored"
                   " when choosing common, uniform delta values.")
@@ -502,6 +550,11 @@ def calculate_crop_list(full_page_box_list, bounding_box_list, angle_list,
 
     return final_crop_list
 
+def is_producer_cropped(producer_string):
+    """Return true if the Producer metadata string `producer_string` shows that
+    the document was cropped by this program."""
+    return bool(producer_string) and producer_string.endswith(PRODUCER_MODIFIER)
+
 def set_cropped_metadata(input_doc, output_doc, metadata_info):
     """Set the metadata for the output document.  Mostly just copied over, but
     "Producer" has a string appended to indicate that this program modified the
@@ -525,8 +578,7 @@ def set_cropped_metadata(input_doc, output_doc, metadata_info):
 
     # Check Producer metadata attribute to see if this program cropped document before.
     producer_mod = PRODUCER_MODIFIER
-    old_producer_string = metadata_info.producer
-    if old_producer_string and old_producer_string.endswith(producer_mod):
+    if is_producer_cropped(metadata_info.producer):
         producer_mod = "" # No need to pile up suffixes each time on Producer.
         if args.verbose:
             print("\nThe document was already cropped at least once by pdfCropMargins.")
@@ -553,9 +605,10 @@ def set_cropped_metadata(input_doc, output_doc, metadata_info):
 
     return already_cropped_by_this_program
 
-def apply_crop_list(crop_list, input_doc, page_nums_to_crop,
+def apply_crop_list(crop_list, page_geometry_list, page_nums_to_crop,
                                           already_cropped_by_this_program):
-    """Apply the crop list to the pages of the input PdfFileReader object."""
+    """Apply the crop list to the `PageGeometry` objects of the pages.  The new
+    boxes are only set on the pages themselves by `apply_page_geometry_list`."""
 
     if args.restore and not already_cropped_by_this_program:
         print("\nWarning from pdfCropMargins: The Producer string indicates that"
@@ -570,41 +623,33 @@ def apply_crop_list(crop_list, input_doc, page_nums_to_crop,
         else:
             print("\nNew full page sizes after cropping, in PDF format (lbrt):")
 
-    if args.writeCropDataToFile:
+    write_crop_data = args.writeCropDataToFile and args.cropDataFormat == "text"
+    if write_crop_data:
         args.writeCropDataToFile = os.path.expanduser(args.writeCropDataToFile)
         f = open(args.writeCropDataToFile, "w")
 
-    # Copy over each page, after modifying the appropriate PDF boxes.
-    for page_num in range(input_doc.getNumPages()):
+    # Record the modified boxes for each page.
+    for page_num, page_geometry in enumerate(page_geometry_list):
 
-        curr_page = input_doc.getPage(page_num)
-
-        # Restore any rotation which was originally on the page.
-        curr_page.rotateClockwise(curr_page.rotationAngle)
+        boxes_to_set = page_geometry.boxes_to_set
 
         # Only do the restore from ArtBox if '--restore' option was selected.
         if args.restore:
-            if not curr_page.artBox:
+            if not page_geometry.art_box:
                 print("\nWarning from pdfCropMargins: Attempting to restore pages from"
                       "\nthe ArtBox in each page, but page", page_num, "has no readable"
                       "\nArtBox.  Leaving that page unchanged.", file=sys.stderr)
                 continue
-            curr_page.mediaBox = curr_page.artBox
-            curr_page.cropBox = curr_page.artBox
+            boxes_to_set["mediaBox"] = page_geometry.art_box
+            boxes_to_set["cropBox"] = page_geometry.art_box
             continue
 
         # Do the save to ArtBox if that option is chosen and Producer is set.
         if not args.noundosave and not already_cropped_by_this_program:
-            curr_page.artBox = intersect_boxes(curr_page.originalMediaBox,
-                                               curr_page.originalCropBox)
-
-        # Reset the CropBox and MediaBox to their saved original values
-        # (they were saved by `get_full_page_box_assigning_media_and_crop`
-        # in the `curr_page` object's namespace).
-        curr_page.mediaBox = curr_page.originalMediaBox
-        curr_page.cropBox = curr_page.originalCropBox
+            boxes_to_set["artBox"] = intersect_boxes(page_geometry.media_box,
+                                                     page_geometry.crop_box)
 
-        # Copy the original page without further mods if it wasn't in the range
+        # Leave the other boxes of the page unchanged if it wasn't in the range
         # selected for cropping.
         if page_num not in page_nums_to_crop:
             continue
@@ -614,34 +659,117 @@ def apply_crop_list(crop_list, input_doc, page_nums_to_crop,
 
         if args.verbose:
             print("\t"+str(page_num+1)+"\t", new_cropped_box) # page numbering from 1
-        if args.writeCropDataToFile:
+        if write_crop_data:
             print("\t"+str(page_num+1)+"\t", new_cropped_box, file=f)
 
         if not args.boxesToSet:
             args.boxesToSet = ["m", "c"]
 
         # Now set any boxes which were selected to be set via the '--boxesToSet' option.
-        if "m" in args.boxesToSet: curr_page.mediaBox = new_cropped_box
-        if "c" in args.boxesToSet: curr_page.cropBox = new_cropped_box
-        if "t" in args.boxesToSet: curr_page.trimBox = new_cropped_box
-        if "a" in args.boxesToSet: curr_page.artBox = new_cropped_box
-        if "b" in args.boxesToSet: curr_page.bleedBox = new_cropped_box
+        if "m" in args.boxesToSet: boxes_to_set["mediaBox"] = new_cropped_box
+        if "c" in args.boxesToSet: boxes_to_set["cropBox"] = new_cropped_box
+        if "t" in args.boxesToSet: boxes_to_set["trimBox"] = new_cropped_box
+        if "a" in args.boxesToSet: boxes_to_set["artBox"] = new_cropped_box
+        if "b" in args.boxesToSet: boxes_to_set["bleedBox"] = new_cropped_box
 
-    if args.writeCropDataToFile:
+    if write_crop_data:
         f.close()
         ex.cleanup_and_exit(0)
 
-def setup_output_document(input_doc, tmp_input_doc, metadata_info,
-                                                    copy_document_catalog=True):
-    """Create the output `PdfFileWriter` objects and copy over the relevant info.
-    Returns the writer objects `output_doc`, `tmp_output_doc`, and the boolean
+def write_crop_data_file(crop_data_fname, input_doc_fname, full_page_box_list,
+                         bounding_box_list, rotation_list, crop_list, page_nums_to_crop):
+    """Write the crop data for each page to the file `crop_data_fname` in the JSON
+    or NDJSON format selected by the '--cropDataFormat' option.  The data for a
+    page is a dict with the 1-based page number, the rotation, the full-page
+    box, the bounding box, and the final crop box (or `None` if the page was not
+    selected for cropping).  The boxes are lbrt lists of floats in PDF
+    coordinates.  In the JSON format the page dicts are in the "pages" list of a
+    document dict, and in the NDJSON format there is one page dict per line.
+    The bounding boxes and crops are `None` in a restore operation."""
+    def get_floats(box):
+        return None if box is None else [float(b) for b in box]
+
+    page_data_list = []
+    for page_num, (full_page_box, rotation) in enumerate(zip(full_page_box_list,
+                                                             rotation_list)):
+        page_data_list.append({
+              "page": page_num + 1,
+              "rotation": rotation,
+              "full_page_box": get_floats(full_page_box),
+              "bounding_box": get_floats(bounding_box_list[page_num]
+                                         if bounding_box_list else None),
+              "crop_box": get_floats(crop_list[page_num] if crop_list
+                                     and page_num in page_nums_to_crop else None),
+              })
+
+    with open(os.path.expanduser(crop_data_fname), "w") as f:
+        if args.cropDataFormat == "ndjson":
+            for page_data in page_data_list:
+                f.write(json.dumps(page_data) + "\n")
+        else:
+            json.dump({"format": CROP_DATA_FORMAT_NAME,
+                       "version": CROP_DATA_FORMAT_VERSION,
+                       "input_file": input_doc_fname,
+                       "num_pages": len(page_data_list),
+                       "pages": page_data_list}, f, indent=1)
+            f.write("\n")
+
+def read_crop_data_file(crop_data_fname):
+    """Read a JSON or NDJSON crop-data file written by `write_crop_data_file` and
+    return the list of bounding boxes for the pages."""
+    def crop_data_error(message):
+        print("\nError in pdfCropMargins: The crop-data file\n   {}\n{}"
+              .format(crop_data_fname, message), file=sys.stderr)
+        ex.cleanup_and_exit(1)
+
+    try:
+        with open(os.path.expanduser(crop_data_fname), "r") as f:
+            crop_data_text = f.read()
+    except IOError:
+        crop_data_error("could not be read.")
+
+    try:
+        crop_data = json.loads(crop_data_text)
+    except ValueError: # Not a single JSON document, so it should be NDJSON.
+        crop_data = None
+    if isinstance(crop_data, dict) and crop_data.get("format") == CROP_DATA_FORMAT_NAME:
+        page_data_list = crop_data.get("pages")
+    else:
+        try:
+            page_data_list = [json.loads(line) for line in crop_data_text.splitlines()
+                              if line.strip()]
+        except ValueError:
+            page_data_list = None
+    if not isinstance(page_data_list, list) or not all(
+                            isinstance(page_data, dict) for page_data in page_data_list):
+        crop_data_error("is not in the JSON or NDJSON crop-data format.")
+
+    bounding_box_list = [None] * len(page_data_list)
+    for page_data in page_data_list:
+        try:
+            page_num = int(page_data["page"]) - 1
+            bounding_box = [float(b) for b in page_data["bounding_box"]]
+        except (KeyError, TypeError, ValueError):
+            crop_data_error("has a page without a page number or a bounding box.")
+        if not 0 <= page_num < len(bounding_box_list) or len(bounding_box) != 4:
+            crop_data_error("has a bad page number or bounding box for page {}."
+                            .format(page_num + 1))
+        bounding_box_list[page_num] = bounding_box
+
+    if None in bounding_box_list:
+        crop_data_error("does not have the data for page {}."
+                        .format(bounding_box_list.index(None) + 1))
+    return bounding_box_list
+
+def setup_output_document(input_doc, metadata_info, copy_document_catalog=True):
+    """Create the output `PdfFileWriter` object and copy over the relevant info.
+    Returns the writer object `output_doc` and the boolean
     `already_cropped_by_this_program`.  This function also sets the metadata for
     the cropped output file."""
     # NOTE: Inserting pages from a PdfFileReader into multiple PdfFileWriters
-    # seems to cause problems (writer can hang on write), so only one is used.
-    # This is why the tmp_input_doc file was created earlier, to get copies of
-    # the page objects which are independent of those in input_doc.  An ugly
-    # hack for a nasty bug to track down.
+    # seems to cause problems (writer can hang on write), so only one writer is
+    # used.  The bounding boxes are found by rendering the original document
+    # file, so no other copy of the document is ever written.
 
     # NOTE: You can get the `_root_object` attribute (dict for the document
     # catalog) from the output document after calling `cloneReaderDocumentRoot`
@@ -746,11 +874,6 @@ def setup_output_document(input_doc, tmp_input_doc, metadata_info,
     for page in [input_doc.getPage(i) for i in range(input_doc.getNumPages())]:
         output_doc.addPage(page)
 
-    tmp_output_doc = PdfFileWriter()
-    #tmp_output_doc.appendPagesFromReader(tmp_input_doc)  # Works, but test more.
-    for page in [tmp_input_doc.getPage(i) for i in range(tmp_input_doc.getNumPages())]:
-        tmp_output_doc.addPage(page)
-
     ##
     ## Copy the metadata from input_doc to output_doc, modifying the Producer string
     ## if this program didn't already set it.  Get bool for whether this program
@@ -759,7 +882,7 @@ def setup_output_document(input_doc, tmp_input_doc, metadata_info,
 
     already_cropped_by_this_program = set_cropped_metadata(input_doc, output_doc,
                                                            metadata_info)
-    return output_doc, tmp_output_doc, already_cropped_by_this_program
+    return output_doc, already_cropped_by_this_program
 
 
 ##############################################################################
@@ -768,11 +891,54 @@ def setup_output_document(input_doc, tmp_input_doc, metadata_info,
 #
 ##############################################################################
 
+def check_prev_cropped(input_doc_fname):
+    """Return true if the PDF file `input_doc_fname` was already cropped by this
+    program, according to its Producer metadata, and false if not.  Returns
+    `None` if the metadata cannot be read.  Only the cross-reference data, the
+    trailer, and the document information dictionary are read; the page tree
+    is never loaded."""
+    try:
+        with open(input_doc_fname, "rb") as input_doc_file_object:
+            input_doc = PdfFileReader(input_doc_file_object, strict=False)
+            if input_doc.isEncrypted:
+                input_doc.decrypt(args.password if args.password else "")
+            metadata_info = input_doc.getDocumentInfo()
+            return bool(metadata_info) and is_producer_cropped(metadata_info.producer)
+    except (KeyboardInterrupt, EOFError):
+        raise
+    except: # PyPDF2 can raise various exceptions.
+        return None
+
+def check_prev_cropped_and_exit(input_doc_fnames):
+    """Check each of the PDF files in the list `input_doc_fnames` with
+    `check_prev_cropped` and exit.  For a single file "y" or "n" is printed.  For
+    several files a line with "y", "n", or "?" (unreadable), a tab, and the
+    filename is printed for each one.  The exit code is zero if every file was
+    already cropped, one if any was not, and two if any could not be read."""
+    input_doc_fnames = [os.path.expanduser(f) for fname in input_doc_fnames
+                        for f in ex.glob_if_windows_os(fname)]
+    exit_code = 0
+    for input_doc_fname in input_doc_fnames:
+        prev_cropped = check_prev_cropped(input_doc_fname)
+        if prev_cropped is None:
+            print("\nError in pdfCropMargins: Could not read the metadata of the file"
+                  "\n   " + input_doc_fname, file=sys.stderr)
+            exit_code = 2
+        elif not prev_cropped:
+            exit_code = max(exit_code, 1)
+        answer = {True: "y", False: "n", None: "?"}[prev_cropped]
+        if len(input_doc_fnames) == 1:
+            print(answer, end="")
+        else:
+            print(answer + "\t" + input_doc_fname)
+    ex.cleanup_and_exit(exit_code)
+
 def process_command_line_arguments(parsed_args):
     """Perform an initial processing on the some of the command-line arguments.  This
     is called first, before any PDF processing is done."""
-    global args # This is global only to avoid passing it to essentially every function.
-    args = parsed_args
+    # The args are module-level only to avoid passing them to essentially every
+    # function.  They are set for the current job, so jobs can run in parallel.
+    ex.job.args = parsed_args
 
     if args.version:
         print(__version__, end="")
@@ -783,6 +949,9 @@ def process_command_line_arguments(parsed_args):
         print("Python version:", ex.python_version)
         print("System type:", ex.system_os)
 
+    if args.checkPrevCropped:
+        check_prev_cropped_and_exit(args.pdf_input_doc)
+
     if len(args.pdf_input_doc) > 1:
         print("\nError in pdfCropMargins: Only one input PDF document is allowed."
               "\nFound more than one on the command line:", file=sys.stderr)
@@ -882,6 +1051,35 @@ def process_command_line_arguments(parsed_args):
     # Process options dealing with external programs.
     #
 
+    if args.bboxEngine != "default" and (args.gsBbox or args.gsRender):
+        print("\nWarning in pdfCropMargins: The '--gsBbox' and '--gsRender' options"
+              "\nare ignored when the '--bboxEngine' option is set.\n", file=sys.stderr)
+        args.gsBbox = False
+        args.gsRender = False
+
+    if args.jobs < 0:
+        print("\nError in pdfCropMargins: The '--jobs' argument cannot be negative.",
+              file=sys.stderr)
+        ex.cleanup_and_exit(1)
+
+    if args.coarseRes < 0:
+        print("\nError in pdfCropMargins: The '--coarseRes' argument cannot be"
+              " negative.", file=sys.stderr)
+        ex.cleanup_and_exit(1)
+
+    if args.bboxCache:
+        if args.bboxCacheSize < 0:
+            print("\nError in pdfCropMargins: The '--bboxCacheSize' argument cannot be"
+                  " negative.", file=sys.stderr)
+            ex.cleanup_and_exit(1)
+        args.bboxCacheDir = os.path.expanduser(args.bboxCacheDir
+                                             or bbox_cache.get_default_cache_directory())
+
+    if args.tempSpaceBudget < 0:
+        print("\nError in pdfCropMargins: The '--tempSpaceBudget' argument cannot be"
+              " negative.", file=sys.stderr)
+        ex.cleanup_and_exit(1)
+
     if args.gsBbox and len(args.fullPageBox) > 1:
         print("\nWarning: only one --fullPageBox value can be used with the -gs option.",
               "\nIgnoring all but the first one.", file=sys.stderr)
@@ -906,11 +1104,14 @@ def process_command_line_arguments(parsed_args):
     # explicitly rendered.  In that case we either need pdftoppm or gs to do the
     # rendering.
     gs_render_fallback_set = False # Set True if we switch to gs option as a fallback.
-    if not args.gsBbox and not args.gsRender:
+    if (not args.gsBbox and not args.gsRender and args.bboxEngine == "default"
+            and not args.readCropData):
         found_pdftoppm = ex.init_and_test_pdftoppm_executable(
                                                    prefer_local=args.pdftoppmLocal)
         if args.verbose:
             print("\nFound pdftoppm program at:", found_pdftoppm)
+            if ex.job.pdftoppm_version:
+                print("The pdftoppm version is:", ex.job.pdftoppm_version)
         if not found_pdftoppm:
             args.gsRender = True
             gs_render_fallback_set = True
@@ -922,6 +1123,8 @@ def process_command_line_arguments(parsed_args):
         found_gs = ex.init_and_test_gs_executable()
         if args.verbose:
             print("\nFound Ghostscript program at:", found_gs)
+            if ex.job.gs_version:
+                print("The Ghostscript version is:", ex.job.gs_version)
     if args.gsBbox and not found_gs:
         print("\nError in pdfCropMargins: The '--gsBbox' option was specified but"
               "\nthe Ghostscript executable could not be located.  Is it"
@@ -954,10 +1157,21 @@ def process_command_line_arguments(parsed_args):
         print("\nWarning in pdfCropMargins: The '--numSmooths' option is ignored"
               "\nwhen the '--gsBbox' option is also selected.\n", file=sys.stderr)
 
+    if args.coarseRes and (args.gsBbox or args.gsRender or ex.job.old_pdftoppm_version):
+        print("\nWarning in pdfCropMargins: The '--coarseRes' option requires"
+              "\nrendering with a recent pdftoppm or with the PyMuPDF engine, so it"
+              "\nis ignored.\n", file=sys.stderr)
+        args.coarseRes = 0
+    if args.coarseRes and (args.coarseRes >= min(args.resX, args.resY)
+                           or args.bboxEngine in ("vector", "hybrid")):
+        args.coarseRes = 0 # Nothing to gain from two passes.
+
     if args.gsFix:
         if args.verbose:
             print("\nAttempting to fix the PDF input file before reading it...")
-        fixed_input_doc_fname = ex.fix_pdf_with_ghostscript_to_tmp_file(input_doc_fname)
+        with profile_stage("gs_fix"):
+            fixed_input_doc_fname = ex.fix_pdf_with_ghostscript_to_tmp_file(input_doc_fname)
+        profile_report.add_temp_file(fixed_input_doc_fname)
     else:
         fixed_input_doc_fname = input_doc_fname
 
@@ -973,14 +1187,17 @@ def process_pdf_file(input_doc_fname, fixed_input_doc_fname, output_doc_fname,
     that list is used.
 
     Returns the bounding box list."""
+    ex.job.input_doc_fname = input_doc_fname # Saved as results of the job.
+    ex.job.output_doc_fname = output_doc_fname
+
     ##
-    ## Open the input document in a PdfFileReader object.  Due to an apparent bug
-    ## in pyPdf we open two PdfFileReader objects for the file.  The time required
-    ## should still be small relative to finding the bounding boxes of pages.  The bug
-    ## is that writing a PdfFileWriter tends to hang on certain files if 1) pages from
-    ## the same PdfFileReader are shared between two PdfFileWriter objects, or 2)
-    ## the PdfFileWriter is written, the pages are modified, and there is an attempt
-    ## to write the same PdfFileWriter to a different file.
+    ## Open the input document in a PdfFileReader object.  The document is only
+    ## parsed once.  Note that due to an apparent bug in pyPdf, writing a
+    ## PdfFileWriter tends to hang on certain files if 1) pages from the same
+    ## PdfFileReader are shared between two PdfFileWriter objects, or 2) the
+    ## PdfFileWriter is written, the pages are modified, and there is an attempt
+    ## to write the same PdfFileWriter to a different file.  So the pages are not
+    ## modified until the final output document is written.
     ##
 
     # Open the input file object.
@@ -992,8 +1209,8 @@ def process_pdf_file(input_doc_fname, fixed_input_doc_fname, output_doc_fname,
         ex.cleanup_and_exit(1)
 
     try:
-        input_doc = PdfFileReader(fixed_input_doc_file_object)
-        tmp_input_doc = PdfFileReader(fixed_input_doc_file_object)
+        with profile_stage("parse_pdf"):
+            input_doc = PdfFileReader(fixed_input_doc_file_object)
     except (KeyboardInterrupt, EOFError):
         raise
     except: # Can raise various exceptions, just catch the rest here.
@@ -1014,7 +1231,6 @@ def process_pdf_file(input_doc_fname, fixed_input_doc_fname, output_doc_fname,
     if args.password:
         try:
             input_doc.decrypt(args.password)
-            tmp_input_doc.decrypt(args.password)
         except KeyError:
             print("\nDecrypting with the password from the '--password' option"
                   "\nfailed.", file=sys.stderr)
@@ -1022,7 +1238,6 @@ def process_pdf_file(input_doc_fname, fixed_input_doc_fname, output_doc_fname,
     else: # Try decrypting with an empty password.
         try:
             input_doc.decrypt("")
-            tmp_input_doc.decrypt("")
         except KeyError:
             pass # Document apparently wasn't encrypted with an empty password.
 
@@ -1098,103 +1313,130 @@ def process_pdf_file(input_doc_fname, fixed_input_doc_fname, output_doc_fname,
         print("\nAll the pages of the document will be cropped.")
 
     ##
-    ## Get a list with the full-page boxes for each page: (left,bottom,right,top)
-    ## This function also sets the MediaBox and CropBox of the pages to the
-    ## chosen full-page size as a side-effect, saving the old boxes.  Any absolute
-    ## pre-crop is also applied here.
+    ## Get the geometry of each page, including the full-page box to crop
+    ## relative to.  Any absolute pre-crop is also applied here.  Then get lists
+    ## with the full-page boxes for each page (left,bottom,right,top), in the
+    ## simple 4-float list format used by this program, and with the rotations.
     ##
 
-    full_page_box_list, rotation_list = get_full_page_box_list_assigning_media_and_crop(
-                                                          input_doc, skip_pre_crop=False)
-    # The below return values aren't used, but the function is called to replicate
-    # its side-effects on `tmp_input_doc`.
-    tmp_full_page_box_list, tmp_rotation_list = get_full_page_box_list_assigning_media_and_crop(
-                                            tmp_input_doc, quiet=True, skip_pre_crop=False)
+    with profile_stage("page_geometry"):
+        page_geometry_list = get_page_geometry_list(input_doc, skip_pre_crop=False)
+    full_page_box_list = [[float(b) for b in page_geometry.full_box]
+                          for page_geometry in page_geometry_list]
+    rotation_list = [page_geometry.rotation for page_geometry in page_geometry_list]
 
     ##
     ## Define a `PdfFileWriter` object and copy `input_doc` info over to it.
     ##
 
-    output_doc, tmp_output_doc, already_cropped_by_this_program = setup_output_document(
-                                                input_doc, tmp_input_doc, metadata_info)
-
-    if False: #args.prevCropped:
-        # TODO: Consider as new options.  But a lot of work done above to get this info...
-        # How do the other options interact with these if they are set?  Don't want GUI.
-        if already_cropped_by_this_program and args.skipPrevCropped:
-            ex.cleanup_and_exit(0)
-        fixed_input_doc_file_object.close()
-        if already_cropped_by_this_program:
-            print("y", end="")
-            ex.cleanup_and_exit(0)
-        else:
-            print("n", end="")
-            ex.cleanup_and_exit(1)
-
-    ##
-    ## Write out the PDF document again, with the CropBox and MediaBox reset.
-    ## This temp version is ONLY used for calculating the bounding boxes of
-    ## pages.  Note we are writing from `tmp_output_doc` (due to an apparent bug
-    ## discussed above).  After this `tmp_input_doc` and `tmp_output_doc` are no
-    ## longer needed.
-    ##
-
-    if not bounding_box_list and not args.restore:
-        doc_with_crop_and_media_boxes_name = ex.get_temporary_filename(".pdf")
-        with open(doc_with_crop_and_media_boxes_name, "wb"
-                                          ) as doc_with_crop_and_media_boxes_object:
-            if args.verbose:
-                print("\nWriting out the PDF with the CropBox and MediaBox redefined.")
-
-            try:
-                tmp_output_doc.write(doc_with_crop_and_media_boxes_object)
-            except (KeyboardInterrupt, EOFError):
-                raise
-            except: # PyPDF2 can raise various exceptions.
-                print("\nError in pdfCropMargins: The pyPdf program failed in trying to"
-                      "\nwrite out a PDF file of the document.  The document may be"
-                      "\ncorrupted.  If you have Ghostscript, try using the '--gsFix'"
-                      "\noption (assuming you are not already using it).", file=sys.stderr)
-                ex.cleanup_and_exit(1)
+    with profile_stage("setup_output_document"):
+        output_doc, already_cropped_by_this_program = setup_output_document(
+                                                           input_doc, metadata_info)
 
     ##
     ## Calculate the `bounding_box_list` containing tight page bounds for each page.
+    ## The original document file is rendered; the page geometry tells the
+    ## renderers which region of each rendered page to use.
     ##
 
-    if not bounding_box_list and not args.restore:
-        bounding_box_list = get_bounding_box_list(doc_with_crop_and_media_boxes_name,
-                input_doc, full_page_box_list, page_nums_to_crop, args, PdfFileWriter)
+    bbox_cache_key = None
+    found_in_bbox_cache = False
+    if not bounding_box_list and not args.restore and args.bboxCache:
+        with profile_stage("bbox_cache_lookup"):
+            bbox_cache_key = bbox_cache.get_cache_key(
+                          bbox_cache.get_file_hash(input_doc_fname),
+                          bbox_cache.get_bbox_parameters(args, page_nums_to_crop))
+            cached_bounding_box_list = bbox_cache.read_cache_entry(args.bboxCacheDir,
+                                                                   bbox_cache_key)
+        if (cached_bounding_box_list is not None and
+                len(cached_bounding_box_list) == input_doc.getNumPages()):
+            bounding_box_list = cached_bounding_box_list
+            found_in_bbox_cache = True
+
+    if found_in_bbox_cache:
+        if args.verbose:
+            print("\nUsing the bounding boxes found in the cache directory:\n   ",
+                  args.bboxCacheDir)
+
+    elif not bounding_box_list and not args.restore:
+        with profile_stage("bounding_boxes"):
+            bounding_box_list = get_bounding_box_list(fixed_input_doc_fname,
+                    input_doc, page_geometry_list, page_nums_to_crop, args, PdfFileWriter)
         if args.verbose:
             print("\nThe bounding boxes are:")
             for pNum, b in enumerate(bounding_box_list):
                 print("\t", pNum+1, "\t", b)
-        os.remove(doc_with_crop_and_media_boxes_name) # No longer needed.
-
-    elif args.verbose and not args.restore:
-        print("\nUsing the bounding box list passed in instead of calculating it.")
+        if bbox_cache_key:
+            bbox_cache.write_cache_entry(args.bboxCacheDir, bbox_cache_key,
+                                 bounding_box_list, args.bboxCacheSize * 2**20)
+
+    elif not args.restore:
+        if len(bounding_box_list) != input_doc.getNumPages():
+            print("\nError in pdfCropMargins: The bounding box list passed in has"
+                  "\n{} boxes, but the document has {} pages.".format(
+                      len(bounding_box_list), input_doc.getNumPages()), file=sys.stderr)
+            ex.cleanup_and_exit(1)
+        if args.verbose:
+            print("\nUsing the bounding box list passed in instead of calculating it.")
 
     ##
     ## Calculate the `crop_list` based on the fullpage boxes and the bounding boxes.
     ##
 
     if not args.restore:
-        crop_list = calculate_crop_list(full_page_box_list, bounding_box_list,
-                                        rotation_list, page_nums_to_crop)
+        with profile_stage("crop_list"):
+            crop_list = calculate_crop_list(full_page_box_list, bounding_box_list,
+                                            rotation_list, page_nums_to_crop)
     else:
         crop_list = None # Restore, not needed in this case.
+    ex.job.bounding_box_list = bounding_box_list # Saved as results of the job.
+    ex.job.crop_list = crop_list
+
+    if args.writeCropDataToFile and args.cropDataFormat != "text":
+        write_crop_data_file(args.writeCropDataToFile, input_doc_fname,
+                             full_page_box_list, bounding_box_list, rotation_list,
+                             crop_list, page_nums_to_crop)
+        fixed_input_doc_file_object.close()
+        ex.cleanup_and_exit(0)
 
     ##
-    ## Apply the calculated crops to the pages of the PdfFileReader input_doc.
-    ## These pages are copied to the PdfFileWriter output_doc.
+    ## Apply the calculated crops to the page geometry, and then set the modified
+    ## boxes on the pages of the PdfFileReader input_doc.  These pages were
+    ## copied to the PdfFileWriter output_doc.
     ##
 
-    apply_crop_list(crop_list, input_doc, page_nums_to_crop,
+    apply_crop_list(crop_list, page_geometry_list, page_nums_to_crop,
                                           already_cropped_by_this_program)
+    apply_page_geometry_list(input_doc, page_geometry_list)
 
     ##
     ## Write the final PDF out to a file.
     ##
 
+    if args.incrementalWrite:
+        if args.verbose:
+            print("\nWriting the cropped PDF file as an incremental update.")
+        changed_page_nums = [page_num for page_num, page_geometry
+                             in enumerate(page_geometry_list)
+                             if page_geometry.boxes_to_set]
+        # Only the Producer string is changed in the original info dict.  The
+        # info dict of the writer also has its own entries, which are not added.
+        producer_key = NameObject("/Producer")
+        changed_info = {producer_key: output_doc._info.getObject()[producer_key]}
+        try:
+            with profile_stage("write_output"):
+                write_incremental_update(fixed_input_doc_fname, output_doc_fname,
+                                         input_doc, changed_page_nums, changed_info)
+        except (KeyboardInterrupt, EOFError):
+            raise
+        except Exception as e: # PyPDF2 can raise various exceptions.
+            print("\nWarning in pdfCropMargins: The incremental update could not be"
+                  "\nwritten, so the whole document is written instead.  The error"
+                  "\nwas:\n   ", e, file=sys.stderr)
+        else:
+            fixed_input_doc_file_object.close()
+            return bounding_box_list
+
     if args.verbose:
         print("\nWriting the cropped PDF file.")
 
@@ -1206,20 +1448,21 @@ def process_pdf_file(input_doc_fname, fixed_input_doc_fname, output_doc_fname,
         ex.cleanup_and_exit(1)
 
     try:
-        output_doc.write(output_doc_stream)
+        with profile_stage("write_output"):
+            output_doc.write(output_doc_stream)
     except (KeyboardInterrupt, EOFError):
         raise
     except: # PyPDF2 can raise various exceptions.
         try:
-            # We know the write succeeded on tmp_output_doc or we wouldn't be here.
             # Malformed document catalog info can cause write failures, so get
             # a new output_doc without that data and try the write again.
             print("\nWrite failure, trying one more time...", file=sys.stderr)
             output_doc_stream.close()
             output_doc_stream = open(output_doc_fname, "wb")
-            output_doc, tmp_output_doc, already_cropped = setup_output_document(
-                    input_doc, tmp_input_doc, metadata_info, copy_document_catalog=False)
-            output_doc.write(output_doc_stream)
+            output_doc, already_cropped = setup_output_document(
+                    input_doc, metadata_info, copy_document_catalog=False)
+            with profile_stage("write_output"):
+                output_doc.write(output_doc_stream)
             print("\nWarning: Document catalog data caused a write failure.  A retry"
                   "\nwithout that data succeeded.  No document catalog information was"
                   "\ncopied to the cropped output file.  Try fixing the PDF file.  If"
@@ -1332,15 +1575,86 @@ def handle_options_on_cropped_file(input_doc_fname, output_doc_fname):
     if args.verbose:
         print("\nFinished this run of pdfCropMargins.\n")
 
+def is_version_command(argv_list):
+    """Return true if the command-line arguments in `argv_list` include the
+    `--version` option.  Only the arguments before any "--" are options, and
+    the values of the options which take a fixed number of values are skipped
+    (argparse reports an error if any of those values is an option)."""
+    option_actions = dict((option_string, action) for action in cmd_parser._actions
+                          for option_string in action.option_strings)
+    num_values_to_skip = 0
+    for arg in argv_list:
+        if arg == "--":
+            return False
+        if num_values_to_skip:
+            num_values_to_skip -= 1
+            continue
+        if arg == "--version":
+            return True
+        action = option_actions.get(arg)
+        if action is not None:
+            num_values_to_skip = 1 if action.nargs is None else action.nargs
+            if not isinstance(num_values_to_skip, int): # Like "?", "*", or "+".
+                num_values_to_skip = 0
+    return False
+
 def main_crop(argv_list=None):
     """Process command-line arguments, do the PDF processing, and then perform final
     processing on the filenames.  If `argv_list` is set then it is used instead of
-    `sys.argv`."""
+    `sys.argv`.  When more than one file is selected they are all cropped in
+    batch mode.  With the `--server` option the program runs as a server."""
+    argv = sys.argv[1:] if argv_list is None else argv_list
+    if is_version_command(argv): # Fast path, all other options are ignored.
+        print(__version__, end="")
+        ex.cleanup_and_exit(0)
+    if crop_client.is_server_command(argv):
+        from . import crop_server
+        ex.cleanup_and_exit(crop_server.run_server(argv_list))
+
     parsed_args = parse_command_line_arguments(cmd_parser, argv_list=argv_list)
 
+    if batch_processing.is_batch_mode(parsed_args):
+        ex.job.args = parsed_args # Used by `generate_default_filename`.
+        exit_code = batch_processing.crop_batch(parsed_args, crop_file,
+                                                generate_default_filename)
+        ex.cleanup_and_exit(exit_code)
+
+    crop_file(parsed_args)
+
+def crop_file(parsed_args):
+    """Crop the single input file selected by the parsed command-line arguments
+    `parsed_args`, and then perform final processing on the filenames.  With
+    the `--profileReport` option the stages are profiled and the report is
+    written when the job finishes, even if it exits early."""
+    if not parsed_args.profileReport:
+        crop_file_without_report(parsed_args)
+        return
+
+    profile_report.start_profile()
+    exit_code = 1 # For any exception other than `SystemExit`.
+    try:
+        crop_file_without_report(parsed_args)
+        exit_code = 0
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else int(e.code is not None)
+        raise
+    finally:
+        num_pages = (len(ex.job.bounding_box_list)
+                     if ex.job.bounding_box_list is not None else None)
+        profile_report.write_profile_report(parsed_args.profileReport,
+                                            ex.job.input_doc_fname,
+                                            ex.job.output_doc_fname, num_pages, exit_code)
+
+def crop_file_without_report(parsed_args):
+    """Do the work of `crop_file`, apart from the profile report."""
+    # Only PyPDF2 is needed until the '--checkPrevCropped' option, which exits,
+    # has been handled, so the other modules are imported after that.
+    import_pypdf2_modules()
+
     # Process some of the command-line arguments (also sets `args` globally).
     input_doc_fname, fixed_input_doc_fname, output_doc_fname = (
                                            process_command_line_arguments(parsed_args))
+    import_pdf_modules()
 
     if args.gui:
         from .gui import create_gui
@@ -1352,6 +1666,10 @@ def main_crop(argv_list=None):
         if did_crop:
             handle_options_on_cropped_file(input_doc_fname, output_doc_fname)
     else:
-        process_pdf_file(input_doc_fname, fixed_input_doc_fname, output_doc_fname)
+        bounding_box_list = None
+        if args.readCropData:
+            bounding_box_list = read_crop_data_file(args.readCropData)
+        process_pdf_file(input_doc_fname, fixed_input_doc_fname, output_doc_fname,
+                         bounding_box_list)
         handle_options_on_cropped_file(input_doc_fname, output_doc_fname)
 
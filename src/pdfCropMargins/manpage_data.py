@@ -263,7 +263,22 @@ cmd_parser.add_argument("pdf_input_doc", nargs="+", metavar="PDF_FILE", help="""
    directory at the time when the program was run.  If the input file has no
    extension or has an extension other than '.pdf' or '.PDF' then the suffix
    '.pdf' will be appended to the existing (possibly-null) extension.  Globbing
-   of wildcards is performed on Windows systems.^^n""")
+   of wildcards is performed on Windows systems.
+
+   If more than one file is given, or a directory, or a quoted wildcard
+   pattern which matches more than one file, then the program runs in batch
+   mode.  All the files are cropped with the same options, concurrently by the
+   number of worker processes set by '--batchJobs'.  Directories are searched
+   recursively for files with the extension '.pdf' (in any case), skipping
+   files with names like the ones the program generates for its outputs.  The
+   wildcard "**" matches any number of subdirectories.  In batch mode each
+   output file is written next to its input file with the default-generated
+   name, or into the directory named by the '--outfile' option.  An error in
+   one file does not stop the others from being cropped, and a summary with
+   the time taken for each file is printed at the end.  The exit code is zero
+   only if all the files were cropped.  The options '--gui', '--preview',
+   '--queryModifyOriginal', '--writeCropDataToFile', and '--readCropData'
+   cannot be used in batch mode.^^n""")
 
 cmd_parser.add_argument("-o", "--outfile", nargs=1, metavar="OUTFILE_NAME",
                        default=[], help="""
@@ -274,7 +289,11 @@ cmd_parser.add_argument("-o", "--outfile", nargs=1, metavar="OUTFILE_NAME",
    program will generate an output filename from the input filename.  (By
    default "_cropped" is appended to the input filename before the file
    extension.  If the extension is not '.pdf' or '.PDF' then '.pdf' is appended
-   to the extension).  Globbing of wildcards is performed on Windows systems.^^n""")
+   to the extension).  Globbing of wildcards is performed on Windows systems.
+   In batch mode this option names the directory to write the output files to
+   (see the description of the input files).  It is created if it does not
+   exist, and the files found in a directory argument keep their relative
+   paths inside of it.^^n""")
 
 cmd_parser.add_argument("-v", "--verbose", action="store_true", help="""
 
@@ -445,8 +464,10 @@ cmd_parser.add_argument("-g", "-pg", "--pages", metavar="PAGESTR", help="""
    should be a list of the usual form such as "2-4,5,9,20-30".  The
    page-numbering is assumed to start at 1.  Ordering in the argument list
    is unimportant, negative ranges are ignored, and pages falling outside the
-   document are ignored.  Note that restore information is always saved for all
-   the pages (in the ArtBox) unless '--noundosave' is selected.^^n""")
+   document are ignored.  Only the selected pages are rendered and analyzed
+   when finding the bounding boxes.  Note that restore information is always
+   saved for all the pages (in the ArtBox) unless '--noundosave' is
+   selected.^^n""")
 
 cmd_parser.add_argument("-t", "--threshold", type=int, nargs=1,
                default=[DEFAULT_THRESHOLD_VALUE], metavar="BYTEVAL", help="""
@@ -497,6 +518,176 @@ cmd_parser.add_argument("-gsr", "--gsRender", action="store_true", help="""
    option has no effect if '--gsBbox' is chosen, since then no explicit
    rendering is done.^^n""")
 
+cmd_parser.add_argument("-be", "--bboxEngine",
+                        choices=["default", "mupdf", "vector", "hybrid"],
+                        default="default", metavar="ENGINE", help="""
+
+   Select the engine used to find the bounding boxes.  The value "default"
+   renders the pages with pdftoppm or Ghostscript (as selected by the other
+   options) and analyzes the image files they write.  The value "mupdf" renders
+   each page in-process with the PyMuPDF package, directly to a grayscale image
+   in memory.  That avoids starting any external programs and writing any page
+   images to the temp directory, which is usually much faster for long
+   documents.  The threshold, blur, and smoothing options are all respected.
+   The value "vector" does not render the pages at all (except as a fallback).
+   It computes the bounding boxes from the positions of the text, vector
+   graphics, and images on the page as reported by PyMuPDF, which is very fast
+   and independent of the resolution.  Text and graphics in colors lighter than
+   the threshold are ignored.  Text boxes come from the font metrics, so they
+   can be slightly larger than the inked area, and clipping paths inside the
+   page are not taken into account.  Pages which cannot be handled (such as
+   pages with shadings, or any page when the threshold is negative) are
+   rendered with the "mupdf" engine.  The value "hybrid" chooses an engine for
+   each page: pages where a single image covers at least half the page (such as
+   scanned pages) are rendered with the "mupdf" engine, so the thresholding of
+   the pixels is used, and all other pages use the "vector" engine.  That suits
+   documents which mix scanned and born-digital pages.  The engines other than
+   "default" need the PyMuPDF package to be installed (it is installed with the
+   GUI option), and the "vector" engine needs PyMuPDF 1.18.0 or later.  When
+   this option is set the '--gsBbox' and '--gsRender' options are ignored.
+   With any of the engines, pages which only display a single image are handled
+   by the image fast path instead, unless the '--noImageFastPath' option is
+   set.^^n""")
+
+cmd_parser.add_argument("-rp", "--renderProfile",
+                        choices=["default", "gray", "fast", "mono"],
+                        default="default", metavar="PROFILE", help="""
+
+   Select the image format used when pdftoppm or Ghostscript renders the pages
+   to find the bounding boxes.  The value "default" uses color PPM images from
+   pdftoppm and grayscale PNG images from Ghostscript (BMP on Windows).  The
+   value "gray" uses grayscale PGM images, which are a third of the size of
+   the color images (raw PGM images with Ghostscript, which avoids the PNG
+   compression and decompression).  The value "fast" is the same as "gray" but
+   with anti-aliasing turned off, which is faster to render.  The value "mono"
+   renders 1-bit PBM images with no anti-aliasing; these are the smallest
+   images, but the renderer does the thresholding itself so the '--threshold'
+   value has little effect.  Grayscale rendering can find slightly different
+   bounding boxes than color rendering for light-colored content, because each
+   color component is otherwise compared to the threshold separately.  This
+   option does not affect the in-process PyMuPDF engine, which always renders
+   grayscale images.^^n""")
+
+cmd_parser.add_argument("-j", "--jobs", type=int, default=0, metavar="INT", help="""
+
+   The number of external renderer processes (pdftoppm or Ghostscript) to run
+   at the same time when finding the bounding boxes.  The selected pages are
+   split into that many shards of contiguous pages, each of which is rendered
+   by a separate process.  This can greatly speed up the processing of long
+   documents on multi-core machines.  The default value of zero uses the
+   number of CPUs actually available to the program, taking into account the
+   CPU affinity and any CPU quota set on a container.  Setting the value to
+   one renders all the pages with a single process.  This option does not
+   affect the in-process PyMuPDF engine.^^n""")
+
+cmd_parser.add_argument("-bj", "--batchJobs", type=int, default=0, metavar="INT",
+                        help="""
+
+   The number of worker processes which crop files at the same time in batch
+   mode, when more than one file is given.  The default value of zero uses the
+   number of CPUs actually available to the program.  Unless the '--jobs'
+   option is also set, the available CPUs are divided among the workers for
+   rendering the pages of their files.^^n""")
+
+cmd_parser.add_argument("-srv", "--server", metavar="SOCKET", help="""
+
+   Run as a server which crops files for clients, listening on the Unix domain
+   socket with this path, until it is killed.  No PDF_FILE arguments are
+   given; the only other options allowed are '--serverJobs' and '--verbose'.
+   The server imports the program modules and finds the external programs
+   once, so each crop skips the startup time of the program.  When the
+   environment variable PDFCROPMARGINS_SERVER is set to the socket path, the
+   pdf-crop-margins command sends its arguments and current directory to the
+   server, prints the output of the crop, and exits with its exit code.  If no
+   server is listening on the socket the command crops the file itself.  The
+   options '--gui' and '--queryModifyOriginal', and cropping more than one file
+   at once, are not supported through the server.  Not available on
+   Windows.^^n""")
+
+cmd_parser.add_argument("-srvj", "--serverJobs", type=int, default=0, metavar="INT",
+                        help="""
+
+   The number of crops that a server started with '--server' runs at the same
+   time, in separate threads.  Other requests wait for one of them to finish.
+   The default value of zero uses the number of CPUs actually available to the
+   program.^^n""")
+
+cmd_parser.add_argument("-tsb", "--tempSpaceBudget", type=float, default=0,
+                        metavar="MB", help="""
+
+   Limit the temporary disk space used for the rendered page images to about
+   this many megabytes.  The selected pages are rendered in windows of pages
+   whose images are estimated (uncompressed, at the rendering resolution) to
+   fit in the budget, and the images from each window are deleted before the
+   next window is rendered.  Note that a single page is always rendered, even
+   if its image alone is over the budget.  The default value of zero means no
+   limit.  Page images are deleted as soon as they are analyzed in any case,
+   but with no limit the renderers can get ahead of the analysis on long
+   documents.  This option does not affect the Ghostscript bounding-box
+   option or the in-process PyMuPDF engine.^^n""")
+
+cmd_parser.add_argument("-cr", "--coarseRes", type=int, default=0, metavar="DPI",
+                        help="""
+
+   Find the bounding boxes in two passes, starting at this low resolution in
+   dots per inch.  The pages are first rendered at the coarse resolution to find
+   approximate bounding boxes.  Then only thin strips around the four edges of
+   those boxes are rendered at the full resolution set by '--resX' and '--resY',
+   and the exact edges are found from the strips.  This gives the precision of
+   a high resolution (such as 600 dpi) at a small fraction of the cost of
+   rendering whole pages at that resolution.  Pages where the edges cannot be
+   found from the strips (such as blank pages) are rendered in full.  A value
+   like 50 usually works well.  Only works with pdftoppm rendering or the
+   PyMuPDF engine; it is ignored with the Ghostscript options.  The default
+   of zero does a single pass.^^n""")
+
+cmd_parser.add_argument("-nif", "--noImageFastPath", action="store_true", help="""
+
+   Do not use the fast path for pages which only display a single image, such
+   as most scanned pages.  Normally the bounding box of such a page is found by
+   decoding the embedded image directly (JPEG images are decoded at a reduced
+   size when that is still at least the '--resX' and '--resY' resolution) and
+   thresholding it, without running any renderer.  JPEG, CCITT fax, and
+   Flate-compressed gray or RGB images are supported, and any other pages are
+   rendered as usual.  The fast path is never used with the '--gsBbox' option.
+
+   Note that the fast path changes the bounding boxes of these pages from
+   those of earlier versions of the program, which rendered every page.  The
+   image is thresholded at its own resolution rather than being resampled to
+   the rendering resolution, so the boxes can differ slightly.  Set this
+   option to get the same bounding boxes as earlier versions.^^n""")
+
+cmd_parser.add_argument("-bc", "--bboxCache", action="store_true", help="""
+
+   Save the calculated bounding boxes in a persistent on-disk cache, and use
+   the saved ones instead of calculating them again when the same document is
+   cropped again with the same bounding-box settings.  The cache key is a hash
+   of the contents of the PDF file together with the options that the bounding
+   boxes depend on (such as the engine, the resolution, the threshold, the
+   blurs and smooths, the full page box, the pre-crop, and the pages
+   selected).  Options like '--percentRetain', '--uniform', and
+   '--absoluteOffset' are only applied after the bounding boxes are found, so
+   re-cropping a document with different values for them is almost
+   instant.  The bounding box of each page is also saved separately, keyed by
+   a fingerprint of what the page draws (its content streams, resources,
+   annotations, and boxes), so pages which also appear in other documents are
+   not analyzed again.  The cache can be shared by concurrent processes.  See
+   also the '--bboxCacheDir' and '--bboxCacheSize' options.^^n""")
+
+cmd_parser.add_argument("-bcd", "--bboxCacheDir", type=str, default="",
+                        metavar="DIR", help="""
+
+   The directory for the '--bboxCache' option.  The default is a
+   "pdfCropMargins" directory in the usual per-user cache directory of the
+   operating system (such as "~/.cache" on Linux).^^n""")
+
+cmd_parser.add_argument("-bcs", "--bboxCacheSize", type=float, default=64,
+                        metavar="MB", help="""
+
+   The maximum total size, in megabytes, of the entries saved by the
+   '--bboxCache' option.  When a new entry would make the cache larger than
+   this, the least-recently used entries are deleted.  The default is 64.^^n""")
+
 cmd_parser.add_argument("-x", "--resX", type=int, default=150,
                        metavar="DPI", help="""
 
@@ -572,6 +763,20 @@ cmd_parser.add_argument("-A", "--noundosave", action="store_true", help="""
    cropping command.  (The program does not currently check for this when doing
    a restore.)^^n""")
 
+cmd_parser.add_argument("-cp", "--checkPrevCropped", action="store_true", help="""
+
+   Only check whether the input PDF file was already cropped by pdfCropMargins,
+   and then exit.  The check uses the Producer metadata, like the
+   '--restore' option does.  Only the trailer and the document information
+   dictionary of the file are read, so the check is fast.  The file is not
+   cropped and no output file is written.  For a single input file the
+   character "y" or "n" is printed.  Several input files can be given with
+   this option.  Then a line is printed for each one with "y", "n", or "?" (if
+   the file cannot be read), a tab, and the filename.  The exit code is 0 if
+   every file was already cropped, 1 if any file was not, and 2 if any file
+   could not be read.  The '--password' option is used for encrypted
+   files.^^n""")
+
 cmd_parser.add_argument("-gsf", "--gsFix", action="store_true", help="""
 
    Attempt to repair the input PDF file with Ghostscript before it is read-in
@@ -739,6 +944,20 @@ cmd_parser.add_argument("-dcw", "--docCatWhitelist", default="",
    blacklist is used.  Setting to "ALL" guarantees that everything possible is
    copied over.^^n""")
 
+cmd_parser.add_argument("-iw", "--incrementalWrite", action="store_true", help="""
+
+   Write the cropped document as an incremental update of the input PDF file.
+   The bytes of the input file are copied unchanged and only the modified page
+   dictionaries, the document information dictionary, and a new
+   cross-reference section are appended.  This is much faster than rewriting
+   the whole document for large files, and it leaves things like object
+   streams, signature byte ranges, and linearization hints in the original
+   part of the file intact.  The whole document catalog is kept, so the
+   '--docCatBlacklist' and '--docCatWhitelist' options have no effect.
+   Encrypted documents cannot be written this way; if the incremental update
+   cannot be written a warning is printed and the whole document is written
+   as usual.^^n""")
+
 cmd_parser.add_argument("-i", "--showImages", action="store_true", help="""
 
    When explicitly rendering PDF files to image files, display the inverse
@@ -770,7 +989,12 @@ cmd_parser.add_argument("-ppp", "--pdftoppmPath", type=str, metavar="PATH",
 
    Pass in a pathname to the pdftoppm executable that the program should use.
    No globbing is done.  Useful when the program is in a nonstandard
-   location.^^n""")
+   location.  Otherwise the Ghostscript and pdftoppm executables found on the
+   PATH, and the results of testing them, are saved in the file
+   "executables.json" in the per-user cache directory of the program.  Later
+   runs reuse the results without running the executables to test them, as
+   long as the PATH and the modification times and inodes of the executables
+   are unchanged.^^n""")
 
 cmd_parser.add_argument("--version", action="store_true", help="""
 
@@ -781,5 +1005,46 @@ cmd_parser.add_argument("-wcdf", "--writeCropDataToFile", type=str,
                         default="", metavar="FILEPATH", help="""
 
    Write out the calculated list of crops to the file with the filename that is
-   passed in and exit.  Mostly used for automated testing and debugging.^^n""")
-
+   passed in and exit.  Mostly used for automated testing and debugging.  The
+   format of the file is set with the '--cropDataFormat' option.^^n""")
+
+cmd_parser.add_argument("-cdf", "--cropDataFormat", choices=["text", "json", "ndjson"],
+                        default="text", metavar="FORMAT", help="""
+
+   The format of the file written with the '--writeCropDataToFile' option.  The
+   choices are "text", "json", and "ndjson", with "text" the default.  The
+   text format just lists the crop box of each page which is cropped.  The
+   JSON and NDJSON formats hold, for every page, the 1-based page number, the
+   rotation, the full-page box, the bounding box, and the final crop box (which
+   is null for pages not selected for cropping).  All boxes are lists of the
+   left, bottom, right, and top values in PDF coordinates.  In the JSON format
+   the page data is the "pages" list of a single object, and in the NDJSON
+   format each line holds the data for one page.  Files in either of these
+   formats can be read back with the '--readCropData' option.^^n""")
+
+cmd_parser.add_argument("-rcd", "--readCropData", type=str, default="",
+                        metavar="FILEPATH", help="""
+
+   Read the bounding boxes of the pages from a JSON or NDJSON crop-data file
+   written with the '--writeCropDataToFile' and '--cropDataFormat' options,
+   instead of calculating them.  No pages are rendered, so this is fast.  The
+   other options, such as '--percentRetain' and '--uniform', are applied to the
+   boxes as usual.  The file must have the data for every page of the
+   document.  This allows the bounding boxes to be calculated once and then
+   used to crop the document with different settings, or on another machine.^^n""")
+
+cmd_parser.add_argument("-prf", "--profileReport", type=str, default="",
+                        metavar="FILEPATH", help="""
+
+   Profile the stages of the crop and write a report in JSON format to the file
+   with the filename that is passed in, or to stdout if it is "-".  The report
+   holds the total wall time and CPU time, the peak memory used (the resident
+   set size, where available), the number of bytes written to temporary files,
+   the number of external programs run, the time and CPU time of each stage
+   (such as parsing the PDF, rendering, analyzing the page images, and writing
+   the output), and the time spent analyzing each page.  The report is written
+   even if the crop fails, with the exit code.  The CPU times and memory sizes
+   are for the whole process, so they include any other crops running in the
+   same server.  Some stages run at the same time, such as rendering and image
+   analysis, so the stage times can add up to more than the total.  Not
+   allowed when cropping more than one file.^^n""")
@@ -31,7 +31,6 @@ another as a graphic.  Many options are available.
 
 from __future__ import print_function, division, absolute_import
 import sys
-import signal
 
 def main():
     """Crop with the arguments in `sys.argv`, catching any exceptions and cleaning
@@ -44,6 +43,16 @@ def main():
     # info is avoided on user's Ctrl-C (`KeyboardInterrupt`, `EOFError` on Windows)
     # during startup.
     try:
+        # When a server socket is set in the environment the thin client forwards
+        # the arguments to the server, skipping the startup of the program.
+        from . import crop_client
+        server_socket_path = crop_client.get_server_socket_path()
+        if server_socket_path and not crop_client.is_server_command(sys.argv[1:]):
+            exit_code = crop_client.forward_to_server(server_socket_path, sys.argv[1:])
+            if exit_code is not None:
+                sys.exit(exit_code)
+
+        import signal
         from .external_program_calls import cleanup_and_exit, create_temporary_directory
         from .main_pdfCropMargins import main_crop
 
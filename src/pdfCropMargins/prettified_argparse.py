@@ -180,18 +180,21 @@ def parse_command_line_arguments(argparse_parser, argv_list=None, init_indent=5,
     sys.stderr = RedirectHelp(sys.stderr, help_string_replacement_pairs,
             init_indent, subs_indent, line_width) # redirect stderr to add postprocessor
 
-    # Run the actual argument-parsing operation via argparse.
-    parsed_args = argparse_parser.parse_args(args=argv_list)
-
-    # The argparse class has finished its argument-processing, so now no more
-    # usage or help messages will be printed.  So restore stdout and stderr
-    # to their usual settings.
-    if self_flushing:
-        sys.stdout = SelfFlushingOutstream(old_stdout)
-        sys.stderr = SelfFlushingOutstream(old_stderr)
-    else:
-        sys.stdout = old_stdout
-        sys.stderr = old_stderr
+    # Run the actual argument-parsing operation via argparse.  Argparse exits
+    # after printing help or usage messages, so the streams are restored in a
+    # `finally` (for callers which catch the `SystemExit`).
+    try:
+        parsed_args = argparse_parser.parse_args(args=argv_list)
+    finally:
+        # The argparse class has finished its argument-processing, so now no more
+        # usage or help messages will be printed.  So restore stdout and stderr
+        # to their usual settings.
+        if self_flushing:
+            sys.stdout = SelfFlushingOutstream(old_stdout)
+            sys.stderr = SelfFlushingOutstream(old_stderr)
+        else:
+            sys.stdout = old_stdout
+            sys.stderr = old_stderr
 
     return parsed_args
 
@@ -0,0 +1,222 @@
+"""
+
+This module implements the `--profileReport` option, which measures the time
+and resources used by each stage of cropping a document and writes them to a
+JSON file.  The profile is saved in the state of the current job, so it is
+`None` (and the instrumentation does nothing) unless the option is set.
+
+The wall times of the stages are measured with the most precise clock
+available.  The CPU times are for the whole process (and, separately, its
+finished subprocesses), so with several jobs running in threads at the same
+time they include the work of the other jobs.  Some stages also overlap, such
+as the rendering and the analysis of the page images, which run concurrently.
+
+=====================================================================
+
+pdfCropMargins -- a program to crop the margins of PDF files
+Copyright (C) 2014 Allen Barker (Allen.L.Barker@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Source code site: https://github.com/abarker/pdfCropMargins
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import time
+import json
+import threading
+import contextlib
+
+try:
+    import resource # Not available on Windows.
+    hasResource = True
+except ImportError:
+    hasResource = False
+
+from . import __version__
+from . import external_program_calls as ex
+
+PROFILE_REPORT_FORMAT_VERSION = 1
+
+if hasattr(time, "perf_counter"): # Python 3.3 and later.
+    get_wall_time = time.perf_counter
+else:
+    get_wall_time = time.time
+
+def get_cpu_times():
+    """Return a tuple of the user plus system CPU time of the process and of its
+    finished subprocesses, in seconds."""
+    times = os.times()
+    return times[0] + times[1], times[2] + times[3]
+
+def get_peak_rss_bytes(who):
+    """Return the peak resident set size in bytes of the process, if `who` is
+    `resource.RUSAGE_SELF`, or of its largest finished subprocess, if it is
+    `resource.RUSAGE_CHILDREN`.  Returns `None` if it is not available."""
+    if not hasResource:
+        return None
+    max_rss = resource.getrusage(who).ru_maxrss
+    if sys.platform == "darwin":
+        return max_rss # Reported in bytes on macOS, kilobytes elsewhere.
+    return max_rss * 1024
+
+class JobProfile(object):
+    """The measurements for the profile report of one job.  The methods can be
+    called from the worker threads of the job."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_wall_time = get_wall_time()
+        self.start_cpu_times = get_cpu_times()
+        self.stages = [] # The stage dicts, in the order the stages first started.
+        self.stage_dicts = {} # The stage dicts by name.
+        self.subprocess_counts = {} # The number of subprocesses run for each program.
+        self.temp_bytes_written = 0
+        self.page_analysis_times = {} # Seconds spent analyzing each page, by page number.
+
+    def add_stage_time(self, stage_name, wall_time, cpu_time, child_cpu_time):
+        """Add the times for one run of the stage `stage_name`."""
+        with self.lock:
+            stage = self.stage_dicts.get(stage_name)
+            if stage is None:
+                stage = {"name": stage_name, "calls": 0, "wall_time": 0.0,
+                         "cpu_time": 0.0, "child_cpu_time": 0.0}
+                self.stage_dicts[stage_name] = stage
+                self.stages.append(stage)
+            stage["calls"] += 1
+            stage["wall_time"] += wall_time
+            stage["cpu_time"] += cpu_time
+            stage["child_cpu_time"] += child_cpu_time
+
+    def count_subprocess(self, command_list):
+        """Count a subprocess run with the command list `command_list`."""
+        program_name = os.path.basename(command_list[0]) if command_list else ""
+        with self.lock:
+            self.subprocess_counts[program_name] = (
+                                     self.subprocess_counts.get(program_name, 0) + 1)
+
+    def add_temp_file(self, file_name):
+        """Count the bytes of the temporary file `file_name`, which must still
+        exist, as written to the temp directory."""
+        try:
+            file_size = os.path.getsize(file_name)
+        except OSError:
+            return
+        with self.lock:
+            self.temp_bytes_written += file_size
+
+    def add_page_analysis_time(self, page_num, seconds):
+        """Add `seconds` to the analysis time of the page `page_num` (from zero)."""
+        with self.lock:
+            self.page_analysis_times[page_num] = (
+                                     self.page_analysis_times.get(page_num, 0.0) + seconds)
+
+    def get_report(self, input_doc_fname, output_doc_fname, num_pages, exit_code):
+        """Return the dict of the profile report, which can be written as JSON."""
+        cpu_time, child_cpu_time = get_cpu_times()
+        with self.lock:
+            return {"format_version": PROFILE_REPORT_FORMAT_VERSION,
+                    "program_version": __version__,
+                    "input_file": input_doc_fname,
+                    "output_file": output_doc_fname,
+                    "num_pages": num_pages,
+                    "exit_code": exit_code,
+                    "wall_time": get_wall_time() - self.start_wall_time,
+                    "cpu_time": cpu_time - self.start_cpu_times[0],
+                    "child_cpu_time": child_cpu_time - self.start_cpu_times[1],
+                    "peak_rss_bytes": get_peak_rss_bytes(resource.RUSAGE_SELF)
+                                      if hasResource else None,
+                    "peak_child_rss_bytes": get_peak_rss_bytes(resource.RUSAGE_CHILDREN)
+                                            if hasResource else None,
+                    "temp_bytes_written": self.temp_bytes_written,
+                    "subprocesses": {"total": sum(self.subprocess_counts.values()),
+                                     "by_program": dict(self.subprocess_counts)},
+                    "stages": [dict(stage) for stage in self.stages],
+                    "page_analysis_times": [
+                        {"page": page_num + 1, "time": seconds}
+                        for page_num, seconds in sorted(self.page_analysis_times.items())]}
+
+def start_profile():
+    """Start profiling the current job."""
+    ex.job.profile = JobProfile()
+
+def get_profile():
+    """Return the `JobProfile` of the current job, or `None` if it is not profiled."""
+    return ex.job.profile
+
+@contextlib.contextmanager
+def profile_stage(stage_name):
+    """Time the code inside the context as a run of the stage `stage_name`, if
+    the current job is profiled."""
+    profile = get_profile()
+    if profile is None:
+        yield
+        return
+    start_wall_time = get_wall_time()
+    start_cpu_time, start_child_cpu_time = get_cpu_times()
+    try:
+        yield
+    finally:
+        cpu_time, child_cpu_time = get_cpu_times()
+        profile.add_stage_time(stage_name, get_wall_time() - start_wall_time,
+                               cpu_time - start_cpu_time,
+                               child_cpu_time - start_child_cpu_time)
+
+@contextlib.contextmanager
+def profile_page_analysis(page_num):
+    """Time the code inside the context as analysis of the page `page_num`, if
+    the current job is profiled."""
+    profile = get_profile()
+    if profile is None:
+        yield
+        return
+    start_wall_time = get_wall_time()
+    try:
+        yield
+    finally:
+        profile.add_page_analysis_time(page_num, get_wall_time() - start_wall_time)
+
+def add_page_analysis_time(page_num, start_wall_time):
+    """Add the time since `start_wall_time` (from `get_wall_time`) to the
+    analysis time of the page `page_num` if the current job is profiled.  This
+    is for loops where a context would not fit."""
+    profile = get_profile()
+    if profile is not None:
+        profile.add_page_analysis_time(page_num, get_wall_time() - start_wall_time)
+
+def add_temp_file(file_name):
+    """Count the size of the temporary file `file_name` if the current job is
+    profiled.  Call it before the file is deleted."""
+    profile = get_profile()
+    if profile is not None:
+        profile.add_temp_file(file_name)
+
+def write_profile_report(report_file_name, input_doc_fname, output_doc_fname,
+                         num_pages, exit_code):
+    """Write the profile report of the current job as JSON to the file
+    `report_file_name`, or to stdout if it is "-"."""
+    report = get_profile().get_report(input_doc_fname, output_doc_fname, num_pages,
+                                      exit_code)
+    report_text = json.dumps(report, indent=2) + "\n"
+    if report_file_name == "-":
+        sys.stdout.write(report_text)
+        return
+    try:
+        with open(report_file_name, "w") as f:
+            f.write(report_text)
+    except IOError as e:
+        print("\nWarning in pdfCropMargins: Could not write the profile report file:"
+              "\n   {}".format(e), file=sys.stderr)
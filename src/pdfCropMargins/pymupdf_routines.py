@@ -28,8 +28,12 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from __future__ import print_function, absolute_import
 
+import sys
+import threading
 import warnings
 
+from . import external_program_calls as ex
+
 try: # Extra dependencies for the GUI version.  Make sure they are installed.
     with warnings.catch_warnings():
         #warnings.filterwarnings("ignore",category=DeprecationWarning)
@@ -38,24 +42,45 @@ try: # Extra dependencies for the GUI version.  Make sure they are installed.
     if not [int(i) for i in fitz.VersionBind.split(".")] >= [1, 14, 5]:
         raise ImportError
 except ImportError:
-    print("\nError in pdfCropMargins: The GUI feature requires {}."
+    print("\nError in pdfCropMargins: The GUI and the PyMuPDF bounding-box engine"
+          "\nrequire {}."
           "\nIf installing via pip, use the optional-feature install, e.g.:"
           "\n   pip install pdfCropMargins[gui] --upgrade --user"
           "\n\nExiting pdf-crop-margins...".format(requires), file=sys.stderr)
     ex.cleanup_and_exit(1)
 
 
-def open_document(doc_fname):
-    """Return the document opened by fitz (PyMuPDF)."""
+# The lock held by a job while it uses PyMuPDF to find bounding boxes.  PyMuPDF
+# is not thread safe, and jobs can run in different threads of one process.
+pymupdf_lock = threading.RLock()
+
+def get_fitz_attribute(fitz_object, name, old_name):
+    """Return the attribute `name` of the PyMuPDF object `fitz_object`, or the
+    attribute `old_name` if it does not have that one.  PyMuPDF 1.18 added
+    snake_case names for its methods and properties, and 1.20 removed the old
+    camelCase ones."""
+    if hasattr(fitz_object, name):
+        return getattr(fitz_object, name)
+    return getattr(fitz_object, old_name)
+
+def open_document(doc_fname, password=None):
+    """Return the document opened by fitz (PyMuPDF).  If the document is
+    encrypted it is authenticated with `password`, or with the empty password
+    if that is not set."""
     try:
         document = fitz.open(doc_fname)
     except RuntimeError:
         print("\nError in pdfCropMargins: The PyMuPDF program could not read"
-              " the document\n   '{}'\nin order to display it in the GUI.   If you have"
-              " Ghostscript installed\nconsider running pdfCropMargins with the"
-              " '--gsFix' option to attempt to repair it."
+              " the document\n   '{}'\nIf you have"
+              " Ghostscript installed consider running pdfCropMargins with the"
+              "\n'--gsFix' option to attempt to repair it."
               .format(doc_fname), file=sys.stderr)
         ex.cleanup_and_exit(1)
+    if (get_fitz_attribute(document, "needs_pass", "needsPass")
+            and not document.authenticate(password or "")):
+        print("\nError in pdfCropMargins: The PyMuPDF program could not decrypt"
+              " the document\n   '{}'".format(doc_fname), file=sys.stderr)
+        ex.cleanup_and_exit(1)
     page_count = len(document)
     return document, page_count
 
@@ -71,7 +96,8 @@ def get_page(page_num, page_display_list_cache, document, window_size, zoom=Fals
     scale = fitz.Matrix(zoom_x, zoom_y)
     page_display_list = page_display_list_cache[page_num]
     if not page_display_list:  # Create if not yet there.
-        page_display_list_cache[page_num] = document[page_num].getDisplayList()
+        page_display_list_cache[page_num] = get_fitz_attribute(document[page_num],
+                                                "get_displaylist", "getDisplayList")()
         page_display_list = page_display_list_cache[page_num]
 
     rect = page_display_list.rect  # The page rectangle.
@@ -86,7 +112,8 @@ def get_page(page_num, page_display_list_cache, document, window_size, zoom=Fals
     mat_0 = fitz.Matrix(zoom_0, zoom_0)
 
     if not zoom:  # Show the total page.
-        pixmap = page_display_list.getPixmap(matrix=mat_0, alpha=False)
+        pixmap = get_fitz_attribute(page_display_list, "get_pixmap", "getPixmap")(
+                                    matrix=mat_0, alpha=False)
     else:
         w2 = rect.width / 2  # we need these ...
         h2 = rect.height / 2  # a few times
@@ -102,9 +129,97 @@ def get_page(page_num, page_display_list_cache, document, window_size, zoom=Fals
 
         # Clip rect is ready, now fill it.
         mat = mat_0 * fitz.Matrix(2, 2)  # The zoom matrix.
-        pixmap = page_display_list.getPixmap(alpha=False, matrix=mat, clip=clip)
+        pixmap = get_fitz_attribute(page_display_list, "get_pixmap", "getPixmap")(
+                                    alpha=False, matrix=mat, clip=clip)
 
-    image_ppm = pixmap.getImageData("ppm")  # Make PPM image from pixmap for tkinter.
+    # Make PPM image from pixmap for tkinter.
+    image_ppm = get_fitz_attribute(pixmap, "tobytes", "getImageData")("ppm")
 
     return image_ppm, clip.tl  # Return image, clip position.
 
+def render_page_region_to_gray_samples(document, page_num, res_x, res_y, region):
+    """Render a region of the page with 0-based page number `page_num` of the
+    fitz document `document` to an in-memory grayscale pixmap at the
+    resolutions `res_x` and `res_y` (in dots per inch).  The page is rendered
+    unrotated, whatever its `/Rotate` value, and the tuple `region` gives the
+    pixel values `(x, y, width, height)` of the region in the coordinates of the
+    unrotated image of the whole visible page area (the CropBox).  Returns a
+    tuple `(x, y, width, height, stride, samples)`, where `samples` is the raw
+    one-byte-per-pixel buffer and `x` and `y` are the position of the rendered
+    pixmap in the whole page image.  The pixmap can differ slightly from the
+    region requested due to rounding, and it never extends past the CropBox."""
+    page = document[page_num]
+    # The clip is in the rotated page coordinates, and the derotation matrix
+    # turns the rendered page back to its unrotated orientation.
+    derotation_matrix = get_fitz_attribute(page, "derotation_matrix", "derotationMatrix")
+    matrix = derotation_matrix * fitz.Matrix(res_x / 72.0, res_y / 72.0)
+    x, y, width, height = region
+    clip = fitz.Rect(x * 72.0 / res_x, y * 72.0 / res_y,
+                     (x + width) * 72.0 / res_x, (y + height) * 72.0 / res_y)
+    rotation_matrix = get_fitz_attribute(page, "rotation_matrix", "rotationMatrix")
+    pixmap = get_fitz_attribute(page, "get_pixmap", "getPixmap")(matrix=matrix,
+                        colorspace=fitz.csGRAY, alpha=False, clip=clip * rotation_matrix)
+    return (pixmap.x, pixmap.y, pixmap.width, pixmap.height, pixmap.stride,
+            pixmap.samples)
+
+def get_page_image_rects(document, page_num):
+    """Return a list of the rectangles, as `(x0, y0, x1, y1)` tuples in page
+    coordinates, where images are displayed on the page.  Page coordinates are
+    unrotated, with the origin at the top left of the CropBox.  Inline images are only
+    included with newer PyMuPDF versions."""
+    page = document[page_num]
+    if hasattr(page, "get_image_info"): # PyMuPDF 1.18.11 or later.
+        return [tuple(info["bbox"]) for info in page.get_image_info()]
+    image_rects = []
+    for image_item in page.getImageList(full=True):
+        image_rects.append(tuple(page.getImageBbox(image_item)))
+    return image_rects
+
+def get_page_content_rects(document, page_num):
+    """Return a list of the rectangles bounding the text, vector graphics, and
+    images on the page, as `(x0, y0, x1, y1, color)` tuples in page coordinates
+    (with the origin at the top left).  The `color` is an RGB tuple of values
+    between 0 and 1, or `None` if the color is not known (as for images).  Text
+    rectangles are from the font metrics of the spans, and stroked paths are
+    widened by half the line width.  Whitespace and invisible text are skipped.
+    Raises `NotImplementedError` if the PyMuPDF version cannot extract vector
+    graphics."""
+    page = document[page_num]
+    if hasattr(page, "get_drawings"): # The name since PyMuPDF 1.18.
+        get_drawings = page.get_drawings
+    elif hasattr(page, "getDrawings"): # The old name, removed in PyMuPDF 1.20.
+        get_drawings = page.getDrawings
+    else: # Drawings were added in PyMuPDF 1.18.0.
+        raise NotImplementedError("PyMuPDF cannot extract the drawings.")
+    get_text = get_fitz_attribute(page, "get_text", "getText")
+    content_rects = []
+
+    for block in get_text("dict", flags=0)["blocks"]:
+        for line in block.get("lines", []):
+            for span in line["spans"]:
+                if not span["text"].strip() or span.get("alpha", 255) == 0:
+                    continue
+                srgb = span["color"]
+                color = (((srgb >> 16) & 255) / 255.0, ((srgb >> 8) & 255) / 255.0,
+                         (srgb & 255) / 255.0)
+                content_rects.append(tuple(span["bbox"]) + (color,))
+
+    for path in get_drawings():
+        x0, y0, x1, y1 = tuple(path["rect"])
+        if path.get("fill") is not None:
+            content_rects.append((x0, y0, x1, y1, tuple(path["fill"])))
+        if path.get("color") is not None:
+            half_width = (path.get("width") or 1.0) / 2.0
+            content_rects.append((x0 - half_width, y0 - half_width,
+                                  x1 + half_width, y1 + half_width,
+                                  tuple(path["color"])))
+
+    for image_rect in get_page_image_rects(document, page_num):
+        content_rects.append(image_rect + (None,))
+
+    return content_rects
+
+def page_has_content_stream(document, page_num):
+    """Return true if the page's content stream is not empty."""
+    page = document[page_num]
+    return bool(get_fitz_attribute(page, "read_contents", "readContents")().strip())
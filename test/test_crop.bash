@@ -234,6 +234,12 @@ function testRegularAndScanned {
       info_prog="-gsr"
    elif [ "$page_crop_info_program" == "ghostscript_bbox" ]; then
       info_prog="-gs"
+   elif [ "$page_crop_info_program" == "mupdf" ]; then
+      info_prog="-be mupdf"
+   elif [ "$page_crop_info_program" == "vector" ]; then
+      info_prog="-be vector"
+   elif [ "$page_crop_info_program" == "hybrid" ]; then
+      info_prog="-be hybrid"
    fi
 
    if [ "$crop_style_option" == "default" ]; then
@@ -364,6 +370,166 @@ function testOutputFilename {
 }
 
 
+function testIncrementalWrite {
+   #   -iw, --incrementalWrite
+   #                         Write the cropped document as an incremental update of
+   #                         the input PDF file.
+
+   echoInfo
+   echoInfo "Testing writing the single PDF file as an incremental update.  The"
+   echoInfo "cropped file should look the same as a regular crop, and it should"
+   echoInfo "start with an exact copy of the bytes of the original file.  The"
+   echoInfo "parent of each page in the update should still be a /Pages node."
+   returnToContinue || return
+   echoThenRun $python_version "$PROG_PATH" $OPTS -iw -o myname.pdf "$single"
+   cmp -n "$(wc -c < "$single")" "$single" myname.pdf \
+      || echoInfo "The original bytes were not copied unchanged!"
+   bad_parents="$($python_version -c '
+import sys
+from PyPDF2 import PdfFileReader
+doc = PdfFileReader(open(sys.argv[1], "rb"))
+for page_num in range(doc.getNumPages()):
+    parent = doc.getPage(page_num).get("/Parent")
+    if parent is None or parent.getObject().get("/Type") != "/Pages":
+        print(page_num + 1, end=" ")
+' myname.pdf 2>/dev/null)"
+   if [ -n "$bad_parents" ]; then
+      echo -e "$indentLevel${cErr}Pages without a /Pages parent: $bad_parents${cEnd}"
+   else
+      echoInfo "Every page has a /Pages node as its parent."
+   fi
+   afterThenBeforeDisplay "myname.pdf" "$single"
+   rm myname.pdf
+}
+
+function testBatchMode {
+   #   -bj INT, --batchJobs INT
+   #                         The number of worker processes which crop files at
+   #                         the same time in batch mode.
+
+   echoInfo
+   echoInfo "Testing batch mode on all the regular and scanned files, writing the"
+   echoInfo "outputs to a temporary directory.  The summary should list all the"
+   echoInfo "files as cropped, with the corrupt ones (if included) as failed."
+   returnToContinue || return
+   batch_out_dir="$(mktemp -d)"
+   echoThenRun $python_version "$PROG_PATH" $OPTS -bj 2 -o "$batch_out_dir" \
+      regular_* scanned_* corrupt_*
+   ls "$batch_out_dir"
+   rm -r "$batch_out_dir"
+}
+
+
+function testServerMode {
+   #   -srv SOCKET, --server SOCKET
+   #                         Run as a server which crops files for clients,
+   #                         listening on the Unix domain socket with this path.
+
+   echoInfo
+   echoInfo "Testing the server mode.  A server is started in the background and"
+   echoInfo "a regular file is cropped through it; the output should look the"
+   echoInfo "same as when cropping directly."
+   returnToContinue || return
+   server_dir="$(mktemp -d)"
+   $python_version "$PROG_PATH" --server "$server_dir/server.sock" &
+   server_pid=$!
+   sleep 3 # Give the server time to start listening.
+   for file in regular_*
+   do
+      echoThenRun env PDFCROPMARGINS_SERVER="$server_dir/server.sock" \
+         $python_version "$PROG_PATH" $OPTS -v "$file" -o "$server_dir/cropped.pdf"
+      break
+   done
+   kill $server_pid
+   wait $server_pid
+   rm -r "$server_dir"
+}
+
+
+function testStartupImports {
+   #   --version             Return the pdfCropMargins version number and exit
+   #                         immediately.
+
+   echoInfo
+   echoInfo "Testing the startup time of the '--version', '--help', and bad-argument"
+   echoInfo "exits, with -X importtime (Python 3.7 and later).  None of the slow"
+   echoInfo "modules should be listed as imported, and for '-cp' only PyPDF2 should be."
+   returnToContinue || return
+   slow_modules="PyPDF2|PIL|numpy|fitz|pymupdf|multiprocessing|calculate_bounding_boxes"
+   for startup_args in "--version" "--help" "--badOption"
+   do
+      import_times="$($python_version -X importtime "$PROG_PATH" $startup_args \
+                      2>&1 >/dev/null | grep "^import time:")"
+      slow_imports="$(echo "$import_times" | grep -E "[ .]($slow_modules)(\.|$)")"
+      if [ -n "$slow_imports" ]; then
+         echo -e "$indentLevel${cErr}Slow modules imported for $startup_args:${cEnd}"
+         echo "$slow_imports"
+      else
+         echoInfo "No slow modules imported for $startup_args."
+      fi
+   done
+
+   # The '--checkPrevCropped' option only needs PyPDF2.
+   slow_modules="PIL|numpy|fitz|pymupdf|multiprocessing|calculate_bounding_boxes"
+   for file in regular_*
+   do
+      import_times="$($python_version -X importtime "$PROG_PATH" -cp "$file" \
+                      2>&1 >/dev/null | grep "^import time:")"
+      slow_imports="$(echo "$import_times" | grep -E "[ .]($slow_modules)(\.|$)")"
+      if [ -n "$slow_imports" ]; then
+         echo -e "$indentLevel${cErr}Slow modules imported for -cp:${cEnd}"
+         echo "$slow_imports"
+      else
+         echoInfo "No slow modules imported for -cp."
+      fi
+   done
+   echoThenRun bash -c "time $python_version \"$PROG_PATH\" --version"
+}
+
+
+function testProfileReport {
+   #   -prf FILEPATH, --profileReport FILEPATH
+   #                         Profile the stages of the crop and write a report in
+   #                         JSON format to the file.
+
+   echoInfo
+   echoInfo "Testing the profile report.  The JSON report should list the stages,"
+   echoInfo "the subprocesses run, and the analysis time of each page."
+   returnToContinue || return
+   for file in regular_*
+   do
+      echoThenRun $python_version "$PROG_PATH" $OPTS "$file" -prf -
+      break
+   done
+}
+
+
+function testHybridEngine {
+   #   -be ENGINE, --bboxEngine ENGINE
+   #                         The "hybrid" engine uses the vector engine for
+   #                         pages which are not scans.
+
+   echoInfo
+   echoInfo "Testing that the hybrid engine finds the bounding boxes of a regular"
+   echoInfo "file from the page contents, rather than rendering every page."
+   returnToContinue || return
+   for file in regular_*
+   do
+      hybrid_output="$($python_version "$PROG_PATH" $OPTS -v -be hybrid "$file" \
+                       -o hybrid_test_output.pdf 2>&1)"
+      rm -f hybrid_test_output.pdf
+      if echo "$hybrid_output" | grep -q -e "cannot extract" \
+            -e "Rendering \([0-9][0-9]*\) of the \1 pages with the raster engine"; then
+         echo -e "$indentLevel${cErr}The hybrid engine rendered every page of $file:${cEnd}"
+         echo "$hybrid_output" | grep -e "cannot extract" -e "raster engine"
+      else
+         echoInfo "The hybrid engine used the vector engine for $file."
+      fi
+      break
+   done
+}
+
+
 function testHelp {
    #   -h, --help            Show this help message and exit.
 
@@ -741,7 +907,7 @@ do
    echoInfo "#######################################################"
    returnToContinue || continue
 
-   for page_crop_info_program in pdftoppm ghostscript_bbox ghostscript_rendering
+   for page_crop_info_program in pdftoppm ghostscript_bbox ghostscript_rendering mupdf vector hybrid
    do
       indentLevel="   "
       echoInfo
@@ -765,6 +931,12 @@ do
    
    testSamePageSize
    testOutputFilename
+   testIncrementalWrite
+   testBatchMode
+   testServerMode
+   testStartupImports
+   testProfileReport
+   testHybridEngine
    testHelp
 done  
 indentLevel=""